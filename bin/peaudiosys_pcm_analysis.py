@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    Prewarms the on-disk analysis cache of the loudspeaker FIR .pcm files
+    (DRC headroom, XO latency, magnitude response), so that pe.audio.sys
+    does not need to analyze them when starting or when switching sets.
+
+    Usage:  peaudiosys_pcm_analysis.py  [ <loudspeaker> | --all ]
+
+            (default: the current loudspeaker, all its sample rate folders)
+
+    (i) Run it after updating your loudspeaker .pcm files.
+"""
+
+import sys
+import os
+
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+
+from    config  import  MAINFOLDER, LOUDSPEAKER
+from    fmt     import  Fmt
+import  pcm_analysis
+
+
+def lspk_folders(lspk_name):
+    """ The sample rate folders of a loudspeaker
+    """
+    lspk_dir = f'{MAINFOLDER}/loudspeakers/{lspk_name}'
+
+    return [ f'{lspk_dir}/{x}' for x in sorted( os.listdir(lspk_dir) )
+             if x.isdigit() and os.path.isdir(f'{lspk_dir}/{x}') ]
+
+
+if __name__ == "__main__":
+
+    lspks = [ LOUDSPEAKER ]
+
+    for opc in sys.argv[1:]:
+
+        if '-h' in opc:
+            print(__doc__)
+            sys.exit()
+
+        elif opc == '--all':
+            lspks = sorted( os.listdir(f'{MAINFOLDER}/loudspeakers') )
+
+        else:
+            lspks = [ opc ]
+
+    for lspk in lspks:
+
+        try:
+            folders = lspk_folders(lspk)
+        except Exception as e:
+            print( f'{Fmt.RED}{str(e)}{Fmt.END}' )
+            continue
+
+        for folder in folders:
+            print( f'{Fmt.BOLD}--- {folder}{Fmt.END}' )
+            pcm_analysis.folder_info(folder, verbose=True, workers=os.cpu_count())
+            print()
@@ -22,13 +22,16 @@
 
 """
 import sys
+import os
 import argparse
 import numpy as np
-import queue
 import threading
 # Thanks to https://python-sounddevice.readthedocs.io
 import sounddevice as sd
 
+sys.path.append( os.path.dirname( os.path.realpath(__file__) ) )
+from meter_core import BlockRing
+
 
 def int_or_str(text):
     """Helper function for argument parsing."""
@@ -63,6 +66,32 @@ def parse_cmdline():
     return args
 
 
+def measure(block, mode):
+    """ Compute the measured level of an audio block[frames, channels]
+        (i) no arrays are allocated
+    """
+    if mode == 'rms':
+        # Mean square of the block, channels combined
+        msq = np.vdot( block, block ) / len(block)
+        if msq:             # avoid log10(0)
+            M = 10 * np.log10(msq)
+        else:
+            M = -100.0
+
+    elif mode == 'peak':
+        M = max( block.max(), -block.min() )
+        if M:
+            M = 20 * np.log10(M)
+        else:
+            M = -100.0
+
+    else:
+        print('bad mode')
+        sys.exit()
+
+    return round(float(M), 1)
+
+
 class Meter(object):
     """
         Measures the signal level of an audio stream from a system sound device.
@@ -78,6 +107,8 @@ class Meter(object):
 
         .L              The measured level
 
+        .overruns       Audio blocks dropped because of a late processing
+
     """
 
 
@@ -86,6 +117,7 @@ class Meter(object):
         self.mode   = mode
         self.bar    = bar
         self.L      = -100.0
+        self.overruns = 0
 
 
     def start(self):
@@ -95,34 +127,7 @@ class Meter(object):
             """ The handler for input stream audio chunks """
             if status:
                 print( f'----- {status} -----' )
-            qIn.put( indata )
-
-
-        def measure(block, duration, mode):
-            """ Compute the measured level for each audio block"""
-            if mode == 'rms':
-                # Mean square calculation for audio blocks
-                msqL = np.sum( np.square( block[:,0] ) ) / (fs * dur)
-                msqR = np.sum( np.square( block[:,1] ) ) / (fs * dur)
-                # Combine 2 channels
-                if msqL or msqR:    # avoid log10(0+0)
-                    M = 20 * np.log10(msqL + msqR) / 2
-                else:
-                    M = -100.0
-
-            elif mode == 'peak':
-                ML, MR = np.max(block[:,0]), np.max(block[:,1])
-                M = max(ML, MR)
-                if M:
-                    M = 20 * np.log10(M)
-                else:
-                    M = -100.0
-
-            else:
-                print('bad mode')
-                sys.exit()
-
-            return round(M, 1)
+            ring.put( indata )
 
 
         def loop_forever():
@@ -136,9 +141,11 @@ class Meter(object):
                                   dither_off=True):
                 while True:
                     # Reading captured (b)locks:
-                    b = qIn.get()
+                    b = ring.get()
                     # Compute the measured level
-                    self.L = measure(block=b, duration=dur, mode=self.mode)
+                    self.L = measure(block=b, mode=self.mode)
+                    ring.release()
+                    self.overruns = ring.overruns
                     # Print a nice bar meter
                     if self.bar:
                         I = max(-60, int(self.L))
@@ -153,9 +160,6 @@ class Meter(object):
             print(h1)
             print(h2)
 
-        # Prepare an internal FIFO queue for the callback function
-        qIn    = queue.Queue()
-
         # Getting current Fs
         fs = sd.query_devices(self.device, 'input')['default_samplerate']
 
@@ -164,6 +168,9 @@ class Meter(object):
         # lenght in samples of the audio block
         bs  = int( fs * dur )
 
+        # A bounded ring buffer for the callback function (0.8 s)
+        ring = BlockRing( frames=bs, channels=2 )
+
         # Launch a thread that loops metering audio blocks
         jloop = threading.Thread( target=loop_forever, args=() )
         jloop.start()
@@ -17,8 +17,9 @@
 # along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
 
 """
-    Measures EBU R128 [M]omentary & [I]ntegrated loudness of
-    an audio stream from a system sound device.
+    Measures EBU R128 [M]omentary, [S]hort-term & [I]ntegrated loudness,
+    the loudness range and the sample and true peaks of an audio stream
+    from a system sound device.
 
     To view suported devices use '-l' option
 
@@ -27,12 +28,14 @@ import sys
 import os
 import argparse
 import numpy as np
-from scipy.signal import lfilter, lfilter_zi
-import queue
+from scipy.signal import firwin
 import threading
 # Thanks to https://python-sounddevice.readthedocs.io
 import sounddevice as sd
 
+sys.path.append( os.path.dirname( os.path.realpath(__file__) ) )
+from meter_core import BlockRing, SOSFilter
+
 
 def biquad(fs, f0, Q, ftype, dBgain=0.0):
     """
@@ -122,6 +125,297 @@ def biquad(fs, f0, Q, ftype, dBgain=0.0):
     return b, a
 
 
+# ITU-R BS.1770-4 / EBU R128 / EBU Tech 3342
+ABS_GATE        = -70.0     # LUFS
+REL_GATE        = -10.0     # LU, for the integrated loudness
+LRA_REL_GATE    = -20.0     # LU, for the loudness range
+# Loudness histograms range and resolution
+HIST_MIN        = ABS_GATE
+HIST_MAX        = +10.0
+HIST_STEP       = 0.1
+# True peak interpolation taps per oversampling phase
+TP_TAPS         = 12
+
+
+def lufs(energy):
+    """ From a K weighted mean square (channels summed) to LUFS
+    """
+    if energy > 0:
+        return -0.691 + 10 * np.log10(energy)
+    else:
+        return -100.0
+
+
+# The BS.1770 K weighting filter coefficients at 48 KHz
+K_PRE_48K   = ( [1.53512485958697, -2.69169618940638, 1.19839281085285],
+                [1.0,              -1.69065929318241, 0.73248077421585] )
+K_RLB_48K   = ( [1.0,              -2.0,              1.0             ],
+                [1.0,              -1.99004745483398, 0.99007225036621] )
+
+
+def k_weighting_sos(fs):
+    """ The BS.1770 K weighting filter as second order sections:
+        the pre-filter (high shelf) and the RLB high pass filter.
+
+        (i) The BS.1770 shelf is not the cookbook one (see biquad), so the
+            published 48 KHz coefficients are re-derived for other rates
+            from their analog prototypes, as pyloudnorm does.
+    """
+    if fs == 48000:
+        (b1, a1), (b2, a2) = K_PRE_48K, K_RLB_48K
+
+    else:
+        # pre-filter (high shelf)
+        G, Q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+        K  = np.tan( np.pi * fc / fs )
+        Vh = 10 ** (G / 20)
+        Vb = Vh ** 0.4996667741545416
+        a0 = 1 + K / Q + K * K
+        b1 = [ (Vh + Vb * K / Q + K * K) / a0,
+               2 * (K * K - Vh) / a0,
+               (Vh - Vb * K / Q + K * K) / a0 ]
+        a1 = [ 1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0 ]
+
+        # RLB (high pass)
+        Q, fc = 0.5003270373238773, 38.13547087602444
+        K  = np.tan( np.pi * fc / fs )
+        a0 = 1 + K / Q + K * K
+        b2 = [ 1.0, -2.0, 1.0 ]
+        a2 = [ 1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0 ]
+
+    return np.array( [ np.concatenate( (b1, a1) ),
+                       np.concatenate( (b2, a2) ) ] )
+
+
+class LoudnessHistogram(object):
+    """ A constant memory accumulator of gating blocks loudness, as fixed
+        HIST_STEP bins from ABS_GATE (absolutely gated blocks are dropped).
+        Each bin keeps the blocks count and their energy sum, so that
+        gated means are exact, only the gate edge is quantized.
+    """
+
+    def __init__(self):
+        self.nbins  = int( round( (HIST_MAX - HIST_MIN) / HIST_STEP ) )
+        self.counts = np.zeros( self.nbins, dtype=np.int64 )
+        self.energy = np.zeros( self.nbins )
+
+
+    def reset(self):
+        self.counts[:] = 0
+        self.energy[:] = 0.0
+
+
+    def add(self, energy):
+        L = lufs(energy)
+        if L < HIST_MIN:
+            return
+        i = min( int( (L - HIST_MIN) / HIST_STEP ), self.nbins - 1 )
+        self.counts[i] += 1
+        self.energy[i] += energy
+
+
+    def gate_bin(self, rel_gate):
+        """ The first bin above the relative gate, or None if no blocks
+        """
+        n = self.counts.sum()
+        if not n:
+            return None
+        gate = lufs( self.energy.sum() / n ) + rel_gate
+        return min( max( 0, int( np.ceil( (gate - HIST_MIN) / HIST_STEP ) ) ),
+                    self.nbins - 1 )
+
+
+    def gated_loudness(self, rel_gate=REL_GATE):
+        """ The loudness of the blocks above the relative gate (LUFS)
+        """
+        i0 = self.gate_bin(rel_gate)
+        if i0 is None:
+            return -100.0
+        n = self.counts[i0:].sum()
+        if not n:
+            return -100.0
+        return lufs( self.energy[i0:].sum() / n )
+
+
+    def loudness_range(self, rel_gate=LRA_REL_GATE):
+        """ The 10% to 95% percentiles distance of the blocks above
+            the relative gate (LU)
+        """
+        i0 = self.gate_bin(rel_gate)
+        if i0 is None:
+            return 0.0
+        cum = np.cumsum( self.counts[i0:] )
+        if not cum[-1]:
+            return 0.0
+        i10 = np.searchsorted( cum, 0.10 * cum[-1] )
+        i95 = np.searchsorted( cum, 0.95 * cum[-1] )
+        return (i95 - i10) * HIST_STEP
+
+
+class R128(object):
+    """
+        An EBU R128 loudness engine, vectorized per audio block.
+
+        .process(x)     Feeds an audio block x[frames, channels],
+                        of any length.
+
+        .reset()        Reset the integrated measurements and peaks
+
+        .M              Momentary loudness (400 ms), LUFS
+        .S              Short-term loudness (3 s), LUFS
+        .I              Integrated loudness (gated), LUFS
+        .LRA            Loudness range, LU
+        .peak           Sample peak, dBFS
+        .true_peak      True peak (oversampled), dBTP
+
+        Gating blocks are 400 ms windows every 100 ms (75% overlap),
+        integrated and LRA values come from constant memory histograms.
+
+        Blocks are processed in preallocated channel major work buffers,
+        K filtering in place, so no arrays are allocated per block.
+    """
+
+    def __init__(self, fs, channels=2):
+
+        self.fs         = fs
+        self.channels   = channels
+
+        # 100 ms sub-blocks to build the 400 ms and 3 s windows
+        self.step       = int( round(fs * 0.1) )
+
+        # K weighting with persistent state across blocks
+        self.kfilter    = SOSFilter( k_weighting_sos(fs), channels )
+
+        # Last 30 sub-blocks (3 s) energies (channels summed mean square)
+        self.sub        = [0.0] * 30
+        self.nsub       = 0
+        self.acc        = np.zeros( channels )
+        self.part       = np.zeros( channels )
+        self.acc_n      = 0
+
+        # Work buffers by block length, see _buffers()
+        self.bufs       = {}
+
+        self.hist_I     = LoudnessHistogram()
+        self.hist_S     = LoudnessHistogram()
+
+        # True peak oversampling (x4 at 44.1/48 KHz, x2 at 88.2/96 KHz)
+        self.os_factor  = max( 1, int(192000 // fs) )
+        if self.os_factor > 1:
+            ntaps = TP_TAPS * self.os_factor
+            self.tp_fir  = firwin( ntaps, 1.0 / self.os_factor ) * self.os_factor
+            self.tp_tail = np.zeros( (channels, TP_TAPS) )
+
+        self.M          = -100.0
+        self.S          = -100.0
+        self.reset()
+
+
+    def reset(self):
+        """ (i) The K filter state and the momentary window are kept """
+        self.hist_I.reset()
+        self.hist_S.reset()
+        self.I          = -100.0
+        self.LRA        = 0.0
+        self.peak       = -100.0
+        self.true_peak  = -100.0
+
+
+    def _buffers(self, n):
+        """ The work buffers for n frames blocks, allocated once
+            (i) the block length is constant when streaming
+        """
+        if n not in self.bufs:
+            if len(self.bufs) > 4:
+                self.bufs.clear()
+            ch = self.channels
+            self.bufs[n] = (    np.zeros( (ch, n) ),            # work
+                                np.zeros( (ch, TP_TAPS + n) ),  # tail + work
+                                np.zeros( (ch, n) ),            # phase acc
+                                np.zeros( (ch, n) )   )         # phase tmp
+        return self.bufs[n]
+
+
+    def _peaks(self, w, xx, acc, tmp):
+
+        peak = max( w.max(), -w.min() )
+        if peak > 0:
+            self.peak = max( self.peak, 20 * np.log10(peak) )
+
+        # Polyphase interpolation, each phase p being:
+        #   y[i] = sum( tp_fir[p + os * k] * x[i - k] ), k < TP_TAPS
+        if self.os_factor > 1:
+            n = w.shape[1]
+            np.copyto( xx[:, :TP_TAPS], self.tp_tail )
+            np.copyto( xx[:, TP_TAPS:], w )
+            for p in range(self.os_factor):
+                acc[:] = 0.0
+                for k in range(TP_TAPS):
+                    np.multiply( xx[:, TP_TAPS - k : TP_TAPS - k + n],
+                                 self.tp_fir[p + self.os_factor * k], out=tmp )
+                    np.add( acc, tmp, out=acc )
+                peak = max( peak, acc.max(), -acc.min() )
+            np.copyto( self.tp_tail, xx[:, n:] )
+
+        if peak > 0:
+            self.true_peak = max( self.true_peak, 20 * np.log10(peak) )
+
+
+    def _sub_block(self, energy):
+        """ Every 100 ms, updates the measurements
+        """
+        self.sub[ self.nsub % 30 ] = energy
+        self.nsub += 1
+
+        # Momentary: the last 4 sub-blocks (400 ms)
+        k = min(self.nsub, 4)
+        e_M = sum( self.sub[ (self.nsub - 1 - j) % 30 ] for j in range(k) ) / k
+        self.M = lufs(e_M)
+
+        if self.nsub >= 4:
+            self.hist_I.add(e_M)
+            self.I = self.hist_I.gated_loudness(REL_GATE)
+
+        # Short-term: the last 30 sub-blocks (3 s)
+        k = min(self.nsub, 30)
+        e_S = sum( self.sub[:k] ) / k
+        self.S = lufs(e_S)
+
+        if self.nsub >= 30:
+            self.hist_S.add(e_S)
+            self.LRA = round( self.hist_S.loudness_range(LRA_REL_GATE), 1 )
+
+
+    def process(self, x):
+
+        n = len(x)
+        if not n:
+            return
+
+        w, xx, acc, tmp = self._buffers(n)
+
+        # channel major float64 copy of the block
+        np.copyto( w, x.T )
+
+        self._peaks(w, xx, acc, tmp)
+
+        # K weighted squares, in place
+        self.kfilter(w)
+        np.multiply( w, w, out=w )
+
+        pos = 0
+        while pos < n:
+            m = min( self.step - self.acc_n, n - pos )
+            np.sum( w[:, pos : pos + m], axis=1, out=self.part )
+            np.add( self.acc, self.part, out=self.acc )
+            self.acc_n += m
+            pos        += m
+            if self.acc_n == self.step:
+                self._sub_block( self.acc.sum() / self.step )
+                self.acc[:] = 0.0
+                self.acc_n  = 0
+
+
 def parse_cmdline():
 
     def int_or_str(text):
@@ -152,7 +446,7 @@ def parse_cmdline():
 class LU_meter(object):
     """
         Measures EBU R128 [M]omentary & [I]ntegrated loudness of
-        an audio stream from a system sound device.
+        an audio stream from a system sound device (see R128).
 
 
         .start()        Start to measure
@@ -167,6 +461,16 @@ class LU_meter(object):
 
         .I              [I]ntegrated loudness measurement (cummulated)
 
+        .S              [S]hort-term loudness measurement
+
+        .LRA            Loudness range (LU)
+
+        .peak           Sample peak (dBFS)
+
+        .true_peak      True peak (dBTP)
+
+        .overruns       Audio blocks dropped because of a late processing
+
         .M_event        Event object to notify the user for changes in [M]
 
         .M_threshold    Threshold in dB to trigger M_event
@@ -199,6 +503,13 @@ class LU_meter(object):
         self.M = -100.0
         # Measured (I)ntegrated Loudness dBFS
         self.I = -100.0
+        # Measured (S)hort-term Loudness dBFS
+        self.S = -100.0
+        # Loudness range and peaks
+        self.LRA        = 0.0
+        self.peak       = -100.0
+        self.true_peak  = -100.0
+        self.overruns   = 0
 
 
     def reset(self):
@@ -210,8 +521,10 @@ class LU_meter(object):
 
 
         def display_header():
-            print(f'    -------- dBFS --------      --- dBLU @ -23dBFS ---')
-            print(f'    Momentary   Integrated      Momentary   Integrated')
+            print(f'    -------- dBFS --------      --- dBLU @ -23dBFS ---'
+                  f'      -- S --    LRA     TP')
+            print(f'    Momentary   Integrated      Momentary   Integrated'
+                  f'      (dBFS)    (LU)   (dBTP)')
 
 
         def display_measurements():
@@ -221,49 +534,23 @@ class LU_meter(object):
             M_LU = M_FS - -23.0        # from dBFS to dBLU ( 0 dBLU = -23dBFS )
             I_LU = I_FS - -23.0
             print( f'    {M_FS:6.1f}      {I_FS:6.1f}      '
-                   f'    {M_LU:6.1f}      {I_LU:6.1f}', end='\r' )
-
-
-        def get_coeffs(fs, f0, Q, ftype, dBgain=0.0):
-            """ this calculates coeffs and initial conditions
-                for signal.lfilter
-            """
-            b, a = biquad( fs, f0, Q, ftype, dBgain )
-            zi   = lfilter_zi(b, a)
-            return b, a, zi
-
-
-        def k_filter(x):
-            """ input:  stereo audio block: x[:, channel]
-                output: x K-filtered, 100Hz HPF + 1000Hz High Shelf +4dB
-            """
-            y = np.copy( x )
-            # coeffs includes 'b', 'a' and initial condition 'zi' for lfilter
-            # hpf_coeffs     -->  100Hz HPF
-            # hshelf_coeffs  -->  1000Hz High Shelf +4dB
-            for coeffs in (hpf_coeffs, hshelf_coeffs):
-                b, a, zi = coeffs
-                y[:, 0], _ = lfilter( b, a, x[:,0], zi = zi * x[:, 0][0] )
-                y[:, 1], _ = lfilter( b, a, x[:,1], zi = zi * x[:, 1][0] )
-            return y
+                   f'    {M_LU:6.1f}      {I_LU:6.1f}'
+                   f'      {self.S:6.1f}  {self.LRA:5.1f}  {self.true_peak:6.1f}',
+                   end='\r' )
 
 
         def callback(indata, frames, time, status):
             """ The handler for input stream audio chunks,
-                simply puts data into the input-queue
+                simply copies data into the ring buffer
             """
             if status:
                 print( f'----- {status} -----' )
-            qIn.put( indata )
+            ring.put( indata )
 
 
         def loop_forever():
             """ loop capturing stream and processing audio blocks """
 
-            # Initialize cummulative mean and gates
-            G1mean  = -100.0
-            G1      = 0
-            G2      = 0
             # Memorize last measurements used for evaluate if threshold exceeded
             M_last = -100.0
             I_last = -100.0
@@ -276,48 +563,29 @@ class LU_meter(object):
                                   dither_off=True):
                 while True:
 
-                    # Reading captured blocks of 100 ms from the input-queue
-                    b100 = qIn.get()
-
-                    # “K” weight filtering the 100ms chunks
-                    k100 = k_filter(b100)
-
-                    # Sliding the 400ms (w)indow and filling it with k100 chunks
-                    w400[ : bs * 3 ] = w400[ bs : ]
-                    w400[ bs * 3 : ] = k100
-
-                    # Mean square calculation for 400ms audio blocks
-                    msqL = np.sum( np.square( w400[:,0] ) ) / (fs * 0.4)
-                    msqR = np.sum( np.square( w400[:,1] ) ) / (fs * 0.4)
-
-                    # Stereo (M)omentary Loudness (divided by 2 channels)
-                    if msqL or msqR:    # avoid log10(0)
-                        self.M = -0.691 + 20 * np.log10(msqL + msqR) / 2
-                    else:
-                        self.M = -100.0
-
-                    # Dual gatting to compute (I)ntegrated Loudness.
-                    if self.M > -70.0:
-                        # cumulative moving average
-                        G1 += 1
-                        G1mean = G1mean + (self.M - G1mean) / G1
-
-                    if self.M > (G1mean - 10.0):
-                        G2 += 1
-                        self.I = G1mean + (self.M - G1mean) / G2
-
-                    # End of measurements, let's manage events:
+                    # Reading captured blocks of 100 ms from the ring buffer
+                    b100 = ring.get()
 
                     # Reseting on the fly.
                     if self.meas_reset:
                         print('(lu_meter) restarting measurement')
-                        self.M  = -100.0
-                        self.I  = -100.0
-                        G1mean  = -100.0
-                        G1 = 0
-                        G2 = 0
+                        engine.reset()
                         self.meas_reset = False  # releasing the flag
 
+                    # R128 measurements
+                    engine.process(b100)
+                    ring.release()
+
+                    self.M          = engine.M
+                    self.S          = engine.S
+                    self.I          = engine.I
+                    self.LRA        = engine.LRA
+                    self.peak       = engine.peak
+                    self.true_peak  = engine.true_peak
+                    self.overruns   = ring.overruns
+
+                    # End of measurements, let's manage events:
+
                     # Prints to console
                     if self.display:
                         display_measurements()
@@ -331,21 +599,17 @@ class LU_meter(object):
                         I_last = self.I
 
 
-        # Prepare an internal FIFO queue for the callback process
-        qIn = queue.Queue()
-
         # Getting current Fs from the PortAudio device
         fs = sd.query_devices(self.device, 'input')['default_samplerate']
 
         # Block size in samples for 100 msec of audio at Fs
         bs  = int( fs * 0.100 )
 
-        # Initialize a 400ms stereo block window
-        w400 = np.zeros( (4 * bs, 2) , dtype='float32')
+        # A bounded ring buffer for the callback process (0.8 s)
+        ring = BlockRing( frames=bs, channels=2 )
 
-        # Prepare the needed coeffs for 'K' filtering audio blocks
-        hpf_coeffs =    get_coeffs(fs, 100,  .707, 'hpf'            )
-        hshelf_coeffs = get_coeffs(fs, 1000, .707, 'highshelf', 4.0 )
+        # The R128 engine (K filtering, gating, short-term, LRA and peaks)
+        engine = R128( fs=int(fs), channels=2 )
 
         # Prepare display header
         if self.display:
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+    A benchmark of the metering path, without a sound device:
+
+    100 ms stereo noise blocks go through the BlockRing to the
+    level_meter measurement and to the loudness_meter R128 engine.
+
+    Prints the CPU usage per channel (% of one core) at 44.1, 96 and 192 KHz.
+
+    Usage:  meter_bench.py  [seconds]   (audio seconds per test, default 60)
+
+            meter_bench.py  --check     checks the R128 engine against
+                                        the EBU Tech 3341 test case 1
+"""
+import sys
+from time import process_time
+import numpy as np
+
+from meter_core     import BlockRing, INPLACE
+from level_meter    import measure
+from loudness_meter import R128
+
+
+RATES       = (44100, 96000, 192000)
+CHANNELS    = 2
+
+
+def cpu_per_channel(func, ring, block, seconds):
+    """ CPU % of one core per channel, for func processing
+        'seconds' of audio blocks through the ring
+    """
+    nblocks = int( seconds / 0.1 )
+
+    t0 = process_time()
+    for _ in range(nblocks):
+        ring.put(block)
+        func( ring.get() )
+        ring.release()
+    cpu = process_time() - t0
+
+    return 100.0 * cpu / (nblocks * 0.1) / CHANNELS
+
+
+def check_r128():
+    """ EBU Tech 3341 case 1: a -23 dBFS 1 KHz stereo sine, 20 s,
+        must read -23.0 +/-0.1 LUFS (M, S and I)
+    """
+    for fs in (44100, 48000, 96000):
+
+        engine = R128( fs=fs, channels=CHANNELS )
+
+        t = np.arange( 20 * fs ) / fs
+        x = 10 ** (-23 / 20) * np.sin( 2 * np.pi * 1000 * t )
+        x = np.tile( x[:, None], (1, CHANNELS) ).astype(np.float32)
+
+        bs = int( fs * 0.1 )
+        for i in range(0, len(x), bs):
+            engine.process( x[i : i + bs] )
+
+        for name in ('M', 'S', 'I'):
+            L = getattr(engine, name)
+            assert abs(L + 23.0) <= 0.1, f'{fs} Hz {name}: {L:.2f} LUFS'
+
+        print( f'    {fs:7d}  M {engine.M:.2f}  S {engine.S:.2f}  '
+               f'I {engine.I:.2f} LUFS  OK' )
+
+
+def bench(fs, seconds):
+
+    bs    = int( fs * 0.1 )
+    ring  = BlockRing( frames=bs, channels=CHANNELS )
+
+    # -20 dBFS white noise
+    rng   = np.random.default_rng(0)
+    block = ( 0.1 * rng.standard_normal( (bs, CHANNELS) ) ).astype(np.float32)
+
+    engine = R128( fs=fs, channels=CHANNELS )
+
+    result = {
+        'level rms':    cpu_per_channel( lambda b: measure(b, 'rms'),
+                                         ring, block, seconds ),
+        'level peak':   cpu_per_channel( lambda b: measure(b, 'peak'),
+                                         ring, block, seconds ),
+        'R128':         cpu_per_channel( engine.process,
+                                         ring, block, seconds )
+        }
+
+    return result, ring.overruns
+
+
+if __name__ == '__main__':
+
+    seconds = 60.0
+
+    if sys.argv[1:]:
+        if '-h' in sys.argv[1]:
+            print(__doc__)
+            sys.exit()
+        if '--check' in sys.argv[1]:
+            print( '(meter_bench) EBU Tech 3341 case 1, -23 dBFS 1 KHz sine' )
+            check_r128()
+            sys.exit()
+        seconds = float( sys.argv[1] )
+
+    print( f'(meter_bench) {seconds} s of audio per test, '
+           f'in place K filtering: {INPLACE}' )
+    print( f'    {"Fs":>7}  {"level rms":>10}  {"level peak":>10}  '
+           f'{"R128":>10}   (CPU % per channel)' )
+
+    for fs in RATES:
+        result, overruns = bench(fs, seconds)
+        print( f'    {fs:7d}  {result["level rms"]:10.3f}  '
+               f'{result["level peak"]:10.3f}  {result["R128"]:10.3f}'
+               f'{"   overruns: " + str(overruns) if overruns else ""}' )
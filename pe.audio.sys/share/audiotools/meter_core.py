@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'audiotools'
+#
+# 'audiotools' is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# 'audiotools' is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with 'pe.audio.sys'.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+    The metering core shared by level_meter.py and loudness_meter.py
+
+    BlockRing   a preallocated ring of audio blocks, from the sound device
+                callback to the metering thread
+
+    SOSFilter   second order sections filtering in place, keeping
+                the filter state across blocks
+"""
+import threading
+import numpy as np
+from scipy.signal import sosfilt
+
+try:
+    # (i) The scipy sosfilt core, it filters in place. Being a private
+    #     scipy API, it is checked below and sosfilt is used if not usable.
+    from scipy.signal._sosfilt import _sosfilt
+except ImportError:
+    _sosfilt = None
+
+
+def _sosfilt_inplace_ok():
+    """ Checks that the private scipy _sosfilt works as expected """
+    if not _sosfilt:
+        return False
+    try:
+        x = np.array( [[1.0, 0.0, 0.0]] )
+        _sosfilt( np.array( [[0.5, 0.0, 0.0, 1.0, 0.0, 0.0]] ), x,
+                  np.zeros( (1, 1, 2) ) )
+        return x[0, 0] == 0.5
+    except Exception:
+        return False
+
+
+INPLACE = _sosfilt_inplace_ok()
+
+
+class BlockRing(object):
+    """
+        A fixed size ring of audio blocks, without queues neither allocations:
+        the sound device callback copies its buffer into a free slot, the
+        metering thread processes the slots in order.
+
+        If the metering thread is late and the ring is full, the incoming
+        block is dropped and counted as an overrun, so memory is bounded.
+
+        .put(indata)    (callback) copies a block, False if dropped
+
+        .get(timeout)   (thread) the oldest block, a view to be used
+                        until .release(), or None if timed out
+
+        .release()      (thread) frees the block got
+
+        .overruns       dropped blocks counter
+    """
+
+    def __init__(self, frames, channels, nslots=8, dtype=np.float32):
+        self.frames     = frames
+        self.nslots     = nslots
+        self.blocks     = np.zeros( (nslots, frames, channels), dtype=dtype )
+        self.lengths    = [0] * nslots
+        # (i) only the callback writes 'wr', only the thread writes 'rd'
+        self.wr         = 0
+        self.rd         = 0
+        self.overruns   = 0
+        self.ready      = threading.Event()
+
+
+    def put(self, indata):
+
+        if self.wr - self.rd >= self.nslots:
+            self.overruns += 1
+            return False
+
+        i = self.wr % self.nslots
+        n = min( len(indata), self.frames )
+        np.copyto( self.blocks[i, :n], indata[:n] )
+        self.lengths[i] = n
+
+        self.wr += 1
+        self.ready.set()
+        return True
+
+
+    def get(self, timeout=None):
+
+        while self.rd == self.wr:
+            self.ready.clear()
+            # a block could arrive just before clearing
+            if self.rd != self.wr:
+                break
+            if not self.ready.wait(timeout):
+                return None
+
+        i = self.rd % self.nslots
+        return self.blocks[i, :self.lengths[i]]
+
+
+    def release(self):
+        self.rd += 1
+
+
+    def pending(self):
+        return self.wr - self.rd
+
+
+class SOSFilter(object):
+    """
+        A second order sections filter, keeping its state across blocks.
+
+        Calling it filters in place a channel major block x[channels, frames]
+        (float64, C-contiguous).
+    """
+
+    def __init__(self, sos, channels):
+        self.sos = np.ascontiguousarray( sos, dtype=np.float64 )
+        # the _sosfilt state layout
+        self.zi  = np.zeros( (channels, self.sos.shape[0], 2) )
+
+
+    def reset(self):
+        self.zi[:] = 0.0
+
+
+    def __call__(self, x):
+
+        if INPLACE:
+            _sosfilt(self.sos, x, self.zi)
+
+        else:
+            y, zf = sosfilt( self.sos, x, axis=-1,
+                             zi=self.zi.transpose(1, 0, 2) )
+            np.copyto( x, y )
+            np.copyto( self.zi, zf.transpose(1, 0, 2) )
@@ -5,12 +5,11 @@
 # 'pe.audio.sys', a PC based personal audio system.
 
 import  numpy as np
-from    scipy import signal
 import  os
 import  sys
-from    subprocess  import Popen
-from    time        import sleep
+from    time        import sleep, time
 from    socket      import socket
+import  threading
 
 from    config      import  CONFIG, UHOME, LSPK_FOLDER, EQ_CURVES, \
                             BFCFG_PATH, LOG_FOLDER
@@ -19,12 +18,13 @@ from    miscel      import  read_bf_config_fs, read_bf_config_port, Fmt, \
                             process_is_running, send_cmd, calc_gain
 
 import  jack_mod as jack
+import  pcm_analysis
+import  proc_registry
 
 
 if CONFIG["web_config"]["show_graphs"]:
     sys.path.append ( os.path.dirname(__file__) )
     from   brutefir_eq2png import do_graph as bf_eq2png_do_graph
-    import threading
 
 
 BFLOGPATH = f'{LOG_FOLDER}/brutefir.log'
@@ -32,6 +32,21 @@ BFLOGPATH = f'{LOG_FOLDER}/brutefir.log'
 # Global to avoid dumping EQ magnitude graph to a PNG file if not changed
 last_eq_mag = np.zeros( EQ_CURVES["freqs"].shape[0] )
 
+# 'freq/value' pairs template for the 'lmc eq' commands
+EQ_PAIRS_FMT = ', '.join( [ f'{freq}/%.3f' for freq in EQ_CURVES["freqs"] ] )
+
+# The parsed brutefir_config model, see get_config()
+BF_CONFIG       = {}
+BF_CONFIG_STAMP = None
+BF_CONFIG_LOCK  = threading.Lock()
+
+# Time to audio metrics of the Brutefir restarts, see restart_and_reconnect()
+RESTART_STATS   = { 'count': 0, 'last': {}, 'avg_ms': 0.0, 'max_ms': 0.0 }
+
+# The running filters coeffs and outputs while in hot standby, see standby()
+#   { filter_name: {'coeff': coeff, 'outputs': [(output, atten, mult), ...]} }
+STANDBY_FILTERS = {}
+
 
 def readPCM(fname, dtype='float32'):
     """ lee un archivo pcm float32
@@ -40,8 +55,109 @@ def readPCM(fname, dtype='float32'):
     return np.memmap(fname, dtype=dtype, mode='r')
 
 
-def cli(cmd):
-    """ A socket client that queries commands to Brutefir
+class CliSession:
+    """ A persistent Brutefir CLI session.
+
+        Commands are pipelined one per line in a single write, then
+        Brutefir answers each line followed by its '> ' prompt.
+
+        The connection is released after some idle time, so that other
+        clients (e.g. the peak monitor) can talk to Brutefir. A single
+        reaper thread does it, never while a query is in progress.
+    """
+
+    PROMPT = b'> '
+
+    def __init__(self, port, timeout=1, idle=0.5):
+        self.port       = port
+        self.timeout    = timeout
+        self.idle       = idle
+        self.sock       = None
+        self.last       = 0.0
+        self.opened     = threading.Event()
+        self.lock       = threading.Lock()
+
+        threading.Thread( target=self._reaper, daemon=True ).start()
+
+
+    def _reaper(self):
+        """ Closes the connection once idle """
+        while True:
+
+            self.opened.wait()
+
+            with self.lock:
+                wait = self.last + self.idle - time()
+                if self.sock and wait <= 0:
+                    self._close()
+                if not self.sock:
+                    self.opened.clear()
+                    continue
+
+            sleep(wait)
+
+
+    def _connect(self):
+        self.sock = socket()
+        self.sock.settimeout(self.timeout)
+        self.sock.connect( ('localhost', self.port) )
+        # Brutefir welcome message
+        self._read_answers(1)
+
+
+    def _close(self):
+        if self.sock:
+            try:
+                self.sock.send(b'quit\n')
+            except:
+                pass
+            self.sock.close()
+            self.sock = None
+
+
+    def _read_answers(self, n):
+        ans = b''
+        while ans.count(self.PROMPT) < n:
+            tmp = self.sock.recv(4096)
+            if not tmp:
+                raise ConnectionError('Brutefir closed the connection')
+            ans += tmp
+        return ans.decode().split( self.PROMPT.decode() )[:n]
+
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+
+    def query(self, cmds):
+        """ Sends a list of commands in a single round trip,
+            returns the list of answers.
+            (i) It reconnects once if Brutefir was restarted, e.g. by powersave.
+        """
+        with self.lock:
+
+            for attempt in (1, 2):
+                try:
+                    if not self.sock:
+                        self._connect()
+                    self.sock.sendall( ''.join( f'{c}\n' for c in cmds ).encode() )
+                    answers = self._read_answers( len(cmds) )
+                    break
+                except Exception as e:
+                    self._close()
+                    if attempt == 2:
+                        raise e
+
+            self.last = time()
+            self.opened.set()
+
+        return answers
+
+
+def cli_oneshot(cmd):
+    """ A socket client that queries commands to Brutefir,
+        by using a new connection.
     """
     # using 'with' will disconnect the socket when done
     ans = ''
@@ -61,6 +177,39 @@ def cli(cmd):
     return ans
 
 
+def cli(cmd):
+    """ A socket client that queries commands to Brutefir.
+        Semicolon separated commands are pipelined through the CLI session.
+    """
+    cmds = [ c.strip() for c in cmd.split(';') if c.strip() ]
+
+    if not cmds:
+        return ''
+
+    try:
+        return ''.join( CLI_SESSION.query(cmds) )
+
+    # Fallback to the classic connection
+    except:
+        return cli_oneshot(cmd)
+
+
+def coeffs_cli(cmd):
+    """ Sends 'cfc' commands. If in standby, they are kept to be
+        applied on wake up, so that Brutefir remains not convolving.
+    """
+    if not STANDBY_FILTERS:
+        return cli(cmd)
+
+    for item in [ x.strip() for x in cmd.split(';') if x.strip() ]:
+        _, fname, coeff = item.split(maxsplit=2)
+        fname = fname.replace('"', '')
+        if fname in STANDBY_FILTERS:
+            STANDBY_FILTERS[fname]['coeff'] = coeff
+
+    return ''
+
+
 def set_subsonic(mode):
     """ Subsonic filter is applied into the 'level' filtering stage.
         Coefficients must be named: "subsonic.mp" and/or "subsonic.lp"
@@ -75,7 +224,7 @@ def set_subsonic(mode):
     else:
         cmd = 'cfc "f.lev.L" -1; cfc "f.lev.R" -1;'
 
-    result = cli(cmd)
+    result = coeffs_cli(cmd)
 
     if "There is no coefficient set" in result:
         return 'subsonic coeff not available'
@@ -84,7 +233,15 @@ def set_subsonic(mode):
 
 
 def set_gains( state, nolevel=False, dBextra=0 ):
-    """ - Adjust Brutefir gain at filtering f.lev.xx stages as per the
+    """ Adjust Brutefir gain, see gains_cmd()
+    """
+    cli( gains_cmd(state, nolevel, dBextra) )
+
+
+def gains_cmd( state, nolevel=False, dBextra=0 ):
+    """ Returns the Brutefir commands to:
+
+        - Adjust Brutefir gain at filtering f.lev.xx stages as per the
           provided state values and configured reference levels.
         - Routes channels to listening modes 'mid' (mono) or 'side' (L-R).
         - Manages the 'solo' feature.
@@ -162,13 +319,38 @@ def set_gains( state, nolevel=False, dBextra=0 ):
     Lcmd = f'cfia "f.lev.L" "in.L" m{LL} ; cfia "f.lev.L" "in.R" m{LR}'
     Rcmd = f'cfia "f.lev.R" "in.L" m{RL} ; cfia "f.lev.R" "in.R" m{RR}'
 
-    cli( f'{Lcmd}; {Rcmd}' )
+    return f'{Lcmd}; {Rcmd}'
 
 
 def set_eq( eq_mag, eq_pha ):
     """ Adjust the Brutefir EQ module,
         also will dump an EQ graph png file
     """
+    cli( eq_cmd(eq_mag, eq_pha) )
+    dump_eq_graph(eq_mag)
+
+
+def set_gains_and_eq( state, eq_mag, eq_pha, nolevel=False, dBextra=0 ):
+    """ Adjust Brutefir gains and EQ in a single CLI round trip,
+        see set_gains() and set_eq()
+    """
+    cli( f'{gains_cmd(state, nolevel, dBextra)}; {eq_cmd(eq_mag, eq_pha)}' )
+    dump_eq_graph(eq_mag)
+
+
+def eq_cmd( eq_mag, eq_pha ):
+    """ Returns the Brutefir commands to adjust the EQ module
+    """
+    # A single formatting pass over the whole curves
+    mag_str = EQ_PAIRS_FMT % tuple( eq_mag.tolist() )
+    pha_str = EQ_PAIRS_FMT % tuple( eq_pha.tolist() )
+
+    return f'lmc eq "c.eq" mag {mag_str}; lmc eq "c.eq" phase {pha_str}'
+
+
+def dump_eq_graph( eq_mag ):
+    """ Dumping the EQ graph to a png file if curves have changed
+    """
 
     def save_png():
 
@@ -192,22 +374,7 @@ def set_eq( eq_mag, eq_pha ):
     global last_eq_mag
 
     freqs = EQ_CURVES["freqs"]
-    mag_pairs = []
-    pha_pairs = []
-
-    i = 0
-    for freq in freqs:
-        mag_pairs.append( str(freq) + '/' + str(round(eq_mag[i], 3)) )
-        pha_pairs.append( str(freq) + '/' + str(round(eq_pha[i], 3)) )
-        i += 1
-
-    mag_str = ', '.join(mag_pairs)
-    pha_str = ', '.join(pha_pairs)
-
-    cli('lmc eq "c.eq" mag '   + mag_str)
-    cli('lmc eq "c.eq" phase ' + pha_str)
 
-    # Dumping the EQ graph to a png file if curves have changed
     if not (last_eq_mag == eq_mag).all():
         if CONFIG["web_config"]["show_graphs"]:
             save_png()
@@ -217,26 +384,7 @@ def set_eq( eq_mag, eq_pha ):
 def read_brutefir_config_bands():
     """ Just read the bands defined within the "eq" section in brutefir_config
     """
-    bf_cfg = f'{LSPK_FOLDER}/brutefir_config'
-    with open( bf_cfg, 'r') as f:
-        lines = f.readlines()
-
-    freq = ''
-    in_bands = False
-    for line in lines:
-        line = line.strip()
-        if 'bands:' in line:
-            in_bands = True
-            line = line.split('bands:')[-1]
-        if in_bands:
-            freq += line.replace(';', '').replace('}','').strip()
-            if ';' in line:
-                break
-
-    freq = freq.split(',')
-    freq = np.array(freq).astype(float)
-
-    return freq
+    return np.array( get_config()['eq_bands'] ).astype(float)
 
 
 def read_eq():
@@ -273,7 +421,7 @@ def read_eq():
 
 def get_drc_headroom(drcID):
     """ Finds out the pcm impulse max gain and its coeff attenuation.
-        This need some computing time but it is called only when applying a drc_set.
+        (i) The pcm analysis is cached on disk, see pcm_analysis.py
     """
 
     # Early return if drc 'none'
@@ -281,8 +429,8 @@ def get_drc_headroom(drcID):
         return 0.0
 
     # A real drc pcm impulse
-    coeffs = get_config()["coeffs"]
-    drcs = [ x for x in coeffs if ( x["name"][:4]=='drc.' and x["name"][6:]==drcID ) ]
+    coeffs = get_config()["coeffs_by_name"]
+    drcs = [ x for n, x in coeffs.items() if ( n[:4]=='drc.' and n[6:]==drcID ) ]
 
     headrooms = []
 
@@ -295,12 +443,10 @@ def get_drc_headroom(drcID):
             atten = 0.0
             print(f'(bf.get_drc_headroom) ERROR: {str(e)}')
 
-        # Reading pcm impulse file max gain
+        # The pcm impulse file max gain
         try:
-            imp = readPCM( f'{LSPK_FOLDER}/{drc["pcm"]}')
-            _, h = signal.freqz(imp, worN=512, whole=False)
-            magdB = 20 * np.log10(abs(h))
-            magdB_max = round(np.max(magdB), 1)
+            magdB_max = pcm_analysis.pcm_info( f'{LSPK_FOLDER}/{drc["pcm"]}' ) \
+                        ['max_gain_dB']
         except Exception as e:
             magdB_max = 0.0
             print(f'(bf.get_drc_headroom) ERROR: {str(e)}')
@@ -328,7 +474,7 @@ def set_drc( drcID ):
         cmd = ( f'cfc "f.drc.L" "drc.L.{drcID}";'
                 f'cfc "f.drc.R" "drc.R.{drcID}";' )
 
-    cli( cmd )
+    coeffs_cli( cmd )
 
 
 def set_xo( ways, xo_coeffs, xoID ):
@@ -371,12 +517,26 @@ def set_xo( ways, xo_coeffs, xoID ):
         cmd += f'cfc "{way}" "{BMcoeff}"; '
 
     #print (cmd)
-    cli( cmd )
+    coeffs_cli( cmd )
+
+
+def _config_stamp():
+    """ The brutefir_config and .brutefir_defaults modification times
+    """
+    stamp = []
+
+    for path in (BFCFG_PATH, f'{UHOME}/.brutefir_defaults'):
+        try:
+            stamp.append( (path, os.path.getmtime(path)) )
+        except OSError:
+            stamp.append( (path, None) )
+
+    return tuple(stamp)
 
 
 def get_config():
     """
-        Read brutefir_config, returns a dictionary:
+        The parsed brutefir_config, a dictionary:
 
             'lspk_ways'
             'outputsMap'
@@ -388,6 +548,34 @@ def get_config():
             'dither'
             'delays'
             'maxdelay'
+
+        and some indexes:
+
+            'coeffs_by_name'    { coeff_name: coeff }
+            'filters_by_way'    { way: [filters] }, e.g. 'lo': [f.lo.L, f.lo.R]
+            'outputs'           { index: {'name':, 'delay':} }
+            'eq_bands'          [ eq band freqs ]
+
+        It is parsed once then shared, and parsed again only if the file
+        has been modified.
+
+        (!) Do not modify the returned dictionary.
+    """
+    global BF_CONFIG, BF_CONFIG_STAMP
+
+    with BF_CONFIG_LOCK:
+
+        stamp = _config_stamp()
+
+        if stamp != BF_CONFIG_STAMP:
+            BF_CONFIG       = _parse_config()
+            BF_CONFIG_STAMP = stamp
+
+        return BF_CONFIG
+
+
+def _parse_config():
+    """ Read brutefir_config, returns a dictionary as per get_config()
     """
 
     def read_value(line):
@@ -415,7 +603,10 @@ def get_config():
 
     # Reading brutefir_config
     with open(BFCFG_PATH, 'r') as f:
-        lineas = f.readlines()
+        bfconfig = f.read()
+
+    lineas = bfconfig.split('\n')
+    lineas = [ x + '\n' for x in lineas ]
 
     # Loops reading lines from brutefir_config (skip lines commented out)
     for linea in [x for x in lineas if (x.strip() and x.strip()[0] != '#') ]:
@@ -515,6 +706,15 @@ def get_config():
             if 'float_bits' in linea:
                 float_bits = read_value(linea) + ' (DEFAULT)'
 
+    # Indexes
+    coeffs_by_name = { c['name']: c for c in coeffs }
+
+    filters_by_way = {}
+    for flt in filters_at_start:
+        if flt['name'] in lspk_ways:
+            way = flt['name'].split('.')[1]
+            filters_by_way.setdefault(way, []).append(flt)
+
     # End.
     return      {
                 'lspk_ways'         : lspk_ways,
@@ -527,16 +727,41 @@ def get_config():
                 'dither'            : dither,
                 'delays'            : delays,
                 'maxdelay'          : maxdelay,
+                'coeffs_by_name'    : coeffs_by_name,
+                'filters_by_way'    : filters_by_way,
+                'outputs'           : _parse_outputs( bfconfig.split('\n') ),
+                'eq_bands'          : _parse_eq_bands( bfconfig.split('\n') )
                 }
 
 
+def _parse_eq_bands(lines):
+    """ The bands defined within the "eq" section in brutefir_config
+    """
+    freq = ''
+    in_bands = False
+    for line in lines:
+        line = line.strip()
+        if 'bands:' in line:
+            in_bands = True
+            line = line.split('bands:')[-1]
+        if in_bands:
+            freq += line.replace(';', '').replace('}','').strip()
+            if ';' in line:
+                break
+
+    return [ float(x) for x in freq.split(',') if x.strip() ]
+
+
 def get_config_outputs():
-    """ Read outputs from 'brutefir_config' file, then gives a dictionary.
+    """ Outputs from 'brutefir_config' file, a dictionary.
     """
-    outputs = {}
+    return get_config()['outputs']
 
-    with open(BFCFG_PATH, 'r') as f:
-        bfconfig = f.read().split('\n')
+
+def _parse_outputs(bfconfig):
+    """ Read outputs from 'brutefir_config' lines, then gives a dictionary.
+    """
+    outputs = {}
 
     output_section = False
 
@@ -596,84 +821,100 @@ def get_in_connections():
         return ['pre_in_loop:output_1', 'pre_in_loop:output_2']
 
 
+def _outputs_are_bonded():
+    """ Brutefir :out_X ports are available and autoconnected to system ports
+    """
+    bf_out_ports = jack.get_ports('brutefir', is_output=True)
+    bf_out_ports = [ p for p in bf_out_ports if not 'void' in p.name]
+
+    if len(bf_out_ports) < 2:
+        return False
+
+    n = 0
+    for p in bf_out_ports:
+        n += len( jack.get_all_connections(p) )
+
+    return n == len(bf_out_ports)
+
+
+def _inputs_are_available():
+    return len( jack.get_ports('brutefir', is_input=True) ) >= 2
+
+
+def _account_restart(metrics):
+    """ Updates RESTART_STATS with the metrics of the last restart
+    """
+    st = RESTART_STATS
+    ms = metrics['audio_ms']
+
+    st['avg_ms']    = round( (st['avg_ms'] * st['count'] + ms) / (st['count'] + 1), 1 )
+    st['count']     += 1
+    st['max_ms']    = max(st['max_ms'], ms)
+    st['last']      = metrics
+
+
+def get_restart_stats():
+    """ Time to audio metrics of the Brutefir restarts (dictionary)
+    """
+    return RESTART_STATS
+
+
 def restart_and_reconnect(bf_sources=[], delay=0.0):
     """ Restarts Brutefir as external process (Popen),
         then check Brutefir spawn connections to system ports,
         then reconnects Brutefir inputs.
         (i) Notice that Brutefir inputs can have sources
             other than 'pre_in_loop:...'
+
+        JACK port registration and connection callbacks drive the waits,
+        so audio is resumed as soon as the ports are ready.
     """
     warnings=''
 
+    def elapsed_ms():
+        return round( (time() - tini) * 1e3, 1 )
+
+    tini = time()
+
     # Restart Brutefir (external process)
     os.chdir(LSPK_FOLDER)
     with open(BFLOGPATH, 'w') as f:
-        Popen(['brutefir', 'brutefir_config'], stdout=f, stderr=f)
+        proc_registry.spawn(['brutefir', 'brutefir_config'], stdout=f, stderr=f)
     os.chdir(UHOME)
-    sleep(.5)  # wait a bit for Brutefir to be running
 
     # Wait for Brutefir to autoconnect its :out_X ports to system: ports
     # (this can take a while in some slow machines as Raspberry Pi)
-    tries = 240     # ~ 60 sec
-    while tries:
-
-        # Showing progress every 3 sec
-        if tries % 12 == 0:
-            print(  f'{Fmt.BLUE}(brutefir_mod) waiting for Brutefir ports '
-                    f'{"." * int((240 - tries) / 12)}{Fmt.END}')
-
-        # Getting the bf out ports list
-        bf_out_ports = jack.get_ports('brutefir', is_output=True)
-        bf_out_ports = [ p for p in bf_out_ports if not 'void' in p.name]
-
-        # Ensuring that ports are available
-        if len(bf_out_ports) < 2:
-            sleep(.25)
-            tries -= 1
-            continue
-
-        # Counting if all bf_out_ports are properly bonded to system ports
-        n = 0
-        for p in bf_out_ports:
-            conns = jack.get_all_connections(p)
-            n += len(conns)
-        if n == len(bf_out_ports):
-            # We are done ;-)
-            break
-
-        tries -= 1
-        sleep(.25)
-
-    if not tries:
-        warnings += ' PROBLEM RUNNING BRUTEFIR :-('
-    else:
+    print(  f'{Fmt.BLUE}(brutefir_mod) waiting for Brutefir ports ...{Fmt.END}')
+    if jack.wait_for(_outputs_are_bonded, timeout=60):
         print(  f'{Fmt.BLUE}(brutefir_mod) Brutefir ports are alive.{Fmt.END}')
+    else:
+        warnings += ' PROBLEM RUNNING BRUTEFIR :-('
+    outputs_ms = elapsed_ms()
 
     # Wait for brutefir input ports to be available
-    tries = 100      # ~ 10 sec
-    while tries:
-        bf_in_ports = jack.get_ports('brutefir', is_input=True)
-        if len(bf_in_ports) >= 2:
-            break
-        else:
-            tries -= 1
-            sleep(.1)
-    if not tries:
+    if not jack.wait_for(_inputs_are_available, timeout=10):
         warnings += ' Brutefir ERROR getting jack ports available.'
-
+    bf_in_ports = jack.get_ports('brutefir', is_input=True)
+    inputs_ms = elapsed_ms()
 
     # Settigs outputs delays as required
     add_delay(delay)
 
-    # A safe wait to avoid early connections failures
-    sleep(.2)
-
     # Restore input connections
+    # (i) jack.connect retries by itself in case of early failures
     for a, b in zip(bf_sources, bf_in_ports):
         res = jack.connect(a, b)
         if res != 'done':
             warnings += f' {res}'
 
+    metrics = { 'outputs_ms':   outputs_ms,
+                'inputs_ms':    inputs_ms,
+                'audio_ms':     elapsed_ms(),
+                'ok':           not warnings }
+    _account_restart(metrics)
+    print(  f'{Fmt.BLUE}(brutefir_mod) Brutefir time to audio: '
+            f'{metrics["audio_ms"]} ms (outputs: {outputs_ms} ms, '
+            f'inputs: {inputs_ms} ms){Fmt.END}')
 
     if not warnings:
         return 'done'
@@ -681,6 +922,77 @@ def restart_and_reconnect(bf_sources=[], delay=0.0):
         return warnings
 
 
+def in_standby():
+    return bool(STANDBY_FILTERS)
+
+
+def is_active():
+    """ Brutefir is running and convolving (not in standby)
+    """
+    return is_running() and not in_standby()
+
+
+def standby():
+    """ Hot standby: Brutefir keeps running with all its coefficients
+        loaded, but the filter outputs are muted and all filters are
+        switched to coeff -1, so that no FIR convolution is done.
+    """
+    if in_standby():
+        return 'done'
+
+    filters = get_running_filters()
+    mutes   = []
+    coeffs  = []
+
+    for f in filters:
+
+        outputs = []
+        for item in f.get('to outputs', '').split():
+            if '/' in item:
+                # index/atten/multiplier
+                tmp = item.split('/')
+                outputs.append( (tmp[0], tmp[1], tmp[2] if tmp[2:] else '1') )
+                mutes.append( f'cfoa "{f["f_name"]}" {tmp[0]} m0' )
+
+        STANDBY_FILTERS[ f['f_name'] ] = { 'coeff':   f.get('coeff set', '-1'),
+                                           'outputs': outputs }
+        coeffs.append( f'cfc "{f["f_name"]}" -1' )
+
+    # Outputs are muted first
+    cli( '; '.join(mutes + coeffs) )
+
+    return 'done'
+
+
+def wake_up():
+    """ Resumes convolving from hot standby, restoring the filter
+        coeffs (included those requested while in standby), then
+        the filter outputs.
+    """
+    if not in_standby():
+        return 'done'
+
+    coeffs  = []
+    outputs = []
+
+    for fname, f in STANDBY_FILTERS.items():
+
+        coeffs.append( f'cfc "{fname}" {f["coeff"]}' )
+
+        for out, atten, mult in f['outputs']:
+            if atten == 'inf':
+                m = 0.0
+            else:
+                m = float(mult) * 10 ** (-float(atten) / 20)
+            outputs.append( f'cfoa "{fname}" {out} m{m}' )
+
+    STANDBY_FILTERS.clear()
+
+    cli( '; '.join(coeffs + outputs) )
+
+    return 'done'
+
+
 def get_running_filters():
 
     # auxiliary to sum all attenuations inside a filter stage
@@ -816,10 +1128,12 @@ def add_delay(ms):
 
     # Issue new delay to Brutefir's outputs
     if not too_much:
-        ans = cli( cmd ).lower()
-        if not ans:
-            result = 'Brutefir error'
-        elif not 'unknown command' in ans and \
+        # (i) 'cod' answers nothing when done
+        try:
+            ans = ''.join( CLI_SESSION.query( cmd.rstrip(';').split(';') ) ).lower()
+        except Exception as e:
+            ans = f'error: {str(e)}'
+        if not 'unknown command' in ans and \
              not 'out of range' in ans and \
              not 'invalid' in ans and \
              not 'error' in ans:
@@ -836,10 +1150,12 @@ def add_delay(ms):
 # Autoexec on loading this module
 def init():
 
-    global BF_PORT
+    global BF_PORT, CLI_SESSION
 
     BF_PORT = read_bf_config_port()
 
+    CLI_SESSION = CliSession(BF_PORT)
+
 
     if not process_is_running('brutefir'):
         return
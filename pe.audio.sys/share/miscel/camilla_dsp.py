@@ -23,6 +23,7 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
 import jack_mod as jack
 from   miscel   import  process_is_running, CONFIG, MAINFOLDER, LOG_FOLDER, Fmt
+import proc_registry
 
 COMPRESSOR_CYCLE = ['off', '1.0:1', '2.0:1', '3.0:1']
 
@@ -329,7 +330,7 @@ def _init(compressor='off', mode='start'):
                    f'--logfile "{LOG_FOLDER}/camilladsp.log" {RUNTIME_YML_PATH}'
 
         print(f'{Fmt.MAGENTA}Pleae wait for CamillaDSP to start ...{Fmt.END}')
-        p = sp.Popen( cdsp_cmd, shell=True )
+        p = proc_registry.spawn( cdsp_cmd, shell=True )
 
         if not _connect_to_camilla():
             return False
@@ -50,6 +50,7 @@ MACROS_FOLDER       = f'{MAINFOLDER}/macros'
 LDCTRL_PATH         = f'{MAINFOLDER}/.loudness_control'
 LDMON_PATH          = f'{MAINFOLDER}/.loudness_monitor'
 AUX_INFO_PATH       = f'{MAINFOLDER}/.aux_info'
+EVENT_BUS_PATH      = f'{MAINFOLDER}/.event_bus'              # a Unix socket
 AMP_STATE_PATH      = f'{UHOME}/.amplifier'
 
 PLAYER_META_PATH    = f'{MAINFOLDER}/.player_metadata'
@@ -158,6 +159,19 @@ def _init():
     if not 'use_compressor' in CONFIG:
         CONFIG['use_compressor'] = False
 
+    # Time window to coalesce bursts of relative level, bass, treble
+    # or balance commands (0 disables it)
+    if not 'relative_cmd_window_ms' in CONFIG:
+        CONFIG['relative_cmd_window_ms'] = 50
+
+    # Snapshots per second of the way_meter.py plugin
+    if not 'way_meter_rate' in CONFIG:
+        CONFIG['way_meter_rate'] = 10
+
+    # Powersave: 'restart' stops Brutefir, 'standby' keeps it warm
+    if not 'powersave_mode' in CONFIG:
+        CONFIG['powersave_mode'] = 'restart'
+
     # Default amp switch off behavior to shutdown the computer
     if not 'amp_off_shutdown' in CONFIG:
         CONFIG["amp_off_shutdown"] = False
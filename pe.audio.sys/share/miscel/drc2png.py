@@ -9,11 +9,16 @@
     NOTICE: Even if short lenght IR are used for DRC, thus low resolution
             in low freq correction, the correction curve will be
             oversampled in order to show a smoothed low freq region.
+
+    The analysis of all DRC and XO .pcm files (headroom, latency) and
+    the rendering of the outdated PNG files are spread over a pool of
+    processes, one per CPU core.
 """
 
 import  numpy as np
-from    scipy       import signal, fft
+from    scipy       import fft
 from    matplotlib  import pyplot as plt
+from    concurrent.futures import ProcessPoolExecutor
 import  sys
 import  os
 
@@ -23,9 +28,12 @@ sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 from config import MAINFOLDER, LOUDSPEAKER, LSPK_FOLDER
 from miscel import read_bf_config_fs
 from brutefir_mod import get_config as bf_get_config
+import pcm_analysis
 
 IMGFOLDER   = f'{MAINFOLDER}/share/www/public/images/{LOUDSPEAKER}'
 
+WORKERS     = os.cpu_count() or 1
+
 
 # ----------------------    Plot config      -----------------------------------
 # Same color as index.html background-color: rgb(38, 38, 38)
@@ -56,8 +64,8 @@ def get_spectrum(imp, fs):
     except:
         print(f'(drc2png) fft.next_fast_len not availble on this scipy version')
 
-    # Semispectrum (whole=False -->  w to Nyquist)
-    w, h = signal.freqz(imp, worN=N, whole=False)
+    # Semispectrum (w to Nyquist), by FFT of the zero padded impulse
+    w, h = pcm_analysis.semispectrum(imp, N)
 
     # Actual freq from normalized freq
     freqs = w / np.pi * fNyq
@@ -68,7 +76,7 @@ def get_spectrum(imp, fs):
     return freqs, magdB
 
 
-def read_pcms(drc_set):
+def read_pcms(drc_set, fs):
 
     def readPCM32(fname):
         """ reads impulse from a pcm float32 file
@@ -83,7 +91,7 @@ def read_pcms(drc_set):
     IRs = []
     for fname in fnames:
         imp = readPCM32(fname)
-        IRs.append( {'fs':      FS,
+        IRs.append( {'fs':      fs,
                      'imp':     imp,
                      'drc_set': fname.split('.')[-2],
                      'channel': fname.split('.')[-3],
@@ -91,12 +99,12 @@ def read_pcms(drc_set):
     return IRs
 
 
-def diracs():
+def diracs(fs):
     IRs = []
     for ch in ('L', 'R'):
         imp = np.zeros(512)
         imp[0] = 1.0
-        IRs.append( {'fs':      FS,
+        IRs.append( {'fs':      fs,
                      'imp':     imp,
                      'drc_set': 'none',
                      'channel': ch
@@ -166,6 +174,54 @@ def png_is_outdated(drc_set):
     return False
 
 
+def render_png(drc_set, fs, attens):
+    """ Plots a drc set to its PNG file, it runs inside a pool process.
+        attens: { channel: coeff attenuation }
+        returns: the PNG file path
+    """
+
+    fig, ax = plt.subplots()
+    fig.set_figwidth( 5 )   # 5 inches at 100dpi => 500px wide
+    fig.set_figheight( 1.5 )
+    fig.set_facecolor( WEBCOLOR )
+    ax.set_facecolor( WEBCOLOR )
+
+    ax.set_xscale('log')
+    ax.set_xlim( FREQ_LIMITS )
+    ax.set_xticks( FREQ_TICKS )
+    ax.set_xticklabels( FREQ_LABELS )
+
+    ax.set_ylim( DB_LIMITS )
+    ax.set_yticks( DB_TICKS )
+    ax.set_yticklabels( DB_LABELS )
+
+    #ax.set_title( f'DRC: {drc_set}' )
+
+    if drc_set != 'none':
+        IRs = read_pcms( drc_set, fs )
+    else:
+        IRs = diracs( fs )
+
+    # Each IR has the following fields: fs, imp, drc_set, channel
+    for IR in IRs:
+        freqs, magdB = get_spectrum( IR["imp"], fs )
+        magdB -= attens[ IR["channel"] ]
+        ax.plot(freqs, magdB,
+                label=f'{IR["channel"]}',
+                color={'L': LINEBLUE, 'R': LINERED}
+                      [ IR["channel"] ],
+                linewidth=3
+                )
+
+    ax.legend( facecolor=WEBCOLOR, loc='lower right')
+    fpng = f'{IMGFOLDER}/drc_{drc_set}.png'
+    plt.savefig( fpng, facecolor=WEBCOLOR )
+    plt.close( fig )
+    #plt.show()
+
+    return fpng
+
+
 def prepare_IMGFOLDER():
     try:
         os.mkdir(IMGFOLDER)
@@ -199,59 +255,40 @@ if __name__ == '__main__':
     if verbose:
         print( f'(drc2png) using sample rate: {FS}' )
 
+    # Analysis of all DRC and XO pcm files (headroom, latency), so that
+    # the pe.audio.sys server will find them in the pcm analysis cache.
+    pcm_analysis.folder_info(LSPK_FOLDER, workers=WORKERS)
+
     # Get DRC sets names
     drc_sets = get_drc_sets()
-
-    # Do plot png files from pcm files
     drc_sets.append('none')
-    for drc_set in drc_sets:
 
-        # Check for outdated PNG file
+    # Check for outdated PNG files
+    outdated = []
+    for drc_set in drc_sets:
         if not png_is_outdated(drc_set):
             if verbose:
                 print(f'(drc2png) found PNG file for {LOUDSPEAKER}: {drc_set}')
-            continue
         else:
             if verbose:
                 print(f'(drc2png) processing PNG file for {LOUDSPEAKER}: {drc_set}')
+            outdated.append(drc_set)
 
-        fig, ax = plt.subplots()
-        fig.set_figwidth( 5 )   # 5 inches at 100dpi => 500px wide
-        fig.set_figheight( 1.5 )
-        fig.set_facecolor( WEBCOLOR )
-        ax.set_facecolor( WEBCOLOR )
+    # Do plot png files from pcm files, in parallel
+    if outdated:
 
-        ax.set_xscale('log')
-        ax.set_xlim( FREQ_LIMITS )
-        ax.set_xticks( FREQ_TICKS )
-        ax.set_xticklabels( FREQ_LABELS )
+        jobs = []
 
-        ax.set_ylim( DB_LIMITS )
-        ax.set_yticks( DB_TICKS )
-        ax.set_yticklabels( DB_LABELS )
+        with ProcessPoolExecutor( min(WORKERS, len(outdated)) ) as pool:
 
-        #ax.set_title( f'DRC: {drc_set}' )
+            for drc_set in outdated:
+                attens = { ch: get_coeff_atten(drc_set, ch) for ch in ('L', 'R') }
+                jobs.append( pool.submit(render_png, drc_set, FS, attens) )
 
-        if drc_set != 'none':
-            IRs = read_pcms( drc_set )
-        else:
-            IRs = diracs()
-
-        # Each IR has the following fields: fs, imp, drc_set, channel
-        for IR in IRs:
-            freqs, magdB = get_spectrum( IR["imp"], FS )
-            atten = get_coeff_atten( IR["drc_set"], IR["channel"] )
-            magdB -= atten
-            ax.plot(freqs, magdB,
-                    label=f'{IR["channel"]}',
-                    color={'L': LINEBLUE, 'R': LINERED}
-                          [ IR["channel"] ],
-                    linewidth=3
-                    )
-
-        ax.legend( facecolor=WEBCOLOR, loc='lower right')
-        fpng = f'{IMGFOLDER}/drc_{drc_set}.png'
-        plt.savefig( fpng, facecolor=WEBCOLOR )
-        if verbose:
-            print( f'(drc2png) saved: \'{fpng}\' ' )
-        #plt.show()
+            for drc_set, job in zip(outdated, jobs):
+                try:
+                    fpng = job.result()
+                    if verbose:
+                        print( f'(drc2png) saved: \'{fpng}\' ' )
+                except Exception as e:
+                    print( f'(drc2png) error processing \'{drc_set}\': {str(e)}' )
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" A publish/subscribe event bus.
+
+    The pe.audio.sys server process runs the bus, and publishes
+    these typed topics:
+
+        state       the preamp state
+        metadata    the current player metadata
+        player      the playback info, as per 'player get_all_info'
+        loudness    the loudness monitor measurements
+        warnings    temporary warning messages
+        aux         the auxiliary info
+        way_levels  the Brutefir per way levels (see plugins/way_meter.py)
+
+    Other processes can subscribe, or publish, through a local Unix socket
+    by using newline delimited JSON messages:
+
+        client --> bus:     {"subscribe": ["state", "metadata"]}
+                            {"publish": "loudness", "data": {...}}
+
+        bus --> client:     {"topic": "state", "full": {...}}
+                            {"topic": "state", "changed": {...}, "removed": [...]}
+
+    A subscriber receives first the full data of the subscribed topics,
+    then only the diffs when values change.
+
+    (i) The classic files .state, .player_metadata, ... are still written
+        as a compatibility fallback.
+"""
+
+import  socket
+import  json
+import  queue
+import  threading
+from    copy    import deepcopy
+from    time    import sleep
+import  os
+
+from    config  import EVENT_BUS_PATH
+from    miscel  import dict_compare, Fmt
+
+
+TOPICS          = ('state', 'metadata', 'player', 'loudness', 'warnings',
+                   'aux', 'way_levels')
+
+# Max messages pending to be sent to a slow subscriber before dropping it
+QUEUE_SIZE      = 100
+
+# The bus runs in this process
+BUS_RUNNING     = False
+
+SNAPSHOTS       = {}
+SUBSCRIBERS     = []
+LOCK            = threading.RLock()
+
+# A connection to publish from a process other than the bus one
+PUB_SOCK        = None
+PUB_LOCK        = threading.Lock()
+
+
+class Subscriber:
+    """ A client connected to the bus
+    """
+
+    def __init__(self, sock):
+        self.sock   = sock
+        self.topics = set()
+        self.queue  = queue.Queue(maxsize=QUEUE_SIZE)
+        self.closed = False
+
+
+    def start(self):
+        threading.Thread( target=self._writer, daemon=True ).start()
+        threading.Thread( target=self._reader, daemon=True ).start()
+
+
+    def put(self, msg):
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            print(f'{Fmt.RED}(event_bus) dropping a slow subscriber{Fmt.END}')
+            self.close()
+
+
+    def close(self):
+
+        if self.closed:
+            return
+        self.closed = True
+
+        with LOCK:
+            if self in SUBSCRIBERS:
+                SUBSCRIBERS.remove(self)
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+        # releases the writer
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+    def _writer(self):
+        while not self.closed:
+            msg = self.queue.get()
+            if msg is None:
+                break
+            try:
+                self.sock.sendall( f'{json.dumps(msg)}\n'.encode() )
+            except OSError:
+                self.close()
+
+
+    def _reader(self):
+
+        try:
+            for line in self.sock.makefile('r'):
+
+                try:
+                    msg = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if 'subscribe' in msg:
+                    with LOCK:
+                        for topic in msg['subscribe']:
+                            self.topics.add(topic)
+                            if topic in SNAPSHOTS:
+                                self.put( {'topic': topic,
+                                           'full':  SNAPSHOTS[topic]} )
+
+                elif 'publish' in msg and 'data' in msg:
+                    publish( msg['publish'], msg['data'] )
+
+        except OSError:
+            pass
+
+        self.close()
+
+
+def _accept_loop(srv):
+
+    while True:
+        try:
+            con, _ = srv.accept()
+        except OSError:
+            sleep(1)
+            continue
+
+        sub = Subscriber(con)
+        with LOCK:
+            SUBSCRIBERS.append(sub)
+        sub.start()
+
+
+def start_bus():
+    """ Runs the bus in this process, listening at EVENT_BUS_PATH
+    """
+    global BUS_RUNNING
+
+    if os.path.exists(EVENT_BUS_PATH):
+        os.remove(EVENT_BUS_PATH)
+
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(EVENT_BUS_PATH)
+    srv.listen(10)
+
+    threading.Thread( target=_accept_loop, args=(srv,), daemon=True ).start()
+
+    BUS_RUNNING = True
+    print(f'{Fmt.BLUE}(event_bus) listening at {EVENT_BUS_PATH}{Fmt.END}')
+
+
+def _publish_remote(topic, data):
+    """ Publish through the bus socket
+    """
+    global PUB_SOCK
+
+    msg = f'{json.dumps( {"publish": topic, "data": data} )}\n'.encode()
+
+    with PUB_LOCK:
+
+        for attempt in (1, 2):
+            try:
+                if not PUB_SOCK:
+                    PUB_SOCK = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    PUB_SOCK.connect(EVENT_BUS_PATH)
+                PUB_SOCK.sendall(msg)
+                return True
+            except OSError:
+                if PUB_SOCK:
+                    PUB_SOCK.close()
+                PUB_SOCK = None
+
+    return False
+
+
+def publish(topic, data):
+    """ Publish the up to date data (dict) of a topic,
+        subscribers will only receive the diffs.
+    """
+    if not BUS_RUNNING:
+        return _publish_remote(topic, data)
+
+    with LOCK:
+
+        old = SNAPSHOTS.get(topic)
+
+        if old == data:
+            return True
+
+        data = deepcopy(data)
+        SNAPSHOTS[topic] = data
+
+        if old is None:
+            msg = {'topic': topic, 'full': data}
+
+        else:
+            changed, added, removed = dict_compare(old, data, static=False)
+            changed = { k: v[1] for k, v in changed.items() }
+            changed.update(added)
+            msg = {'topic': topic, 'changed': changed, 'removed': list(removed)}
+
+        for sub in SUBSCRIBERS[:]:
+            if topic in sub.topics:
+                sub.put(msg)
+
+    return True
+
+
+def get_snapshot(topic):
+    """ The last published data of a topic (dict), for the bus process
+    """
+    with LOCK:
+        return deepcopy( SNAPSHOTS.get(topic, {}) )
+
+
+def bus_is_running():
+    """ Checks if the bus is reachable (boolean)
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(EVENT_BUS_PATH)
+        return True
+    except OSError:
+        return False
+
+
+def subscribe(topics, callback, retry=2):
+    """ Threaded subscription to some topics.
+
+        callback(topic, data, changes) receives the full up to date
+        data of the topic, and the changed items.
+
+        It reconnects if the bus was restarted.
+    """
+
+    def loop():
+
+        while True:
+
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+
+                    s.connect(EVENT_BUS_PATH)
+                    s.sendall( f'{json.dumps( {"subscribe": list(topics)} )}\n'.encode() )
+
+                    datas = {}
+
+                    for line in s.makefile('r'):
+
+                        msg   = json.loads(line)
+                        topic = msg['topic']
+
+                        if 'full' in msg:
+                            datas[topic] = dict( msg['full'] )
+                            changes = msg['full']
+
+                        else:
+                            changes = msg['changed']
+                            datas.setdefault(topic, {}).update(changes)
+                            for k in msg['removed']:
+                                datas[topic].pop(k, None)
+
+                        try:
+                            callback( topic, datas[topic], changes )
+                        except Exception as e:
+                            print(f'{Fmt.RED}(event_bus) callback error: {str(e)}{Fmt.END}')
+
+            except (OSError, ValueError, KeyError):
+                pass
+
+            sleep(retry)
+
+
+    job = threading.Thread( target=loop, daemon=True )
+    job.start()
+    return job
@@ -9,9 +9,25 @@
 
 from time import sleep, time
 import jack
-from subprocess import check_output
+import threading
+import proc_registry
+
+
+# Set when a port is registered/unregistered or (dis)connected, see wait_for()
+PORT_EVENT = threading.Event()
+
+
+def _on_port_change(*dummy):
+    """ (i) Runs in the JACK notification thread,
+            so it must not call any JACK function.
+    """
+    PORT_EVENT.set()
+
 
 JCLI = jack.Client(name=str(int(time())), no_start_server=True)
+# (i) callbacks must be set before activating the client
+JCLI.set_port_registration_callback(_on_port_change)
+JCLI.set_port_connect_callback(_on_port_change)
 JCLI.activate()
 
 
@@ -29,10 +45,7 @@ def get_device():
     """ This is not in Jack-CLIENT API
     """
     device = ''
-    try:
-        tmp = check_output('pgrep -fla jackd'.split()).decode()
-    except:
-        return device
+    tmp = ' '.join( proc_registry.find('jackd').values() )
 
     if not 'hw:' in tmp:
         return device
@@ -47,6 +60,30 @@ def get_device():
     return device
 
 
+def wait_for(condition, timeout=10.0, recheck=1.0):
+    """ Waits until condition() is True. It is evaluated again as soon as
+        any JACK port is registered or (dis)connected, and also every
+        'recheck' seconds just in case some notification was missed.
+
+        returns: True, or False on timeout
+    """
+    tend = time() + timeout
+
+    while True:
+
+        # Clearing before checking, so that no notification can be lost
+        PORT_EVENT.clear()
+
+        if condition():
+            return True
+
+        remaining = tend - time()
+        if remaining <= 0:
+            return False
+
+        PORT_EVENT.wait( min(remaining, recheck) )
+
+
 def get_all_connections(pname):
     """ wrap function """
     ports = JCLI.get_all_connections(pname)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" Incremental reading of the players events files (.istreams_events,
+    .dvb_events, .cdda_events, .librespot_events ...)
+
+    A LogFollower remembers the file offset, so that each poll() only
+    reads the bytes appended since the previous one, and keeps in memory
+    just the latest parsed events (see parser below), whatever the file
+    length is.
+
+    When the file exceeds MAX_SIZE it is truncated.
+
+    (!) Writers must open the file in append mode, otherwise a truncated
+        file would be filled up again with zeros until their file offset.
+        Lines written just between the last read and the truncation are
+        lost, as with logrotate 'copytruncate'.
+
+    A parser(line, state) updates the state dictionary from a line, and
+    returns a key for relevant lines (None otherwise), so that the number
+    of parsed events by key can be known (see seq), e.g. to wait for
+    a fresh answer from a player.
+"""
+
+import  os
+import  re
+import  threading
+from    time    import sleep
+
+
+# Files are truncated when exceeding this size (bytes)
+MAX_SIZE    = 1_000_000
+# When starting to follow a longer file, only its tail is parsed
+START_TAIL  = 65536
+# Max length of a line
+MAX_LINE    = 4096
+
+# Mplayer status lines end with \r
+EOL = re.compile(b'[\r\n]')
+
+
+class LogFollower:
+    """ Follows an events file as per 'tail -F'
+    """
+
+    def __init__(self, path, parser, max_size=MAX_SIZE):
+
+        self.path       = path
+        self.parser     = parser
+        self.max_size   = max_size
+        self.state      = {}
+        # parsed events by key
+        self.counts     = {}
+        self.events     = 0
+        self.ino        = None
+        self.offset     = 0
+        self.partial    = b''
+        self.skip_line  = False
+        self.lock       = threading.Lock()
+
+
+    def _parse(self, data):
+
+        lines = EOL.split( self.partial + data )
+        self.partial = lines.pop()[-MAX_LINE:]
+
+        for line in lines:
+
+            if not line:
+                continue
+
+            try:
+                key = self.parser( line.decode(errors='replace'), self.state )
+            except Exception:
+                key = None
+
+            if key:
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.events += 1
+
+
+    def poll(self):
+        """ Parses the lines appended since the last poll
+            returns: the state dictionary
+        """
+        with self.lock:
+
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                return self.state
+
+            # A new file, or it was truncated
+            if st.st_ino != self.ino or st.st_size < self.offset:
+
+                # a long file when starting, the first line read is partial
+                if self.ino is None and st.st_size > START_TAIL:
+                    self.offset    = st.st_size - START_TAIL
+                    self.skip_line = True
+                else:
+                    self.offset    = 0
+
+                self.partial = b''
+                self.ino     = st.st_ino
+
+            if st.st_size > self.offset:
+
+                try:
+                    with open(self.path, 'rb') as f:
+                        f.seek(self.offset)
+                        data = f.read(st.st_size - self.offset)
+                except OSError:
+                    return self.state
+
+                self.offset += len(data)
+
+                if self.skip_line:
+                    self.skip_line = False
+                    data = data[ data.find(b'\n') + 1: ]
+
+                self._parse(data)
+
+                if self.offset > self.max_size:
+                    self._truncate()
+
+            return self.state
+
+
+    def _truncate(self):
+        """ (i) call it when holding the lock
+        """
+        try:
+            os.truncate(self.path, 0)
+            self.offset = 0
+        except OSError as e:
+            print(f'(log_follower) cannot truncate \'{self.path}\': {str(e)}')
+
+
+    def seq(self, key):
+        """ The number of parsed events of a key
+        """
+        with self.lock:
+            return self.counts.get(key, 0)
+
+
+    def wait_event(self, key, seq, timeout=0.3, interval=0.02):
+        """ Waits for a new event of a key, as compared to a previous seq()
+            returns: boolean
+        """
+        while True:
+
+            self.poll()
+            if self.seq(key) > seq:
+                return True
+
+            if timeout <= 0:
+                return False
+            sleep(interval)
+            timeout -= interval
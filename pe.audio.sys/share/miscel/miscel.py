@@ -26,6 +26,8 @@ import  numpy       as np
 from    config      import  *
 from    fmt         import  Fmt
 from    sound_cards import  remove_cards_in_pulseaudio
+import  pcm_analysis
+import  proc_registry
 
 
 # --- MPD auxiliary
@@ -200,14 +202,12 @@ def get_xo_latencies(xo_sets, relative=True):
 
         If <relative>, the result is referred to the minimum latency
         set of those found, example:  {'mp': 0.0, 'lp': 91.9}
-    """
-
-    def readPCM(fname, dtype=np.float32):
-        return np.fromfile(fname, dtype=dtype)
 
+        (i) The pcm analysis is cached on disk, see pcm_analysis.py
+    """
 
-    def get_peak(fir):
-        peak_pos = np.argmax(np.abs(fir))
+    def get_peak(fname):
+        peak_pos = pcm_analysis.pcm_info(fname)['peak_pos']
         fs = CONFIG['samplerate']
         latency_ms = round(peak_pos / fs * 1000, 1)
         return (latency_ms, peak_pos)
@@ -225,8 +225,7 @@ def get_xo_latencies(xo_sets, relative=True):
         pcm_files = list(directory.glob(f'xo.*.{xo_set}.pcm'))
 
         for f in pcm_files:
-            fir = readPCM( str(f.absolute()) )
-            latency, _ = get_peak(fir)
+            latency, _ = get_peak( str(f.absolute()) )
             latencies[xo_set].append(latency)
 
     # DEBUG
@@ -344,7 +343,7 @@ def start_jack_stuff(config=CONFIG):
 
     # Launch JACKD process
     with open(f'{LOG_FOLDER}/jackd.log', 'w') as jlog:
-        sp.Popen(f'jackd {jOpts} {jBkndOpts}', shell=True,
+        proc_registry.spawn(f'jackd {jOpts} {jBkndOpts}', shell=True,
                         stdout=jlog,
                         stderr=jlog)
 
@@ -387,7 +386,7 @@ def run_jloops():
         (void)
     """
     # Jack loops launcher external daemon
-    sp.Popen(f'{MAINFOLDER}/share/services/preamp_mod/jloops_daemon.py', shell=True)
+    proc_registry.spawn(f'{MAINFOLDER}/share/services/preamp_mod/jloops_daemon.py', shell=True)
 
 
 def check_jloops(config=CONFIG):
@@ -841,7 +840,7 @@ def local_zita_restart(raddr, udp_port, buff_size):
     #
     try:
         # Using stdbuf because zita does use unbuffered output to tty, skipping stdout/stderr
-        sp.Popen( f'stdbuf -oL -eL {zitacmd} 1>{zitalog} 2>&1', shell=True )
+        proc_registry.spawn( f'stdbuf -oL -eL {zitacmd} 1>{zitalog} 2>&1', shell=True )
         wait4ports(zitajname, 3)
         sp.Popen( f'jack_alias {zitajname}:out_1 {raddr}:out_1'.split() )
         sp.Popen( f'jack_alias {zitajname}:out_2 {raddr}:out_2'.split() )
@@ -969,22 +968,11 @@ def detect_spotify_client():
         return: 'desktop', 'librespot' or ''
     """
 
-    # Iterate through all running processes
-    for proc in psutil.process_iter(['cmdline']):
-
-        try:
-
-            # (i) proc.info['cmdline']) is a list of command line args
-            cmdline = ' '.join( proc.info['cmdline'] )
-
-            if 'spotify/spotify' in cmdline.lower():
-                return 'desktop'
-
-            elif 'librespot' in cmdline.lower():
-                return 'librespot'
+    if proc_registry.is_running('spotify/spotify'):
+        return 'desktop'
 
-        except:
-            pass
+    elif proc_registry.is_running('librespot'):
+        return 'librespot'
 
     return ''
 
@@ -1078,40 +1066,19 @@ def get_pid_cmdline(process_name=''):
 
     pids = []
 
-    for proc in psutil.process_iter():
-        try:
-            if proc.name() == process_name:
-                pids.append( {'pid': proc.pid, 'cmdline': proc.cmdline() } )
-        except:
-            pass
+    for pid, cmdline in proc_registry.find(process_name).items():
+        cmdline = cmdline.split()
+        if os.path.basename( cmdline[0] ) == process_name:
+            pids.append( {'pid': pid, 'cmdline': cmdline } )
 
     return pids
 
 
 def process_is_running(*patterns):
     """ all patterns must appear on the command line
+        (i) an in-memory lookup, see proc_registry
     """
-
-    # Iterate through all running processes
-    for proc in psutil.process_iter(['cmdline']):
-
-        try:
-
-            # (i) proc.info['cmdline']) is a list of command line args
-            cmdline = ' '.join( proc.info['cmdline'] )
-
-            # Match patterns (case-insensitive)
-            n = 0
-            for pattern in patterns:
-                if pattern.lower() in cmdline.lower():
-                    n += 1
-            if n == len(patterns):
-                return True
-
-        except:
-            pass
-
-    return False
+    return proc_registry.is_running(*patterns)
 
 
 def kill_bill(pid=0):
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    An on-disk analysis cache of the loudspeaker FIR .pcm files.
+
+    The cache is stored as '.pcm_analysis.json' inside each
+    loudspeakers/<LSPK>/<FS> folder, one entry per .pcm file:
+
+        'size', 'mtime', 'hash'     the file fingerprint
+        'peak_pos'                  impulse peak position (samples)
+        'latency_ms'                the peak position in ms
+        'max_gain_dB'               the magnitude response max gain
+        'mag'                       a decimated magnitude response,
+                                    [ [freq, dB], ... ]
+
+    A file is analyzed again only if its size or mtime has changed
+    and also its content hash.
+
+    Several processes can use the cache (e.g. the server and drc2png.py),
+    so the file is re-read and merged under a lock before being saved.
+
+    Responses are evaluated by FFT (rfft of the zero padded impulse),
+    and many files can be analyzed in parallel by a process pool.
+
+    Usage:  pcm_analysis.py  [folder]
+
+            Prints the analysis of the .pcm files under folder
+            (defaults to the current loudspeaker folder).
+"""
+
+import  os
+import  sys
+import  json
+import  fcntl
+import  hashlib
+import  threading
+import  numpy as np
+from    concurrent.futures import ProcessPoolExecutor
+
+from    config  import  CONFIG, LSPK_FOLDER
+
+
+CACHE_FNAME     = '.pcm_analysis.json'
+
+# semispectrum points used to find the max gain
+# (as the former DRC headroom calc by freqz)
+FREQZ_POINTS    = 512
+# points of the stored decimated magnitude response
+MAG_POINTS      = 64
+
+# { folder: { pcm_fname: entry, ... } }
+CACHE           = {}
+LOCK            = threading.Lock()
+
+
+def _folder_fs(folder):
+    """ Loudspeaker folders are named as the sample rate,
+        otherwise the configured one is used.
+    """
+    name = os.path.basename( os.path.normpath(folder) )
+    if name.isdigit():
+        return int(name)
+    return CONFIG['samplerate']
+
+
+def _file_hash(path):
+
+    h = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as f:
+        for chunk in iter( lambda: f.read(1 << 20), b'' ):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def _load(folder):
+
+    if folder not in CACHE:
+        try:
+            with open( f'{folder}/{CACHE_FNAME}', 'r' ) as f:
+                CACHE[folder] = json.loads( f.read() )
+        except:
+            CACHE[folder] = {}
+
+    return CACHE[folder]
+
+
+def _up_to_date(folder, fname, entry):
+    """ The entry matches the current file (boolean)
+    """
+    try:
+        st = os.stat(f'{folder}/{fname}')
+    except OSError:
+        return False
+    return entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime
+
+
+def _merge(folder, disk):
+    """ Merges the cache on disk, as saved by another process, into
+        the memory one. Entries of no longer existing files are dropped.
+    """
+    cache = CACHE[folder]
+
+    for fname, entry in disk.items():
+        if not _up_to_date(folder, fname, cache.get(fname, {})):
+            cache[fname] = entry
+
+    for fname in list(cache):
+        if not os.path.isfile(f'{folder}/{fname}'):
+            del cache[fname]
+
+
+def _save(folder):
+    """ Merges the cache on disk, then an atomic write (temp file + rename),
+        all under a file lock
+    """
+    path     = f'{folder}/{CACHE_FNAME}'
+    tmp_path = f'{path}.tmp'
+
+    try:
+        with open(f'{path}.lock', 'w') as lock:
+
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                with open(path, 'r') as f:
+                    _merge( folder, json.loads( f.read() ) )
+            except (OSError, ValueError):
+                pass
+
+            with open(tmp_path, 'w') as f:
+                f.write( json.dumps(CACHE[folder], indent=1) )
+            os.replace(tmp_path, path)
+
+    except Exception as e:
+        print(f'(pcm_analysis) cannot save \'{path}\': {str(e)}')
+
+
+def semispectrum(imp, N):
+    """ The same as scipy.signal.freqz(imp, worN=N, whole=False),
+        but computed by FFT of the zero padded impulse.
+
+        returns: w (normalized freq. from 0 to pi), h (complex)
+    """
+    # The FFT length must be a multiple of 2*N not shorter than the impulse
+    step = max( 1, int( np.ceil( len(imp) / (2 * N) ) ) )
+    h = np.fft.rfft(imp, n = 2 * N * step)[ ::step ][ :N ]
+    w = np.arange(N) * np.pi / N
+
+    return w, h
+
+
+def _analyze(path, fs):
+
+    fir = np.fromfile(path, dtype=np.float32)
+
+    peak_pos = int( np.argmax( np.abs(fir) ) )
+
+    w, h  = semispectrum(fir, FREQZ_POINTS)
+    magdB = 20 * np.log10( np.abs(h) + 1e-12 )
+
+    # log spaced decimation, skipping DC
+    idx = np.unique( np.geomspace(1, FREQZ_POINTS - 1, MAG_POINTS).astype(int) )
+    freqs = w[idx] / np.pi * fs / 2
+
+    return  {
+            'peak_pos':     peak_pos,
+            'latency_ms':   round(peak_pos / fs * 1000, 1),
+            'max_gain_dB':  round( float(np.max(magdB)), 1 ),
+            'mag':          [ [ round(float(f), 1), round(float(m), 2) ]
+                              for f, m in zip(freqs, magdB[idx]) ]
+            }
+
+
+def _cached(folder, fname):
+    """ (i) call it when holding LOCK
+        returns:    the cached entry if up to date, otherwise None and
+                    the file fingerprint; and if the cache was modified
+    """
+
+    cache = _load(folder)
+    path  = f'{folder}/{fname}'
+    st    = os.stat(path)
+    entry = cache.get(fname)
+
+    if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+        return entry, None, False
+
+    fhash = _file_hash(path)
+
+    # Same content, e.g. the file was copied again
+    if entry and entry['size'] == st.st_size and entry['hash'] == fhash:
+        entry['mtime'] = st.st_mtime
+        return entry, None, True
+
+    return None, { 'size': st.st_size, 'mtime': st.st_mtime, 'hash': fhash }, True
+
+
+def _get(folder, fname, fs):
+    """ (i) call it when holding LOCK
+        returns: the entry, and if the cache was modified
+    """
+
+    entry, fprint, modified = _cached(folder, fname)
+
+    if not entry:
+        entry = fprint
+        entry.update( _analyze(f'{folder}/{fname}', fs) )
+        CACHE[folder][fname] = entry
+
+    return entry, modified
+
+
+def pcm_info(pcm_path):
+    """ The analysis of a .pcm file (dictionary)
+    """
+
+    folder, fname = os.path.split( os.path.abspath(pcm_path) )
+
+    with LOCK:
+        entry, modified = _get( folder, fname, _folder_fs(folder) )
+        if modified:
+            _save(folder)
+
+    return entry
+
+
+def folder_info(folder=LSPK_FOLDER, verbose=False, workers=1):
+    """ The analysis of all .pcm files in a folder, also prewarms the cache.
+        Entries of no longer existing files are dropped.
+
+        workers:    processes to analyze outdated files in parallel
+
+        (dictionary)
+    """
+
+    folder = os.path.abspath(folder)
+    fs     = _folder_fs(folder)
+    result = {}
+
+    with LOCK:
+
+        cache    = _load(folder)
+        modified = False
+        todo     = {}
+
+        fnames = sorted( [ x for x in os.listdir(folder) if x.endswith('.pcm') ] )
+
+        for fname in fnames:
+
+            entry, fprint, tmp = _cached(folder, fname)
+            modified |= tmp
+
+            if entry:
+                result[fname] = entry
+            else:
+                todo[fname] = fprint
+
+        if todo:
+
+            paths = [ f'{folder}/{x}' for x in todo ]
+
+            if workers > 1 and len(paths) > 1:
+                with ProcessPoolExecutor(workers) as pool:
+                    analyses = list( pool.map( _analyze, paths,
+                                               [fs] * len(paths) ) )
+            else:
+                analyses = [ _analyze(x, fs) for x in paths ]
+
+            for fname, analysis in zip(todo, analyses):
+                todo[fname].update(analysis)
+                cache[fname]  = todo[fname]
+                result[fname] = todo[fname]
+
+        if verbose:
+            for fname in fnames:
+                entry = result[fname]
+                print( f'{fname:32} peak: {entry["peak_pos"]:6} '
+                       f'({entry["latency_ms"]:6.1f} ms)  '
+                       f'max gain: {entry["max_gain_dB"]:5.1f} dB'
+                       f'{"  (updated)" if fname in todo else ""}' )
+
+        for fname in list(cache):
+            if fname not in fnames:
+                del cache[fname]
+                modified = True
+
+        if modified:
+            _save(folder)
+
+    return result
+
+
+if __name__ == '__main__':
+
+    folder = LSPK_FOLDER
+
+    if sys.argv[1:]:
+        if '-h' in sys.argv[1]:
+            print(__doc__)
+            sys.exit()
+        folder = sys.argv[1]
+
+    folder_info(folder, verbose=True, workers=os.cpu_count())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" A process liveness registry, so that checking for a running process
+    does not need to fork pgrep/ps, neither to iterate psutil processes
+    on every request.
+
+    - Processes spawned here (see spawn) are registered by PID, and
+      unregistered when they exit (a thread waits for each child).
+
+    - Any other process is found from a /proc snapshot, which is taken
+      again only when older than SNAPSHOT_TTL.
+
+    Positive answers are always validated against /proc/<pid>, so a
+    dead process is never reported as running. A just started process
+    not spawned here can take up to SNAPSHOT_TTL to be seen.
+
+    Usage:  proc_registry.py  pattern1 [pattern2 ...]
+
+            Lists the matching processes.
+"""
+
+import  os
+import  sys
+import  signal
+import  threading
+from    time        import monotonic
+from    subprocess  import Popen
+
+
+SNAPSHOT_TTL    = 1.0
+
+# Processes spawned here { pid: cmdline }
+SPAWNED         = {}
+# The /proc snapshot { pid: cmdline } and its monotonic time
+SNAPSHOT        = {}
+SNAPSHOT_TIME   = -1e9
+LOCK            = threading.Lock()
+
+
+def _read_cmdline(pid):
+    """ The command line of a process as a string, or None if not available
+    """
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            tmp = f.read()
+    except OSError:
+        return None
+
+    # Kernel threads have no command line
+    if not tmp:
+        return None
+
+    return tmp.rstrip(b'\0').replace(b'\0', b' ').decode(errors='replace')
+
+
+def _scan():
+    """ Takes a new /proc snapshot
+        (i) call it when holding LOCK
+    """
+    global SNAPSHOT, SNAPSHOT_TIME
+
+    snapshot = {}
+
+    for entry in os.listdir('/proc'):
+
+        if not entry.isdigit():
+            continue
+
+        pid = int(entry)
+        cmdline = _read_cmdline(pid)
+        if cmdline:
+            snapshot[pid] = cmdline
+
+    SNAPSHOT      = snapshot
+    SNAPSHOT_TIME = monotonic()
+
+
+def _is_alive(pid, cmdline):
+    """ The pid still exists and runs the same command line
+    """
+    return _read_cmdline(pid) == cmdline
+
+
+def _match(cmdline, patterns):
+    """ all patterns must appear on the command line (case-insensitive)
+    """
+    cmdline = cmdline.lower()
+    return all( p.lower() in cmdline for p in patterns )
+
+
+def find(*patterns, fresh=False):
+    """ Running processes whose command line contains all the patterns
+        returns: { pid: cmdline, ... }
+    """
+    with LOCK:
+
+        if fresh or monotonic() - SNAPSHOT_TIME > SNAPSHOT_TTL:
+            _scan()
+
+        found = {}
+
+        for pid, cmdline in SNAPSHOT.items():
+            if _match(cmdline, patterns) and _is_alive(pid, cmdline):
+                found[pid] = cmdline
+
+        # (i) spawned ones are unregistered when exiting
+        for pid, cmdline in SPAWNED.items():
+            if _match(cmdline, patterns):
+                found[pid] = cmdline
+
+        return found
+
+
+def is_running(*patterns):
+    """ all patterns must appear on the command line of a running process
+    """
+    with LOCK:
+
+        # The spawned ones first, these are always up to date
+        for pid, cmdline in SPAWNED.items():
+            if _match(cmdline, patterns):
+                return True
+
+        # Still validating, because the snapshot can be outdated
+        if monotonic() - SNAPSHOT_TIME > SNAPSHOT_TTL:
+            _scan()
+
+        for pid, cmdline in SNAPSHOT.items():
+            if _match(cmdline, patterns) and _is_alive(pid, cmdline):
+                return True
+
+    return False
+
+
+def spawn(args, **kwargs):
+    """ Popen(args, **kwargs) registering the child process until it exits
+        returns: the Popen object
+    """
+    proc = Popen(args, **kwargs)
+
+    if isinstance(args, str):
+        cmdline = args
+    else:
+        cmdline = ' '.join( [str(x) for x in args] )
+
+    with LOCK:
+        SPAWNED[proc.pid] = cmdline
+
+    def waiter():
+        proc.wait()
+        with LOCK:
+            SPAWNED.pop(proc.pid, None)
+            SNAPSHOT.pop(proc.pid, None)
+
+    threading.Thread( target=waiter, daemon=True ).start()
+
+    return proc
+
+
+def kill(*patterns, sig=signal.SIGTERM):
+    """ Sends a signal to the processes whose command line contains
+        all the patterns (as 'pkill -f' does, but without forking)
+        returns: the signaled pids
+    """
+    pids = []
+
+    for pid in find(*patterns, fresh=True):
+
+        # Avoids harakiri
+        if pid == os.getpid():
+            continue
+
+        try:
+            os.kill(pid, sig)
+            pids.append(pid)
+        except OSError:
+            pass
+
+    return pids
+
+
+if __name__ == '__main__':
+
+    if not sys.argv[1:] or '-h' in sys.argv[1]:
+        print(__doc__)
+        sys.exit()
+
+    for pid, cmdline in find( *sys.argv[1:] ).items():
+        print( f'{pid:>8}  {cmdline}' )
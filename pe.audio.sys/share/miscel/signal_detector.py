@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" A lightweight signal presence detector.
+
+    A JACK client listens to the preamp input (pre_in_loop outputs), and
+    computes the block peak and mean square inside its process callback.
+
+    Measurements are published through a small shared memory block,
+    so any process can read them without extra audio streams, file reads
+    or process spawns (see read_signal).
+
+    The process running the detector can also wait for the signal to
+    appear (see Detector.wait_signal).
+
+    Usage:  signal_detector.py      prints the shared measurements
+"""
+
+import  sys
+import  threading
+from    time    import monotonic, sleep
+from    multiprocessing import shared_memory, resource_tracker
+import  numpy as np
+import  jack
+
+from    config  import CONFIG
+
+
+SHM_NAME    = 'peaudiosys_signal'
+
+# Shared values (float64)
+SEQ         = 0     # odd while being written
+PEAK        = 1     # last block peak (linear)
+MSQ         = 2     # last block mean square (linear)
+MSQ_AVG     = 3     # mean square averaged by TAU
+LAST_SIGNAL = 4     # monotonic time of the last block above the threshold
+THRESHOLD   = 5     # the threshold (dBFS)
+NVALUES     = 6
+
+# Mean square averaging time constant (s)
+TAU         = 0.4
+
+# The detector running in this process, see start()
+DETECTOR    = None
+
+
+def _dB(x, floor=-100.0):
+    return round( 10 * np.log10(x), 1 ) if x > 1e-10 else floor
+
+
+class Detector:
+    """ A JACK client measuring the signal at the given source ports
+    """
+
+    def __init__(self, source='pre_in_loop', threshold=-70.0,
+                       name='signal_detector'):
+
+        self.source     = source
+        self.threshold  = threshold
+        # linear peak threshold
+        self.peak_thr   = 10 ** (threshold / 20)
+        self.signal     = threading.Event()
+        self.alpha      = 0.0
+        self.nframes    = 0
+
+        try:
+            self.shm = shared_memory.SharedMemory( name=SHM_NAME, create=True,
+                                                   size=NVALUES * 8 )
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory( name=SHM_NAME )
+
+        self.values = np.ndarray( (NVALUES,), dtype=np.float64,
+                                  buffer=self.shm.buf )
+        self.values[:]              = 0.0
+        self.values[THRESHOLD]      = threshold
+        self.values[LAST_SIGNAL]    = -1e9
+
+        self.client = jack.Client(name, no_start_server=True)
+        self.inports = [ self.client.inports.register(f'in_{i}')
+                         for i in (1, 2) ]
+        self.client.set_process_callback(self._process)
+
+
+    def _process(self, frames):
+        """ JACK process callback (i) keep it short """
+
+        if frames != self.nframes:
+            self.nframes = frames
+            self.alpha   = 1.0 - np.exp( -frames / (self.client.samplerate * TAU) )
+
+        peak = 0.0
+        msq  = 0.0
+        for p in self.inports:
+            buf  = p.get_array()
+            peak = max( peak, buf.max(), -buf.min() )
+            msq  += np.dot(buf, buf)
+        msq /= frames * len(self.inports)
+
+        v = self.values
+        v[SEQ]      += 1
+        v[PEAK]     = peak
+        v[MSQ]      = msq
+        v[MSQ_AVG]  += self.alpha * (msq - v[MSQ_AVG])
+        if peak > self.peak_thr:
+            v[LAST_SIGNAL] = monotonic()
+            if not self.signal.is_set():
+                self.signal.set()
+        v[SEQ]      += 1
+
+
+    def start(self):
+
+        self.client.activate()
+
+        for i, p in enumerate(self.inports):
+            try:
+                self.client.connect( f'{self.source}:output_{i + 1}', p )
+            except jack.JackError as e:
+                print(f'(signal_detector) cannot connect to \'{self.source}\': {str(e)}')
+
+        print(f'(signal_detector) listening to \'{self.source}\', '
+              f'threshold {self.threshold} dBFS')
+
+
+    def signal_age(self):
+        """ Seconds since the signal was above the threshold
+        """
+        return monotonic() - self.values[LAST_SIGNAL]
+
+
+    def wait_signal(self, timeout=None):
+        """ Waits for the signal to be above the threshold (boolean)
+        """
+        # (i) clear first, so a set after the age check is not lost
+        self.signal.clear()
+        if self.signal_age() < 0.1:
+            return True
+        return self.signal.wait(timeout)
+
+
+def start(source='pre_in_loop', threshold=None):
+    """ Starts the detector in this process, once.
+        returns: the Detector, or None if not available
+    """
+    global DETECTOR
+
+    if DETECTOR:
+        return DETECTOR
+
+    if threshold is None:
+        threshold = CONFIG.get('powersave_noise_floor', -70)
+
+    try:
+        DETECTOR = Detector(source=source, threshold=threshold)
+        DETECTOR.start()
+    except Exception as e:
+        print(f'(signal_detector) not available: {str(e)}')
+        DETECTOR = None
+
+    return DETECTOR
+
+
+SHM_READER = None
+
+
+def read_signal():
+    """ The shared measurements (dictionary), empty if no detector is running:
+
+            peak_dBFS, rms_dBFS, rms_avg_dBFS, signal (boolean),
+            signal_age (s), threshold
+    """
+    global SHM_READER
+
+    if not SHM_READER:
+        try:
+            SHM_READER = shared_memory.SharedMemory( name=SHM_NAME )
+            # (i) Avoid that the resource tracker of this reader process
+            #     unlinks the shared memory when exiting.
+            if not DETECTOR:
+                resource_tracker.unregister(SHM_READER._name, 'shared_memory')
+        except Exception:
+            return {}
+
+    v = np.ndarray( (NVALUES,), dtype=np.float64, buffer=SHM_READER.buf )
+
+    # A consistent copy, retrying if the writer was in the middle
+    for _ in range(10):
+        seq = v[SEQ]
+        tmp = v.copy()
+        if seq % 2 == 0 and seq == v[SEQ]:
+            break
+
+    age = monotonic() - tmp[LAST_SIGNAL]
+
+    return  {   'peak_dBFS':    _dB( tmp[PEAK] ** 2 ),
+                'rms_dBFS':     _dB( tmp[MSQ] ),
+                'rms_avg_dBFS': _dB( tmp[MSQ_AVG] ),
+                'signal':       bool( age < 1.0 ),
+                'signal_age':   round( min(age, 1e6), 1 ),
+                'threshold':    float( tmp[THRESHOLD] )
+            }
+
+
+if __name__ == '__main__':
+
+    if sys.argv[1:]:
+        print(__doc__)
+        sys.exit()
+
+    while True:
+        print( read_signal() or '(signal_detector) not running' )
+        sleep(1)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" A write-behind persistence layer.
+
+    Writes are kept in memory and done in background after a short delay,
+    so that a burst of writes to the same file results in a single one.
+    This saves SD-card wear and watchdog events on other daemons.
+
+    Whole file writes are atomic (temp file + rename), so that readers
+    never find a partially written file.
+
+    (!) Call flush() before the process exits.
+"""
+
+import  os
+import  threading
+
+# Seconds to hold writes before flushing them to disk
+DELAY = 0.1
+
+# { path: ('w' | 'a', text) }
+PENDING     = {}
+LOCK        = threading.Lock()
+FLUSH_LOCK  = threading.Lock()
+TIMER       = None
+
+
+def _schedule():
+    """ (i) call it when holding LOCK
+    """
+    global TIMER
+
+    if TIMER is None:
+        TIMER = threading.Timer(DELAY, flush)
+        TIMER.daemon = True
+        TIMER.start()
+
+
+def _atomic_write(path, text):
+
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync( f.fileno() )
+
+    os.replace(tmp_path, path)
+
+
+def write_file(path, text):
+    """ Schedules to replace the whole file content
+    """
+    with LOCK:
+        PENDING[path] = ('w', text)
+        _schedule()
+
+
+def append_file(path, text):
+    """ Schedules to append text to a file
+    """
+    with LOCK:
+        mode, pending_text = PENDING.get( path, ('a', '') )
+        PENDING[path] = (mode, pending_text + text)
+        _schedule()
+
+
+def flush():
+    """ Writes to disk any pending write
+    """
+    global TIMER
+
+    with FLUSH_LOCK:
+
+        with LOCK:
+            pending = PENDING.copy()
+            PENDING.clear()
+            TIMER = None
+
+        for path, (mode, text) in pending.items():
+
+            try:
+                if mode == 'w':
+                    _atomic_write(path, text)
+                else:
+                    with open(path, 'a') as f:
+                        f.write(text)
+
+            except Exception as e:
+                print(f'(write_behind) ERROR writing \'{path}\': {str(e)}')
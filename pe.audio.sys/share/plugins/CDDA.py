@@ -60,7 +60,10 @@ def start():
         sys.exit()
     cmd = f'mplayer {options} -profile cdda -cdrom-device {CDROM_DEVICE}' \
           f' -input file={input_fifo}'
-    with open(redirection_path, 'w') as redirfile:
+    # (i) Append mode and cleared, so that players.py can truncate the file
+    #     when reaching its size cap (see miscel/log_follower.py)
+    with open(redirection_path, 'a') as redirfile:
+        redirfile.truncate(0)
         sp.Popen( cmd.split(), shell=False,
                   stdout=redirfile, stderr=redirfile )
 
@@ -213,10 +213,12 @@ def start():
 
     cmd = f'mplayer {MPLAYER_OPTIONS} -profile dvb -input file={INPUT_FIFO}'
 
-    # (i) The "redir" file grows about 200K per hour while running mplayer
-    with open(REDIR_PATH, 'w') as f:
+    # (i) The "redir" file grows about 200K per hour while running mplayer,
+    #     so it is opened in append mode, then players.py can truncate it
+    #     when reaching its size cap (see miscel/log_follower.py)
+    with open(REDIR_PATH, 'a') as f:
         # clearing the file for this session
-        f.write('')
+        f.truncate(0)
         Popen( cmd.split(), shell=False, stdout=f, stderr=f )
 
 
@@ -119,7 +119,10 @@ def start():
         sys.exit()
     cmd = f'mplayer {options} -profile istreams \
            -input file={input_fifo}'
-    with open(redirection_path, 'w') as redirfile:
+    # (i) Append mode and cleared, so that players.py can truncate the file
+    #     when reaching its size cap (see miscel/log_follower.py)
+    with open(redirection_path, 'a') as redirfile:
+        redirfile.truncate(0)
         Popen( cmd.split(), shell=False, stdout=redirfile, stderr=redirfile )
 
 
@@ -5,16 +5,33 @@
 # 'pe.audio.sys', a PC based personal audio system.
 """
     Communicates with an LCDd driver
+
+    Commands are pipelined: they are written without waiting for the
+    previous answers, which are drained by a reader thread in order.
+
+    Widgets text is kept in a shadow framebuffer, so that only the
+    changed widgets are transmitted (see widget_set and flush).
 """
 
 # https://manpages.debian.org/testing/lcdproc/LCDd.8.en.html
 # http://lcdproc.sourceforge.net/docs/current-dev.html
 
 import socket
+import threading
+from collections import deque
+
+
+# Unsolicited messages from LCDd, not being answers to commands
+EVENTS = ('listen', 'ignore', 'key', 'menuevent')
 
 
 class Client:
     """ A LCDd client
+
+        .send(msg)          sends a command and waits for its answer
+        .post(*msgs)        sends commands at once, not waiting for answers
+        .widget_set(...)    queues a widget update if its text has changed
+        .flush()            sends the queued widget updates at once
     """
 
     def __init__(self, cname='lcd_cli', host="localhost", port=13666, verbose=False):
@@ -24,8 +41,16 @@ class Client:
         self.verbose        = verbose
         self.error          = False
         self.LCDd_timeout   = .1
+        self.answer_timeout = 1.0
         self.cli            = None
         self.lector         = None
+        # What to do with the answers of the sent commands, in order:
+        #   None, a widget key to forget if failed, or a [Event, answer] waiter
+        self.pending        = deque()
+        self.wlock          = threading.Lock()
+        # The shadow framebuffer { (screen, widget): 'args' }
+        self.shadow         = {}
+        self.batch          = []
 
         if self.verbose:
             print('(lcd_client) VERBOSE MODE')
@@ -41,12 +66,22 @@ class Client:
             self.cli.connect( (self.host, self.port) )
             if self.verbose:
                 print(f'(lcd_client) Connected to the LCDd driver.')
+            # the reader thread blocks waiting for answers
+            self.cli.settimeout(None)
             self.lector = self.cli.makefile('r', encoding='utf-8')
+
+            # A new LCDd session
+            self.pending.clear()
+            self.shadow.clear()
+            self.batch = []
+
+            threading.Thread( target=self._reader, args=(self.lector,),
+                              daemon=True ).start()
             return True
 
         except Exception as e:
             print(f'(lcd_client) Error connecting to the LCDd driver: {str(e)}')
-            selfclose()
+            self.close()
             self.error = True
             return False
 
@@ -58,38 +93,118 @@ class Client:
         print("(lcd_client) connection closed")
 
 
-    def send( self, msg ):
-        """ sends a message to LCDd andn returns the received answer
+    def _reader(self, lector):
+        """ Drains the LCDd answers, matching them to the sent commands
+        """
+        try:
+            for line in lector:
+
+                ans = line.strip()
+
+                if ans.split(' ')[0] in EVENTS:
+                    continue
+
+                if self.verbose:
+                    print(f'(lcd_client) received: {ans}')
+
+                try:
+                    todo = self.pending.popleft()
+                except IndexError:
+                    continue
+
+                # a blocking send() is waiting for it
+                if type(todo) == list:
+                    todo[1] = ans
+                    todo[0].set()
+
+                # a widget not updated, it will be sent again
+                elif todo and 'huh?' in ans:
+                    self.shadow.pop(todo, None)
+
+        except Exception:
+            pass
+
+        # (i) a previous connection reader just ends
+        if lector is self.lector:
+            self.error = True
+            # releasing the waiting ones
+            while self.pending:
+                todo = self.pending.popleft()
+                if type(todo) == list:
+                    todo[0].set()
+
+
+    def _write(self, msgs, todos):
+        """ Sends the messages at once, registering what to do with
+            their answers
         """
+        data = ''.join( [ f'{x}\n' for x in msgs ] ).encode()
 
-        def send( msg ):
+        with self.wlock:
             try:
-                self.cli.sendall( f'{msg}\n'.encode() )
+                # (i) before sending, the answers can arrive very fast
+                self.pending.extend(todos)
+                self.cli.sendall( data )
                 if self.verbose:
-                    print(f'(lcd_client) sent: {msg}')
+                    for msg in msgs:
+                        print(f'(lcd_client) sent: {msg}')
                 return True
+
             except Exception as e:
                 print(f'(lcd_client) send ERROR: {str(e)}')
                 self.error = True
                 return False
 
 
-        def received():
-            """ read a line response from LCDd """
-            ans = ''
-            if self.lector:
-                line = self.lector.readline()
-                ans = line.strip()
-                if self.verbose:
-                    print(f'(lcd_client) received: {ans}')
-            return ans
+    def send( self, msg ):
+        """ sends a message to LCDd and returns the received answer
+        """
+        waiter = [ threading.Event(), '' ]
 
+        if not self._write( [msg], [waiter] ):
+            return ''
 
-        if send(msg):
-            return received()
+        if not waiter[0].wait(self.answer_timeout):
+            print(f'(lcd_client) no answer to: {msg}')
 
-        else:
-            return ''
+        return waiter[1]
+
+
+    # (i) used by create_screen, delete_screen and lcdbig.py
+    query = send
+
+
+    def post( self, *msgs ):
+        """ sends messages to LCDd at once, the answers are discarded
+        """
+        if msgs:
+            return self._write( msgs, [None] * len(msgs) )
+        return True
+
+
+    def widget_set( self, screen, widget, args ):
+        """ queues a 'widget_set screen widget args' command,
+            only if args differ from the last ones sent (see flush)
+        """
+        key = (screen, widget)
+
+        if self.shadow.get(key) == args:
+            return False
+
+        self.shadow[key] = args
+        self.batch.append( (key, f'widget_set {screen} {widget} {args}') )
+        return True
+
+
+    def flush( self ):
+        """ sends the queued widget updates at once
+        """
+        if not self.batch:
+            return True
+
+        batch, self.batch = self.batch, []
+
+        return self._write( [ x[1] for x in batch ], [ x[0] for x in batch ] )
 
 
     def register( self ):
@@ -121,22 +236,25 @@ class Client:
 
 
     def delete_screen( self, sname ):
-        self.query( f'screen_del {sname}' )
+        self.post( f'screen_del {sname}' )
+        for key in [ k for k in self.shadow if k[0] == sname ]:
+            del self.shadow[key]
 
 
     def create_screen( self, sname, priority="info", duration=3, timeout=0 ):
         # duration: A screen will be visible for this amount of time every rotation (1/8 sec)
         # timeout:  After the screen has been visible for a total of this amount of time,
         #           it will be deleted (1/8 sec)
-        self.query( f'screen_add {sname}' )
-        duration *= 8
-        timeout = str(timeout  * 8)
-        self.query( f'screen_set {sname} -cursor no' )
-        self.query( f'screen_set {sname} priority {priority}' )
+        duration = str(duration * 8)
+        timeout  = str(timeout  * 8)
+        msgs = [ f'screen_add {sname}',
+                 f'screen_set {sname} -cursor no',
+                 f'screen_set {sname} priority {priority}' ]
         if duration != "0":
-            self.query( f'screen_set {sname} duration {duration}' )
+            msgs.append( f'screen_set {sname} duration {duration}' )
         if timeout != "0":
-            self.query( f'screen_set {sname} timeout {timeout}' )
+            msgs.append( f'screen_set {sname} timeout {timeout}' )
+        self.post( *msgs )
 
 
 if __name__ == "__main__":
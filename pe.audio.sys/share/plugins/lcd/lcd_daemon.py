@@ -7,10 +7,7 @@
 """
     A daemon that displays pe.audio.sys info on LCD
 """
-# This module is based on monitoring file changes under the pe.audio.sys folder
-#   https://watchdog.readthedocs.io/en/latest/
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+# This module is based on subscribing to the pe.audio.sys event bus
 import lcd_client
 #import lcdbig # NOT USED, displays the level value in full size
 import os
@@ -23,10 +20,12 @@ UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
 from miscel import *
+import event_bus
 
 ## Auxiliary globals
 state         = { 'lu_offset': 0 }
 last_warning  = ''
+last_clips    = []
 last_metadata = {}
 last_lu_I     = 0
 
@@ -39,46 +38,51 @@ except:
     exit()
 
 
-class Changed_files_handler(FileSystemEventHandler):
-    """ This is a handler that will do something when some file has changed
+def on_bus_event(topic, data, changes):
+    """ A callback for the pe.audio.sys event bus subscription
     """
+    if verbose:
+        print( f'(lcd_daemon) EVENT {topic}: {changes}' )
 
-    def on_modified(self, event):
+    # (i) data is updated in place by the subscription,
+    #     so a copy is needed to detect later changes.
+    if topic == 'state':
+        update_lcd_state( new_state=dict(data) )
 
-        if event.is_directory:
-            return
+    elif topic == 'metadata':
+        update_lcd_metadata( md=dict(data) )
 
-        path = event.src_path
-        if verbose:
-            print( f'(lcd_daemon) EVENT {event.event_type}: \'{path}\'' )
+    elif topic == 'loudness':
+        update_lcd_loudness_monitor( ld_mon=dict(data) )
 
-        # pe.audio.sys STATE changes
-        if STATE_PATH in path:
-            update_lcd_state()
+    elif topic == 'warnings':
+        show_new_warning( data.get('warning', '') )
 
-        # METADATA perodically updated file by players.py
-        if PLAYER_META_PATH in path:
-            update_lcd_metadata()
+    elif topic == 'way_levels':
+        show_way_clipping( dict(data) )
 
-        # LOUDNESS MONITOR
-        if path in (LDMON_PATH):
-            update_lcd_loudness_monitor()
+    elif topic == 'aux':
+        if 'signal' in changes:
+            # (i) 'signal' is the detector measurements dict
+            update_lcd_signal( data.get('signal', {}).get('signal', False) )
 
-        # TEMPORARY WARNINGS
-        if AUX_INFO_PATH in path:
-            show_new_warning()
+    check_LCD_error()
 
-        if not LCD.error:
-            return
 
-        print('(lcd_daemon) *!* detected LCDd.error')
-        n = 3
-        while n:
-            print('(lcd_daemon) reconnecting to LCDd ...')
-            if connect2LCDd():
-                break
-            sleep(.1)
-            n -= 1
+def check_LCD_error():
+    """ Reconnects to LCDd if needed
+    """
+    if not LCD.error:
+        return
+
+    print('(lcd_daemon) *!* detected LCDd.error')
+    n = 3
+    while n:
+        print('(lcd_daemon) reconnecting to LCDd ...')
+        if connect2LCDd():
+            break
+        sleep(.1)
+        n -= 1
 
 
 class Widgets(object):
@@ -89,7 +93,7 @@ class Widgets(object):
     #
     # 1     v:-15.0  bl:-1  MONO
     # 2     b:+1 t:-2  LUref: 12
-    # 3     inputname  LUmon: 12
+    # 3     inputname* LUmon: 12
     # 4     ..metadata_marquee..
     #
     # The widget collection definition
@@ -98,6 +102,9 @@ class Widgets(object):
     # If position is set to '0 0' the widget will not be displayed
     #
     # (i) widget names can be directly MAPPED to pe.audio.sys variables
+    #
+    # 'signal' shows '*' after the input name when the signal detector
+    # finds some audio signal (aux info from peaudiosys server)
 
     def __init__(self):
 
@@ -122,7 +129,8 @@ class Widgets(object):
                 }
 
         self.aux = {
-                'loudness_monitor'  : { 'pos':'12 2',    'val':'LUmon:'     }
+                'loudness_monitor'  : { 'pos':'12 2',    'val':'LUmon:'     },
+                'signal'            : { 'pos':'11 3',    'val':'*'          }
                 }
 
         self.meta = {
@@ -136,6 +144,10 @@ class Widgets(object):
                 }
 
 
+# The widgets layout (positions and labels)
+WIDGETS = Widgets()
+
+
 def show_temporary_screen( message, timeout=LCD_CONFIG['info_screen_timeout'] ):
     """An additional screen to display temporary information"""
 
@@ -154,43 +166,47 @@ def show_temporary_screen( message, timeout=LCD_CONFIG['info_screen_timeout'] ):
         # lcdproc manages 1/8 seconds
         timeout = 8 * timeout
 
+        msgs = []
+
         # Will try to define the screen, if already exist will receive 'huh?'
         ans = LCD.send('screen_add scr_info')
         if 'huh?' not in ans:
-            LCD.send(f'screen_set scr_info -cursor no -priority foreground ' + \
-                     f'-timeout {str(timeout)}' )
-            LCD.send('widget_add scr_info info_tit title')
-            LCD.send('widget_add scr_info info_txt2 string')
-            LCD.send('widget_add scr_info info_txt3 string')
-            LCD.send('widget_add scr_info info_txt4 string')
+            msgs += [ 'screen_set scr_info -cursor no -priority foreground ' + \
+                      f'-timeout {str(timeout)}',
+                      'widget_add scr_info info_tit title',
+                      'widget_add scr_info info_txt2 string',
+                      'widget_add scr_info info_txt3 string',
+                      'widget_add scr_info info_txt4 string' ]
 
         # Define the screen title (at line 1)
-        LCD.send('widget_set scr_info info_tit "pe.audio.sys info:"')
+        msgs.append('widget_set scr_info info_tit "pe.audio.sys info:"')
 
         # Display the temporary message
         line = 2
         for data in split_by_n(message, 20):
-            LCD.send('widget_set scr_info info_txt' + str(line) + ' 1 ' +
-                     str(line) + ' "' + data + '"')
+            msgs.append('widget_set scr_info info_txt' + str(line) + ' 1 ' +
+                        str(line) + ' "' + data + '"')
             line += 1
             if line > 4:
                 break
 
+        # (i) the scr_info screen expires, so it is not shadowed
+        LCD.post( *msgs )
+
     except Exception as e:
         print(f'(lcd_daemon) Error cannot show temporary message "{message}": {str(e)}')
 
 
-def show_new_warning():
+def show_new_warning(curr_warn=None):
     """ This checks for pe.audio.sys temporary warnings
-        changes (looks inside AUX_INFO_PATH)
+        changes (looks inside AUX_INFO_PATH if not given)
     """
 
     global last_warning
 
-    curr_warn = ''
-
-    aux_info = read_json_from_file(AUX_INFO_PATH, 0.5)
-    curr_warn = aux_info.get('warning', '')
+    if curr_warn is None:
+        aux_info = read_json_from_file(AUX_INFO_PATH, 0.5)
+        curr_warn = aux_info.get('warning', '')
 
     if curr_warn and curr_warn != last_warning:
         if curr_warn:
@@ -200,33 +216,66 @@ def show_new_warning():
     return
 
 
+def show_way_clipping(levels):
+    """ Shows the Brutefir ways being clipped, from the way_meter.py
+        plugin snapshots
+    """
+
+    global last_clips
+
+    clips = levels.get('clips', [])
+    ways  = levels.get('ways', [])
+
+    if len(clips) != len(last_clips):
+        last_clips = clips
+        return
+
+    clipped = [ w for w, c, c0 in zip(ways, clips, last_clips) if c > c0 ]
+    last_clips = clips
+
+    if clipped:
+        show_temporary_screen( f'CLIP {" ".join(clipped)}', timeout=2 )
+
+
+def update_lcd_signal(signal, scr='scr_1'):
+    """ Shows the signal detector indicator """
+
+    pos = WIDGETS.aux['signal']['pos']
+    lbl = WIDGETS.aux['signal']['val'] if signal else ' '
+
+    LCD.widget_set( scr, 'signal', f'{pos} "{lbl}"' )
+    LCD.flush()
+
+
 def prepare_main_screen():
 
     # Adding the screen itself:
-    LCD.send('screen_add scr_1')
+    msgs = [ 'screen_add scr_1' ]
 
     # Adding widgets to the main screen:
     # (i) not all them will be used
-    ws = Widgets()
+    ws = WIDGETS
     for w in ws.state:
-        LCD.send( f'widget_add scr_1 {w} string' )
+        msgs.append( f'widget_add scr_1 {w} string' )
     for w in ws.aux:
-        LCD.send( f'widget_add scr_1 {w} string' )
+        msgs.append( f'widget_add scr_1 {w} string' )
     for w in ws.meta:
-        LCD.send( f'widget_add scr_1 {w} string' )
+        msgs.append( f'widget_add scr_1 {w} string' )
     for w in ws.scroller:
-        LCD.send( f'widget_add scr_1 {w} scroller' )
+        msgs.append( f'widget_add scr_1 {w} scroller' )
 
+    LCD.post( *msgs )
 
-def update_lcd_state(scr='scr_1'):
-    """ Reads system .state file, then updates the LCD """
+
+def update_lcd_state(scr='scr_1', new_state=None):
+    """ Reads system .state file if not given, then updates the LCD """
     # http://lcdproc.sourceforge.net/docs/lcdproc-0-5-5-user.html
 
     global state
 
     def show_state(priority="info"):
 
-        ws = Widgets()
+        ws = WIDGETS
 
         global equal_loudness
 
@@ -280,24 +329,32 @@ def update_lcd_state(scr='scr_1'):
                 if 'convolver_runs' in state and not state['convolver_runs']:
                     lbl = ' zzz' # brutefir is sleeping
 
+            # Special case: input leaves room for the signal indicator
+            elif key == 'input':
+                lbl += str(value)[:10]
+
             # Any else key:
             else:
                 lbl += str(value)
 
             # sintax for string widgets:
             #   widget_set screen widget coordinate "text"
-            cmd = f'widget_set {scr} {key} {pos} "{lbl}"'
-            LCD.send( cmd )
+            # (i) only sent if changed
+            LCD.widget_set( scr, key, f'{pos} "{lbl}"' )
+
+        # All changed widgets at once
+        LCD.flush()
 
         # The big screen to display the level value
         #lcdbig.show_level( str(state['level']) )
         pass
 
     # Reading state
-    try:
-        new_state = read_state_from_disk()
-    except:
-        return
+    if new_state is None:
+        try:
+            new_state = read_state_from_disk()
+        except:
+            return
 
     # If changed
     if new_state != state:
@@ -310,17 +367,18 @@ def update_lcd_state(scr='scr_1'):
         # update global state
         state = new_state
 
-        # refreshing the LU monitor bar in LCD if needed
+        # refreshing the LU monitor bar in LCD if needed,
+        # it will be flushed along with the state widgets
         if LCD_CONFIG["LUmon_bar"]:
-            update_lcd_loudness_monitor()
+            update_lcd_loudness_monitor(flush=False)
 
         # refresh state items in LCD
         show_state()
 
 
-def update_lcd_loudness_monitor(scr='scr_1'):
+def update_lcd_loudness_monitor(scr='scr_1', ld_mon=None, flush=True):
     """ Reads the monitored value from the file .loudness_monitor
-        then updates the LCD display.
+        if not given, then updates the LCD display.
 
         Optionally, a LU meter bar will be displayed, having an inserted
         marker as per the selected LU reference offset.
@@ -330,7 +388,8 @@ def update_lcd_loudness_monitor(scr='scr_1'):
 
     global last_lu_I
 
-    ld_mon = read_json_from_file(LDMON_PATH)
+    if ld_mon is None:
+        ld_mon = read_json_from_file(LDMON_PATH)
     lu_I = ld_mon.get('LU_I', None)
 
     if lu_I != last_lu_I:
@@ -345,7 +404,7 @@ def update_lcd_loudness_monitor(scr='scr_1'):
     # LU monitor and reference as numbers option:
     if not LCD_CONFIG["LUmon_bar"]:
 
-        ws   = Widgets()
+        ws   = WIDGETS
         pos  = ws.aux[wdg]['pos']
         lbl  = ws.aux[wdg]['val']
 
@@ -383,12 +442,13 @@ def update_lcd_loudness_monitor(scr='scr_1'):
         # Inserting the marker
         lbl = lbl[:p] + '*' + lbl[p+1:]
 
-    cmd = f'widget_set {scr} {wdg} {pos} "{lbl}"'
-    LCD.send( cmd )
+    LCD.widget_set( scr, wdg, f'{pos} "{lbl}"' )
+    if flush:
+        LCD.flush()
 
 
-def update_lcd_metadata(scr='scr_1'):
-    """ Reads the metadata dict then updates the LCD display marquee """
+def update_lcd_metadata(scr='scr_1', md=None):
+    """ Reads the metadata dict if not given, then updates the LCD display marquee """
     # http://lcdproc.sourceforge.net/docs/lcdproc-0-5-5-user.html
 
     global last_metadata
@@ -403,7 +463,8 @@ def update_lcd_metadata(scr='scr_1'):
 
 
     # Trying to read the metadata file, or early return if failed
-    md = read_metadata_from_disk()
+    if md is None:
+        md = read_metadata_from_disk()
     if not md:
         return
 
@@ -421,7 +482,7 @@ def update_lcd_metadata(scr='scr_1'):
     # with artist+album+title to be displayed on the LCD bottom line marquee.
     marquee = compose_marquee(md)
 
-    ws = Widgets()
+    ws = WIDGETS
     pos =   ws.scroller['bottom_marquee']['pos']
     lbl =   ws.scroller['bottom_marquee']['val']
     lbl +=  str(marquee)
@@ -437,9 +498,9 @@ def update_lcd_metadata(scr='scr_1'):
 
     # sintax for scroller widgets:
     # widget_set screen widget left top right bottom direction speed "text"
-    cmd = f'widget_set {scr} bottom_marquee {left} {top} {right} {bottom} ' + \
-          f'{direction} {speed} "{lbl}"'
-    LCD.send( cmd )
+    LCD.widget_set( scr, 'bottom_marquee',
+                    f'{left} {top} {right} {bottom} {direction} {speed} "{lbl}"' )
+    LCD.flush()
 
 
 def connect2LCDd():
@@ -496,16 +557,11 @@ if __name__ == "__main__":
     update_lcd_loudness_monitor()
     update_lcd_metadata()
 
-    # Starts a WATCHDOG to observe file changes
-    #   https://watchdog.readthedocs.io/en/latest/
-    #   https://stackoverflow.com/questions/18599339/
-    #   python-watchdog-monitoring-file-for-changes
-    #   Use recursive=True to observe also subfolders
-    #  (i) Even observing recursively the CPU load is negligible
-    observer = Observer()
-    observer.schedule(event_handler=Changed_files_handler(),
-                      path=MAINFOLDER,
-                      recursive=False)
-    observer.start()
-    obsloop = threading.Thread( target=observer.join() )
-    obsloop.start()
+    # Subscribing to the pe.audio.sys event bus
+    # (i) plugins are started before the server, the subscription
+    #     keeps retrying until the bus is available.
+    print( '(lcd_daemon) subscribing to the event bus' )
+    event_bus.subscribe( ('state', 'metadata', 'loudness', 'warnings',
+                          'way_levels', 'aux'),
+                         on_bus_event )
+    threading.Event().wait()
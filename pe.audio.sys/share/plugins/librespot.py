@@ -86,6 +86,12 @@ def start():
 
     eventsPath = f'{UHOME}/pe.audio.sys/.librespot_events'
 
+    # A fresh player state, see librespot/librespot_event.py
+    try:
+        os.remove(f'{UHOME}/pe.audio.sys/.librespot_state')
+    except OSError:
+        pass
+
     with open(eventsPath, 'a') as f:
         Popen( cmd.split(), stdout=f, stderr=f )
 
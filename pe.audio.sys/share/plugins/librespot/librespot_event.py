@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    The librespot event receiver, called from log_and_bind_ports.sh
+    (the librespot --onevent program).
+
+    librespot provides the event as environment variables:
+
+        PLAYER_EVENT, TRACK_ID, DURATION_MS, POSITION_MS, VOLUME
+        NAME, ARTISTS, ALBUM, URI   (track_changed event, librespot >= 0.5)
+
+    The event is merged into the player state, which is kept in json format
+    at ~/pe.audio.sys/.librespot_state, the file being atomically replaced.
+    So the state is read by players_mod/librespot.py without any log
+    scanning.
+
+    State fields:
+
+        event           the last event
+        play            'play' | 'pause' | 'stop'
+        track_id        spotify track id
+        name, artists, album
+        duration_ms
+        position_ms     the position at position_ts (epoch seconds)
+"""
+
+import  os
+import  json
+import  fcntl
+from    time import time
+
+UHOME       = os.path.expanduser("~")
+STATE_PATH  = f'{UHOME}/pe.audio.sys/.librespot_state'
+LOCK_PATH   = f'{UHOME}/pe.audio.sys/.librespot_state.lock'
+
+# Events that change the playing state
+PLAY_EVENTS = { 'started':      'play',
+                'playing':      'play',
+                'paused':       'pause',
+                'stopped':      'stop',
+                'unavailable':  'stop',
+                'end_of_track': 'stop' }
+
+# Events of a new track
+TRACK_EVENTS = ('changed', 'track_changed', 'loading')
+
+
+def read_state():
+    try:
+        with open(STATE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(state):
+    """ Atomic replace, so readers never see a partial file """
+    tmp = f'{STATE_PATH}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE_PATH)
+
+
+def merge_event(state, env):
+
+    event = env.get('PLAYER_EVENT', '').lower()
+    if not event:
+        return state
+
+    now = time()
+    state['event'] = event
+
+    track_id = env.get('TRACK_ID')
+
+    if event in TRACK_EVENTS or \
+       ( track_id and track_id != state.get('track_id') ):
+
+        # a new track, forget the old one fields
+        if track_id != state.get('track_id'):
+            for k in ('name', 'artists', 'album', 'duration_ms'):
+                state.pop(k, None)
+
+        state['position_ms'] = 0
+        state['position_ts'] = now
+
+    if track_id:
+        state['track_id'] = track_id
+
+    if 'NAME' in env:
+        state['name']    = env['NAME']
+        # (i) one artist per line
+        state['artists'] = ', '.join( env.get('ARTISTS', '').split('\n') )
+        state['album']   = env.get('ALBUM', '')
+
+    if env.get('DURATION_MS', '').isdigit():
+        state['duration_ms'] = int( env['DURATION_MS'] )
+
+    if env.get('POSITION_MS', '').isdigit():
+        state['position_ms'] = int( env['POSITION_MS'] )
+        state['position_ts'] = now
+
+    if 'VOLUME' in env:
+        state['volume'] = env['VOLUME']
+
+    if event in PLAY_EVENTS:
+
+        # keep the position estimate when the hook does not provide it
+        if state.get('play') == 'play' and not 'POSITION_MS' in env:
+            state['position_ms'] = state.get('position_ms', 0) + \
+                        int( 1000 * (now - state.get('position_ts', now)) )
+            state['position_ts'] = now
+
+        state['play'] = PLAY_EVENTS[event]
+
+    return state
+
+
+if __name__ == "__main__":
+
+    # librespot can run hooks concurrently
+    with open(LOCK_PATH, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        write_state( merge_event( read_state(), os.environ ) )
@@ -18,6 +18,9 @@
 #       changed
 #       volume_set
 #
+# The event is merged into the ~/pe.audio.sys/.librespot_state json file
+# (see librespot_event.py), which players.py reads for metadata.
+#
 # Binding ports to JACK is necessary because the libresport JACKAUDIO backend behavoir:
 #   - The jack port does not emerge until first time playing.
 #   - There is not any option to autoconnect to any destination jack port.
@@ -45,6 +48,10 @@ else
 fi
 
 
+# The player state for players.py
+python3 "$(dirname "$0")/librespot_event.py"
+
+
 # Binding Jack ports
 if [[ $PLAYER_EVENT == "started" || $PLAYER_EVENT == "playing" || $PLAYER_EVENT == "changed" ]]; then
 
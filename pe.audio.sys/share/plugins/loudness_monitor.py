@@ -15,17 +15,15 @@ from subprocess import Popen
 from time import sleep
 import json
 import threading
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 
 UHOME           = os.path.expanduser("~")
 MAINFOLDER      = f'{UHOME}/pe.audio.sys'
 sys.path.append(f'{MAINFOLDER}/share')
 sys.path.append(f'{MAINFOLDER}/share/miscel')
 
-from config import  CONFIG, USER, STATE_PATH, LDMON_PATH, LDCTRL_PATH, \
-                    PLAYER_META_PATH
-from miscel import  read_state_from_disk, read_metadata_from_disk
+from config import  CONFIG, USER, LDMON_PATH, LDCTRL_PATH
+from miscel import  read_state_from_disk
+import event_bus
 
 
 # for printouts
@@ -72,8 +70,8 @@ def control_fifo_read_loop(fname, meter):
                         save2disk()
 
 
-class My_files_event_handler(FileSystemEventHandler):
-    """ A file changes handler that will reset the meter when:
+class My_bus_event_handler(object):
+    """ An event bus subscription handler that will reset the meter when:
         - input preamp changes
         - playing metadata album or track changes versus the scope value
     """
@@ -82,34 +80,38 @@ class My_files_event_handler(FileSystemEventHandler):
         self.meter            = meter  # We need to be able to reset the meter.
         self.last_album_track = ''     # Memorize last album or track
 
-    def on_modified(self, event):
+    def on_bus_event(self, topic, data, changes):
 
-        global source, scope
+        if topic == 'state' and 'input' in changes:
+            self.check_source( data['input'] )
 
-        path = event.src_path
+        elif topic == 'metadata':
+            self.check_metadata( data )
 
-        # Check if preamp input has changed, then RESET
-        if STATE_PATH in path:
-            new_source = read_state_from_disk()['input']
-            if source != new_source:
-                source = new_source
-                self.meter.reset()
-                sleep(.25)      # anti bouncing
+    def check_source(self, new_source):
+        """ Check if preamp input has changed, then RESET
+        """
+        global source
 
-        # Check if metadata album or title has changed, then RESET
-        if PLAYER_META_PATH in path:
-            md = read_metadata_from_disk()
-            if not md:
-                return
-            # Ignore if scope is not a metadata field name
-            if not scope in ('album', 'track'):
-                return
-            # (i) 'track' is named 'title' in pe.audio.sys metadata fields
-            md_key = scope if (scope != 'track') else 'title'
-            if md[md_key] != self.last_album_track:
-                self.last_album_track = md[md_key]
-                self.meter.reset()
-                sleep(.25)      # anti bouncing
+        if source != new_source:
+            source = new_source
+            self.meter.reset()
+            sleep(.25)      # anti bouncing
+
+    def check_metadata(self, md):
+        """ Check if metadata album or title has changed, then RESET
+        """
+        if not md:
+            return
+        # Ignore if scope is not a metadata field name
+        if not scope in ('album', 'track'):
+            return
+        # (i) 'track' is named 'title' in pe.audio.sys metadata fields
+        md_key = scope if (scope != 'track') else 'title'
+        if md.get(md_key) != self.last_album_track:
+            self.last_album_track = md.get(md_key)
+            self.meter.reset()
+            sleep(.25)      # anti bouncing
 
 
 def get_configured_scope():
@@ -168,6 +170,7 @@ def save2disk():
         M_LU = M_LU // meter.M_threshold * meter.M_threshold
         d = { "LU_I":  I_LU, "LU_M":  M_LU, "scope": scope }
         f.write( json.dumps(d, indent=2) )
+    event_bus.publish( 'loudness', d )
 
 
 if __name__ == '__main__':
@@ -220,18 +223,14 @@ if __name__ == '__main__':
                                 args=(LDCTRL_PATH, meter) )
     control.start()
 
-    # Threading an Observer watchdog for file changes, and passing our meter
-    # instance reference in order to reset measurements if necessary.
-    #   https://watchdog.readthedocs.io/en/latest/
-    #   https://stackoverflow.com/questions/18599339/
-    #   python-watchdog-monitoring-file-for-changes
-    #   Use recursive=True to observe also subfolders
-    #  (i) Even observing recursively the CPU load is negligible
-    observer = Observer()
-    observer.schedule( event_handler=My_files_event_handler( meter ),
-                       path=MAINFOLDER, recursive=False )
-    obsthread = threading.Thread( target=observer.start() )
-    obsthread.start()
+    # The handler has our meter instance reference
+    # in order to reset measurements if necessary.
+    handler = My_bus_event_handler( meter )
+
+    # Subscribing to the pe.audio.sys event bus
+    # (i) plugins are started before the server, the subscription
+    #     keeps retrying until the bus is available.
+    event_bus.subscribe( ('state', 'metadata'), handler.on_bus_event )
 
     # 1st writing the output file
     save2disk()
@@ -14,13 +14,23 @@
     A newcoming remote listener machine will need to send 'hello'
     to this daemon at port <peaudiosys_base_port> + 5 (usually 9995)
 
+    The preamp level, LU offset and loudness changes are received from
+    the event bus 'state' topic.
+
+    Each remote is commanded by its own thread over a persistent
+    connection with a short timeout, so a slow or dead remote does not
+    delay the others. The 'status' command gives the remotes health.
+
+    Whether a remote is still listening to its *remote* source is checked
+    every LISTEN_CHECK seconds, not before every command.
+
 """
 
 from    subprocess import Popen
 from    time import time
 import  socket
-from    watchdog.observers import Observer
-from    watchdog.events import FileSystemEventHandler
+import  threading
+from    concurrent.futures import ThreadPoolExecutor
 import  sys
 import  os
 import  json
@@ -30,10 +40,8 @@ sys.path.append( f'{UHOME}/pe.audio.sys/share/miscel' )
 
 import  server
 from    config  import CONFIG, USER
-from    miscel  import send_cmd, read_last_line, read_state_from_disk
-
-LOG_DIR         = f'{UHOME}/pe.audio.sys/log'
-CMD_LOG_PATH    = f'{LOG_DIR}/peaudiosys_cmd.log'
+from    miscel  import send_cmd, read_state_from_disk
+import  event_bus
 
 
 # ------------- USER CONFIG --------------
@@ -41,32 +49,250 @@ CMD_LOG_PATH    = f'{LOG_DIR}/peaudiosys_cmd.log'
 REMOTES_ADDR_RANGE = range(230, 240)
 # ----------------------------------------
 
+# Socket timeout when talking to a remote (seconds)
+TIMEOUT         = 1.0
+# Seconds before retrying a remote that has failed
+RETRY           = 5.0
+# Consecutive failures before forgetting a remote
+MAX_FAILS       = 3
+# Seconds the remote listening state is trusted before querying it again
+LISTEN_CHECK    = 10.0
+
+# The remote listeners { addr: RemotePeer }
+REMOTES         = {}
+
+# The local preamp state, as per the event bus 'state' topic
+STATE           = {}
+
+# (i) A single lock for STATE and every peer pending commands, so that
+#     a full levels sync and a level delta are never both applied.
+LOCK            = threading.RLock()
+
+
+class RemotePeer:
+    """ A remote listener pe.audio.sys, commanded by its own thread over
+        a persistent 'keepalive' connection (see server.py).
+
+        Pending commands are coalesced until sent: level deltas are summed,
+        other settings keep the last value.
+
+        .health     'up' | 'down' | 'legacy' (a one shot connection server)
+    """
+
+    def __init__(self, addr, port=CONFIG['peaudiosys_port']):
+
+        self.addr       = addr
+        self.port       = port
+        self.sock       = None
+        self.rfile      = None
+        self.legacy     = False
+        self.health     = 'up'
+        self.fails      = 0
+        self.retry_at   = 0.0
+        # last time the remote was seen listening
+        self.listen_ts  = 0.0
+
+        # pending commands
+        self.delta      = 0.0
+        self.settings   = {}
+        self.full       = False
+        self.dropped    = False
+        self.cond       = threading.Condition(LOCK)
+
+        threading.Thread( target=self._run, daemon=True ).start()
+
+
+    def post_level_delta(self, delta):
+        with self.cond:
+            self.delta += delta
+            self.cond.notify()
+
+
+    def post_setting(self, cmd, value):
+        with self.cond:
+            self.settings[cmd] = value
+            self.cond.notify()
+
+
+    def post_full_sync(self):
+        with self.cond:
+            self.full = True
+            self.cond.notify()
+
+
+    def drop(self):
+        with self.cond:
+            self.dropped = True
+            self.cond.notify()
+
+
+    def _has_work(self):
+        return self.dropped or self.full or self.delta or self.settings
+
+
+    def _take(self):
+        """ The pending commands in order, then clears them
+            (i) call it when holding the lock
+        """
+        if self.full:
+            cmds = [ f'lu_offset {STATE["lu_offset"]}',
+                     f'loudness {STATE["equal_loudness"]}',
+                     f'level {STATE["level"]}' ]
+
+        else:
+            cmds = [ f'{cmd} {value}' for cmd, value in self.settings.items() ]
+            if self.delta:
+                cmds.append( f'level {round(self.delta, 3):g} add' )
+
+        self.full     = False
+        self.delta    = 0.0
+        self.settings = {}
+
+        return cmds
+
+
+    def _close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock  = None
+        self.rfile = None
+
+
+    def _query(self, cmds):
+        """ Sends commands in a single round trip, returns the answers
+        """
+        if self.legacy:
+            return [ send_cmd( c, host=self.addr, port=self.port,
+                               timeout=TIMEOUT ) for c in cmds ]
+
+        fresh = not self.sock
+
+        if fresh:
+            self.sock  = socket.create_connection( (self.addr, self.port),
+                                                   timeout=TIMEOUT )
+            self.rfile = self.sock.makefile('rb')
+            self.sock.sendall( b'keepalive\n' )
+
+        self.sock.sendall( ''.join( f'{c}\n' for c in cmds ).encode() )
+
+        answers = []
+
+        for _ in cmds:
+
+            line = self.rfile.readline()
+            if not line:
+                raise ConnectionError('connection closed by remote')
+
+            try:
+                answers.append( str( json.loads(line) ) )
+
+            except ValueError:
+                # A server without the 'keepalive' mode
+                if fresh:
+                    print( f'(remote_volume) remote {self.addr} does not '
+                           f'support persistent connections' )
+                    self._close()
+                    self.legacy = True
+                    self.health = 'legacy'
+                    return self._query(cmds)
+                raise
+
+        return answers
 
-# Generic handler from 'watchdog' for doing actions when a file change occurs
-class file_event_handler(FileSystemEventHandler):
-    """ Will do something when a <fname> change occurs
+
+    def _listening(self):
+        """ The remote is still listening to a *remote* source
+        """
+        ans = self._query( ['state'] )[0]
+
+        if not ans.startswith('{') or not ans.endswith('}'):
+            return False
+
+        remote_state = json.loads(ans)
+
+        # Update for new pAudio project: 'input' becomes 'source'
+        remote_source = remote_state.get('input', '') or \
+                        remote_state.get('source', '')
+
+        return 'remote' in remote_source.lower()
+
+
+    def _run(self):
+
+        while True:
+
+            with self.cond:
+
+                while not self._has_work():
+                    self.cond.wait()
+
+                if self.dropped:
+                    break
+
+                # a failed remote is not retried until some time
+                wait = self.retry_at - time()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+
+                cmds = self._take()
+
+            try:
+                if time() - self.listen_ts > LISTEN_CHECK:
+                    if not self._listening():
+                        print( f'(remote_volume) remote {self.addr} '
+                               f'not listening by now :-/' )
+                        break
+                    self.listen_ts = time()
+
+                print( f'(remote_volume) remote {self.addr} sending {cmds}' )
+                self._query(cmds)
+
+                self.fails  = 0
+                if not self.legacy:
+                    self.health = 'up'
+
+            except (OSError, ValueError) as e:
+
+                self._close()
+                self.listen_ts = 0.0
+                self.fails   += 1
+                self.health   = 'down'
+                self.retry_at = time() + RETRY
+                print( f'(remote_volume) remote {self.addr} failed '
+                       f'({self.fails}/{MAX_FAILS}): {str(e)}' )
+
+                if self.fails >= MAX_FAILS:
+                    break
+
+                # the lost commands are covered by a full sync when back
+                self.post_full_sync()
+
+        self._close()
+        forget_remote(self)
+
+
+def forget_remote(peer):
+
+    with LOCK:
+        if REMOTES.get(peer.addr) is peer:
+            del REMOTES[peer.addr]
+            print( f'(remote_volume) Updated remote listening machines: '
+                   f'{list(REMOTES)}' )
+
+
+def add_remote(addr):
+    """ Adds a remote listener if not already, then syncs all its levels
     """
-    # (i) This is an inherited class from the imported one 'FileSystemEventHandler',
-    #     which provides the 'event' propiertie.
-    #     Here we expand the class with our custom parameters:
-    #     'fname' and wanted 'action'
-
-    def __init__(self, fname, action, antibound=True):
-        self.fname      = fname
-        self.action     = action
-        self.antibound  = antibound
-        self.ts         = time()
-
-    def on_modified(self, event):
-        # DEBUG
-        #print( f'(i) event type: {event.event_type}, file: {event.src_path}' )
-        if event.src_path == self.fname:
-            if self.antibound:
-                if (time() - self.ts) > .1:
-                    globals()[self.action]()
-                self.ts = time()
-            else:
-                    globals()[self.action]()
+    with LOCK:
+        if addr not in REMOTES:
+            REMOTES[addr] = RemotePeer(addr)
+            print( f'(remote_volume) Updated remote listening machines: '
+                   f'{list(REMOTES)}' )
+        REMOTES[addr].post_full_sync()
 
 
 def get_remote_selected_source(addr, port=9990):
@@ -75,7 +301,7 @@ def get_remote_selected_source(addr, port=9990):
     """
     remote_source = ''
     try:
-        tmp  = send_cmd('state', host=addr, port=port, timeout=1)
+        tmp  = send_cmd('state', host=addr, port=port, timeout=TIMEOUT)
 
         if not tmp.startswith('{') or not tmp.endswith('}'):
             return remote_source
@@ -93,14 +319,11 @@ def get_remote_selected_source(addr, port=9990):
     return remote_source
 
 
-def get_state():
-    return read_state_from_disk()
-
-
 def detect_remotes():
     """ list of remote IPs listening to a source named *remote*
+        (i) all addresses are probed at once
     """
-    clients = []
+    addrs = []
 
     for n in REMOTES_ADDR_RANGE:
 
@@ -108,86 +331,44 @@ def detect_remotes():
         addr_list[-1] = str(n)
         addr = '.'.join( addr_list )
 
-        if addr == my_ip:
-            continue
+        if addr != my_ip:
+            addrs.append(addr)
 
-        if 'remote' in get_remote_selected_source(addr).lower():
-            clients.append(addr)
+    with ThreadPoolExecutor( max_workers=max(len(addrs), 1) ) as pool:
+        sources = list( pool.map( get_remote_selected_source, addrs ) )
 
-    return clients
+    return [ a for a, s in zip(addrs, sources) if 'remote' in s.lower() ]
 
 
-def remote_send_cmd(cli_addr, cmd):
-    print( f'(remote_volume) remote {cli_addr} sending \'{cmd}\'' )
-    send_cmd( cmd, host=cli_addr, verbose=False )
-
-
-def remote_update_levels(rem_addr):
-    level           = get_state()["level"]
-    lu_offset       = get_state()["lu_offset"]
-    equal_loudness  = get_state()["equal_loudness"]
-    remote_send_cmd(rem_addr, f'lu_offset {lu_offset}')
-    remote_send_cmd(rem_addr, f'loudness {equal_loudness}')
-    remote_send_cmd(rem_addr, f'level {level}')
-
-
-# The action triggered by the observer
-def relay_level_changes():
-    """ Notice that only relative level changes will be relayed
+# The action on preamp state changes, as published on the event bus
+def relay_level_changes(topic, state, changes):
+    """ Notice that only level changes will be relayed, as relative ones,
+        so that remotes can keep their own level offset
     """
+    with LOCK:
 
-    # Read last command from the command log file
-    tmp = read_last_line( CMD_LOG_PATH )
-    # e.g.: "2020/10/23 17:16:43; level -1 add; done"
-    last_cmd = tmp.split(';')[1].strip()
-
-    # Filtering commands:
-    wanted_cmd = ''
+        # A new bus connection: the full state is known, nothing to relay
+        if not STATE or set(changes) == set(state):
+            STATE.update(state)
+            return
 
-    # - relative level
-    if ('level' in last_cmd and 'add' in last_cmd):
-        wanted_cmd = last_cmd
+        for key, value in changes.items():
 
-    # - LU_offset (usually a toggle command)
-    if ('lu_offset' in last_cmd):
-        lu_offset       = get_state()["lu_offset"]
-        wanted_cmd      = f'lu_offset {lu_offset}'
+            if key == 'level':
+                delta = value - STATE.get('level', value)
+                if delta:
+                    for peer in REMOTES.values():
+                        peer.post_level_delta(delta)
 
-    # - equal loudness (usually a toggle command)
-    if ('loudness' in last_cmd):
-        equal_loudness  = get_state()["equal_loudness"]
-        wanted_cmd      = f'loudness {equal_loudness}'
+            elif key == 'lu_offset':
+                for peer in REMOTES.values():
+                    peer.post_setting('lu_offset', value)
 
-    # Early return
-    if not wanted_cmd:
-        return
+            elif key == 'equal_loudness':
+                for peer in REMOTES.values():
+                    peer.post_setting('loudness', value)
 
-    # Forwarding commands to remotes
-    for rem_addr in remoteClients:
-
-        # Checking if remote is still listening to us
-        # then updates the level event to remote
-        if 'remote' in get_remote_selected_source(rem_addr):
-            remote_send_cmd(rem_addr, wanted_cmd)
-
-        # else purge from remotes list if not listening anymore
-        else:
-            print( f'remote {rem_addr} not listening by now :-/' )
-            remoteClients.remove( rem_addr )
-            print( f'Updated remote listening machines: {remoteClients}' )
-
-
-# Broadcast level settings to all remote machines
-def broadcast_level_settings():
-
-    for rem_addr in remoteClients:
-
-        if 'remote' in get_remote_selected_source(rem_addr):
-            remote_update_levels(rem_addr)
-        else:
-            print( f'remote {rem_addr} not listening by now :-/' )
-            remoteClients.remove( rem_addr )
-            print( f'Updated remote listening machines: {remoteClients}' )
+        STATE.update(state)
 
 
 # The action called from our instance of <server.py> when receiving messages.
@@ -197,22 +378,22 @@ def do(cmd):
     cli_addr = server.CLIADDR[0]
     result = 'nack'
 
-    # Only 'hello' command is processed
+    # 'hello' from a remote listener
     if cmd == 'hello':
         if cli_addr != my_ip and '127.0.' not in cli_addr:
             print( f'(remote_volume) Received hello from: {cli_addr}' )
-            if cli_addr not in remoteClients:
-                # updating new client into remote clients list
-                remoteClients.append(cli_addr)
-                print( f'(remote_volume) Updated remote listening machines: '
-                       f'{remoteClients}' )
-            # set the level settings in remote listener even if already in remoteClients
-            remote_update_levels(cli_addr)
+            # set the level settings in remote listener even if already known
+            add_remote(cli_addr)
             result = 'ack'
         else:
             print( f'(remote_volume) Tas tonto: received \'hello\' '
                    f'from MY SELF ({cli_addr})' )
 
+    # the remotes health
+    elif cmd == 'status':
+        with LOCK:
+            result = json.dumps( { a: p.health for a, p in REMOTES.items() } )
+
     return result
 
 
@@ -240,28 +421,19 @@ if __name__ == "__main__":
     # Retrieving basic data for this to work
     my_hostname     = socket.gethostname()
     my_ip           = socket.gethostbyname(f'{my_hostname}.local')
+    STATE.update( read_state_from_disk() )
+
     remoteClients   = detect_remotes()
     print( f'(remote_volume) Detected {len(remoteClients)} '
            f'remote listening machines: {remoteClients}' )
 
     # Broadcast level settings to remote clients
     print( f'(remote_volume) broadcast level settings to remotes ...' )
-    broadcast_level_settings()
-
-    #   WATCHDOG to observe file changes
-    #   https://watchdog.readthedocs.io/en/latest/
-    #   https://stackoverflow.com/questions/18599339/
-    #   python-watchdog-monitoring-file-for-changes
-    #   Use recursive=True to observe also subfolders
-    #   Even observing recursively the CPU load is negligible,
-    #   but we prefer to observe to a single folder.
-    observer = Observer()
-    observer.schedule( file_event_handler(  fname=CMD_LOG_PATH,
-                                            action='relay_level_changes',
-                                            antibound=True ),
-                                            path=LOG_DIR,
-                                            recursive=False )
-    observer.start()
+    for addr in remoteClients:
+        add_remote(addr)
+
+    # The preamp state changes are received from the event bus
+    event_bus.subscribe( ['state'], relay_level_changes )
 
     print( f'(remote_volume) Keep relaying level changes to remotes ...' )
 
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+"""
+    A per way level meter of the Brutefir outputs.
+
+    A single JACK client taps every Brutefir output way (lo.L, lo.R,
+    hi.L, ..., sw), then the peak and RMS levels of all ways are computed
+    at once over a (frames x channels) block buffer.
+
+    Compact snapshots are published through the event bus 'way_levels'
+    topic, at the 'way_meter_rate' (Hz) from config.yml, so that the web
+    page (see 'aux get_way_levels') and the LCD can display them:
+
+        'ways'      [ 'lo.L', 'lo.R', ... ]
+        'peak'      the max peak on the snapshot period (dBFS)
+        'rms'       the RMS level on the snapshot period (dBFS)
+        'headroom'  dB left before clipping (negative if clipping)
+        'clips'     clipped blocks counter per way
+
+    Unlike peak_monitor.py, there is no need to wait for Brutefir to log
+    the peaks, clipping is seen while happening.
+
+    Usage:   way_meter.py    start | stop
+"""
+
+import  sys
+import  os
+from    time    import sleep
+import  numpy as np
+import  jack
+
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+
+from    config  import CONFIG
+import  event_bus
+import  proc_registry
+
+
+# JACK sample value of 0 dBFS
+CLIP_LEVEL  = 1.0
+# dB floor
+FLOOR       = -100.0
+# Seconds between Brutefir connections checks, e.g. after a restart
+RECONNECT   = 2.0
+
+
+class WayMeter:
+    """ A JACK client measuring the Brutefir output ways
+    """
+
+    def __init__(self, ways, name='way_meter'):
+
+        self.ways       = ways
+        nch             = len(ways)
+
+        self.client     = jack.Client(name, no_start_server=True)
+        self.inports    = [ self.client.inports.register(w) for w in ways ]
+
+        # Accumulators on the snapshot period, rotated by snapshot():
+        # the active one (process callback), the one settling from
+        # a process cycle still in progress, and the one read.
+        self.peak       = np.zeros( (3, nch), dtype=np.float32 )
+        self.energy     = np.zeros( (3, nch) )
+        self.frames     = [0, 0, 0]
+        self.active     = 0
+
+        self.clips      = np.zeros( nch, dtype=np.int64 )
+
+        # Per block results
+        self.blk_peak   = np.zeros( nch, dtype=np.float32 )
+        self.blk_energy = np.zeros( nch, dtype=np.float32 )
+        self.blk_clip   = np.zeros( nch, dtype=bool )
+
+        self._alloc( self.client.blocksize )
+
+        self.client.set_blocksize_callback(self._alloc)
+        self.client.set_process_callback(self._process)
+
+
+    def _alloc(self, blocksize):
+        """ The (frames x channels) block buffers """
+        self.buf = np.zeros( (blocksize, len(self.ways)), dtype=np.float32 )
+        self.tmp = np.zeros_like(self.buf)
+
+
+    def _process(self, frames):
+        """ JACK process callback (i) keep it short """
+
+        buf, tmp = self.buf, self.tmp
+
+        # the blocksize is being changed
+        if buf.shape[0] != frames:
+            return
+
+        for i, p in enumerate(self.inports):
+            buf[:, i] = p.get_array()
+
+        np.abs( buf, out=tmp )
+        tmp.max( axis=0, out=self.blk_peak )
+        np.square( buf, out=tmp )
+        tmp.sum( axis=0, out=self.blk_energy )
+        np.greater_equal( self.blk_peak, CLIP_LEVEL, out=self.blk_clip )
+
+        k = self.active
+        np.maximum( self.peak[k], self.blk_peak, out=self.peak[k] )
+        np.add( self.energy[k], self.blk_energy, out=self.energy[k] )
+        np.add( self.clips, self.blk_clip, out=self.clips )
+        self.frames[k] += frames
+
+
+    def connect(self):
+        """ Connects each way to its Brutefir output port, if not already
+        """
+        for w, p in zip(self.ways, self.inports):
+            if self.client.get_all_connections(p):
+                continue
+            try:
+                self.client.connect( f'brutefir:{w}', p )
+            except jack.JackError:
+                pass
+
+
+    def start(self):
+        self.client.activate()
+        self.connect()
+
+
+    def snapshot(self):
+        """ The levels measured since the previous call (dictionary),
+            or None if no audio was processed.
+        """
+        a = self.active
+        s = (a + 2) % 3     # not active since the previous call
+
+        # (i) the next one was read and cleared by the previous call
+        self.active = (a + 1) % 3
+
+        n = self.frames[s]
+        if not n:
+            return None
+
+        peak = 20 * np.log10( np.maximum( self.peak[s], 1e-5 ) )
+        rms  = 10 * np.log10( np.maximum( self.energy[s] / n, 1e-10 ) )
+
+        self.peak[s]    = 0.0
+        self.energy[s]  = 0.0
+        self.frames[s]  = 0
+
+        return  {   'ways':     self.ways,
+                    'peak':     [ round(float(x), 1) for x in peak ],
+                    'rms':      [ round(float(x), 1) for x in rms ],
+                    'headroom': [ round(float(-x), 1) for x in peak ],
+                    'clips':    self.clips.tolist()
+                }
+
+
+def get_ways():
+    """ The Brutefir output names, but the void ones
+    """
+    from brutefir_mod import get_config_outputs
+
+    outputs = get_config_outputs()
+    return [ outputs[i]['name'] for i in sorted(outputs, key=int)
+             if not 'void' in outputs[i]['name'] ]
+
+
+def start():
+
+    try:
+        meter = WayMeter( get_ways() )
+        meter.start()
+    except Exception as e:
+        print(f'(way_meter) not available: {str(e)}')
+        sys.exit()
+
+    period = 1.0 / CONFIG['way_meter_rate']
+    print(f'(way_meter) metering {meter.ways}, {CONFIG["way_meter_rate"]} Hz')
+
+    elapsed = 0.0
+    while True:
+
+        sleep(period)
+
+        snap = meter.snapshot()
+        if snap:
+            event_bus.publish( 'way_levels', snap )
+
+        elapsed += period
+        if elapsed >= RECONNECT:
+            meter.connect()
+            elapsed = 0.0
+
+
+def stop():
+    proc_registry.kill('way_meter.py start')
+
+
+if __name__ == "__main__":
+
+    if sys.argv[1:]:
+        option = sys.argv[1]
+
+        if option == 'start':
+            start()
+
+        elif option == 'stop':
+            stop()
+
+        else:
+            print(__doc__)
+    else:
+        print(__doc__)
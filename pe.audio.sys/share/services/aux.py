@@ -27,6 +27,17 @@ from    miscel      import  *
 
 from    peq_mod     import eca_bypass, eca_load_peq
 
+from    preamp_mod.core import get_powersave_info
+from    signal_detector import read_signal
+
+import  event_bus
+
+
+# The period (s) to refresh and publish the dynamic aux info
+AUX_INFO_PERIOD = 1.0
+# dump_aux_info() is called from several threads
+AUX_LOCK        = threading.Lock()
+
 
 def restart_to_sample_rate(value):
     sp.Popen(f'{UHOME}/bin/peaudiosys_restart.sh {value}', shell=True)
@@ -38,14 +49,37 @@ def dump_aux_info():
         by third party processes
     """
 
-    # Dynamic updates
-    AUX_INFO['amp']                     = read_amp_state_file()
-    AUX_INFO['loudness_monitor']        = get_loudness_monitor()
-    AUX_INFO['sysmon']                  = get_sysmon('wlan0')
+    with AUX_LOCK:
+
+        # Dynamic updates
+        AUX_INFO['amp']                     = read_amp_state_file()
+        AUX_INFO['loudness_monitor']        = get_loudness_monitor()
+        AUX_INFO['sysmon']                  = get_sysmon('wlan0')
+        AUX_INFO['powersave']               = get_powersave_info()
+        AUX_INFO['signal']                  = read_signal()
 
-    # Dumping to disk
-    with open(AUX_INFO_PATH, 'w') as f:
-        f.write( json.dumps(AUX_INFO, indent=2) )
+        # Dumping to disk
+        with open(AUX_INFO_PATH, 'w') as f:
+            f.write( json.dumps(AUX_INFO, indent=2) )
+
+        # Event bus subscribers will receive only the changes
+        event_bus.publish( 'aux', AUX_INFO )
+        event_bus.publish( 'warnings', {'warning': AUX_INFO['warning']} )
+
+
+def aux_info_loop():
+    """ Refreshes the dynamic aux info (sysmon, powersave, signal ...)
+        every AUX_INFO_PERIOD, because the pushed updates subscribers
+        (web page, LCD) do not poll 'aux info'
+    """
+    while True:
+
+        sleep(AUX_INFO_PERIOD)
+
+        try:
+            dump_aux_info()
+        except Exception as e:
+            print(f'{Fmt.RED}(aux.py) aux info refresh ERROR: {str(e)}{Fmt.END}')
 
 
 def get_sysmon(w_iface='wlan0'):
@@ -497,7 +531,8 @@ def get_help():
     cmds = ['amp_switch', 'get_macros', 'run_macro', 'play_url',
             'reset_loudness_monitor', 'reset_lu_monitor' ,
             'set_loudness_monitor_scope', 'set_lu_monitor_scope',
-            'get_loudness_monitor', 'get_lu_monitor', 'info', 'warning']
+            'get_loudness_monitor', 'get_lu_monitor', 'get_way_levels',
+            'info', 'warning']
     return ', '.join( cmds )
 
 
@@ -614,6 +649,10 @@ def init():
                         recursive=False )
     observer2.start()
 
+    # Periodic refresh of the dynamic aux info
+    job = threading.Thread( target=aux_info_loop, daemon=True )
+    job.start()
+
 
 # Interface function for this module
 def do( cmd, arg=None ):
@@ -643,6 +682,9 @@ def do( cmd, arg=None ):
     elif cmd == 'get_loudness_monitor' or cmd == 'get_lu_monitor':
         result = get_loudness_monitor()
 
+    elif cmd == 'get_way_levels':
+        result = event_bus.get_snapshot('way_levels')
+
     elif cmd == 'zita_j2n':
         result = zita_j2n(arg)
 
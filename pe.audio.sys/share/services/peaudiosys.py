@@ -13,17 +13,24 @@ import  json
 from    time                import  strftime
 import  os
 import  sys
+import  threading
 
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share')
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
+import  event_bus
+
+# The event bus must run before the services start publishing
+event_bus.start_bus()
+
 from    services    import  preamp
 from    services    import  players
 from    services    import  aux
 
 from    config      import  LOG_FOLDER
 from    fmt         import  Fmt
+import  write_behind
 
 
 # COMMAND LOG FILE
@@ -32,6 +39,14 @@ if os.path.exists(logFname) and os.path.getsize(logFname) > 10e6:
     print ( f"{Fmt.RED}(peaudiosys) log file exceeds ~ 10 MB '{logFname}'{Fmt.END}" )
 print ( f"{Fmt.BLUE}(peaudiosys) logging commands in '{logFname}'{Fmt.END}" )
 
+# This module supports concurrent commands from several server.py workers,
+# so that relative preamp commands can be coalesced (see preamp.do).
+# Preamp commands are serialized inside preamp.do, players and aux ones here.
+SERVER_WORKERS = 4
+LOCK = threading.Lock()
+# Players and aux commands that do not need to wait for others in progress
+UNLOCKED_CMDS = ('get_meta', 'get_info', 'get_all_info', 'info')
+
 
 # Interface function for this module
 def do( cmd_phrase ):
@@ -72,10 +87,16 @@ def do( cmd_phrase ):
         pfx, cmd, args = read_cmd_phrase( cmd_phrase )
         #print('pfx:', pfx, '| cmd:', cmd, '| args:', args) # DEBUG
 
-        result = {  'preamp':   preamp.do,
+        func = {    'preamp':   preamp.do,
                     'player':   players.do,
                     'aux':      aux.do
-                  }[ pfx ]( cmd, args )
+                }[ pfx ]
+
+        if pfx == 'preamp' or cmd in UNLOCKED_CMDS:
+            result = func( cmd, args )
+        else:
+            with LOCK:
+                result = func( cmd, args )
 
         if type(result) != str:
             result = json.dumps(result, indent=2)
@@ -89,7 +110,11 @@ def do( cmd_phrase ):
 
             logline = f'{strftime("%Y/%m/%d %H:%M:%S")}; {cmd_phrase}; {result}'
 
-            with open(logFname, 'a') as FLOG:
-                    FLOG.write(f'{logline}\n')
+            write_behind.append_file( logFname, f'{logline}\n' )
 
     return result
+
+
+# Called from server.py when stopping
+def shutdown():
+    write_behind.flush()
@@ -11,7 +11,7 @@
 #
 # .state            'r'     pe.audio.sys state file
 #
-# .player_metadata  'w'     Stores the current player metadata
+# .player_metadata  'w'     Stores the current player metadata, only on changes
 #
 
 import  os
@@ -37,10 +37,15 @@ from  miscel                        import  get_spotify_plugin,         \
                                             read_state_from_disk,       \
                                             read_cdda_meta_from_disk,   \
                                             read_mpd_config,            \
-                                            send_cmd, is_IP, Fmt
+                                            send_cmd, is_IP, Fmt,       \
+                                            dict_compare
+
+import event_bus
+import write_behind
 
 from  players_mod.mpd_mod           import  mpd_control,                \
                                             mpd_meta,                   \
+                                            mpd_on_change,              \
                                             mpd_playlist,               \
                                             mpd_playlists,              \
                                             mpd_get_cd_track_nums,      \
@@ -51,20 +56,39 @@ from  players_mod.mplayer           import  mplayer_control,            \
                                             mplayer_playlists
 
 from  players_mod.librespot         import  librespot_control,          \
-                                            librespot_meta
+                                            librespot_meta,             \
+                                            librespot_on_change
 
 if get_spotify_plugin() == 'desktop':
 
     from  players_mod.spotify_desktop   import  spotify_control,            \
                                                 spotify_meta,               \
-                                                spotify_playlists
+                                                spotify_playlists,          \
+                                                spotify_on_change
 
 ## Getting sources list
 SOURCES = CONFIG["sources"]
 
-# The runtime metadata variable and the loop refresh period in seconds
+# The runtime metadata variable and the loop refresh period in seconds.
+# The period backs off up to MD_MAX_PERIOD while metadata does not
+# change (paused, stopped) or when no input is selected.
 CURRENT_MD          = PLAYER_METATEMPLATE.copy()
 MD_REFRESH_PERIOD   = 2
+MD_MAX_PERIOD       = 16
+
+# Players events and input changes wake up the metadata loop
+MD_WAKEUP           = threading.Event()
+
+
+def preamp_state():
+    """ The preamp state from memory: the event bus snapshot, as the bus
+        runs in this process, so it is up to date as soon as the preamp
+        changes. The disk file (written behind) is a fallback.
+    """
+    state = event_bus.get_snapshot('state')
+    if not state:
+        state = read_state_from_disk()
+    return state
 
 
 def clear_cdda_stuff():
@@ -129,8 +153,7 @@ def get_meta():
     """
     md = PLAYER_METATEMPLATE.copy()
 
-    source      = read_state_from_disk()['input']
-    source_port = read_state_from_disk()['input_port']
+    source      = preamp_state()['input']
 
     if 'librespot' in source or 'spotify' in source.lower():
 
@@ -194,7 +217,7 @@ def playback_control(cmd, arg=''):
 
 
     result = 'stop'
-    source = read_state_from_disk()['input']
+    source = preamp_state()['input']
 
     if 'mpd' in source.lower():
         result = mpd_control(cmd, arg)
@@ -242,8 +265,9 @@ def playlists_control(cmd, arg):
         (i) Currently only works with: Spotify Desktop, MPD.
     """
     result = []
-    source      = read_state_from_disk()['input']
-    source_port = read_state_from_disk()['input_port']
+    state       = preamp_state()
+    source      = state['input']
+    source_port = state['input_port']
 
     if 'mpd' in source or 'mpd' in source_port:
 
@@ -273,7 +297,7 @@ def random_control(arg):
         (i) Currently only works with: MPD
     """
     result = 'n/a'
-    source = read_state_from_disk()['input']
+    source = preamp_state()['input']
 
     if 'mpd' in source.lower():
         result = mpd_control('random', arg)
@@ -333,30 +357,79 @@ def get_all_info():
             }
 
 
+def wake_up_meta(*dummy):
+    """ Forces the metadata loop to refresh now
+    """
+    MD_WAKEUP.set()
+
+
 # Autoexec when loading this module
 def loop_getting_metadata():
     """ This init function will thread the storing metadata LOOP FOREVER
     """
 
-    def store_meta_loop(period=2):
+    def on_state_change(topic, state, changes):
+        if 'input' in changes:
+            wake_up_meta()
+
+
+    def store_meta_loop():
 
         global CURRENT_MD
 
+        period = MD_REFRESH_PERIOD
+        first  = True
+
         while True:
 
-            # Update the global runtime variable CURRENT_MD
-            CURRENT_MD = get_meta()
+            md = get_meta()
+
+            # Only on changes
+            if first or dict_compare(CURRENT_MD, md):
+
+                first = False
+
+                # Update the global runtime variable CURRENT_MD
+                CURRENT_MD = md
+
+                # Event bus subscribers will receive only the changes
+                event_bus.publish( 'metadata', CURRENT_MD )
+
+                # Save metadata to disk file.
+                write_behind.write_file( PLAYER_META_PATH,
+                                         json.dumps( CURRENT_MD, indent=2 ) )
+
+                period = MD_REFRESH_PERIOD
+
+            # Backs off while nothing changes, e.g. paused or stopped
+            else:
+                period = min(period * 2, MD_MAX_PERIOD)
+
+            # The playback info for web clients (see www_server.js)
+            event_bus.publish( 'player', get_all_info() )
+
+            if preamp_state()['input'] == 'none':
+                period = MD_MAX_PERIOD
+
+            # Wait for period, or for some player event
+            MD_WAKEUP.wait(period)
+            MD_WAKEUP.clear()
+
+
+    # Players events
+    mpd_on_change( wake_up_meta )
+
+    if get_spotify_plugin() == 'librespot':
+        librespot_on_change( wake_up_meta )
 
-            # Save metadata to disk file.
-            with open(PLAYER_META_PATH, 'w') as f:
-                f.write( json.dumps( CURRENT_MD, indent=2 ) )
+    elif get_spotify_plugin() == 'desktop':
+        spotify_on_change( wake_up_meta )
 
-            # Wait for period
-            sleep(period)
+    # Preamp input changes
+    event_bus.subscribe( ('state',), on_state_change )
 
     # Loop storing metadata
-    period = MD_REFRESH_PERIOD
-    meta_loop = threading.Thread( target=store_meta_loop, args=(period,) )
+    meta_loop = threading.Thread( target=store_meta_loop )
     meta_loop.start()
 
 
@@ -372,6 +445,8 @@ def do(cmd, arg):
     if cmd in ( 'state', 'stop', 'pause', 'play', 'next', 'previous', 'play_track',
                 'rew_15min', 'rew_5min', 'rew', 'ff', 'ff_5min', 'ff_15min'):
         result = playback_control( cmd, arg )
+        if cmd != 'state':
+            wake_up_meta()
 
     elif cmd == 'play_url':
         result = play_url(arg)
@@ -381,6 +456,7 @@ def do(cmd, arg):
 
     elif cmd == 'random_mode':
         result = random_control(arg)
+        wake_up_meta()
 
     elif cmd == 'get_meta' or cmd == 'get_info':
         result = CURRENT_MD
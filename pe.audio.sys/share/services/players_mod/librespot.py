@@ -7,17 +7,139 @@
 """ A libresport interface module for players.py
     librespot is a Spotify Connect client:
     https://github.com/librespot-org/librespot
+
+    The librespot --onevent hook keeps the player state in the
+    .librespot_state json file (see plugins/librespot/librespot_event.py),
+    which is atomically replaced, so it is only read again when changed,
+    as per its inode, mtime and size.
 """
 import sys
 import os
-import subprocess as sp
 import json
+import threading
+from time import sleep, time
 
 UHOME = os.path.expanduser("~")
 MAINFOLDER = f'{UHOME}/pe.audio.sys'
 
 sys.path.append(f'{MAINFOLDER}/share/miscel')
 from miscel import time_sec2mmss, Fmt
+from log_follower import LogFollower
+import proc_registry
+
+LIBRESPOT_EVENTS_PATH = f'{MAINFOLDER}/.librespot_events'
+LIBRESPOT_STATE_PATH  = f'{MAINFOLDER}/.librespot_state'
+
+# librespot --bitrate, once known
+BITRATE = ''
+
+
+class LibrespotState:
+    """ The in memory librespot player state, as per the --onevent hook
+    """
+
+    def __init__(self, path):
+        self.path    = path
+        self.stamp   = None
+        self.state   = {}
+        # times the state was changed
+        self.changes = 0
+        self.lock    = threading.Lock()
+
+
+    def poll(self):
+        """ Reloads the state file if replaced since the last poll
+            returns: the state dictionary
+        """
+        with self.lock:
+
+            # (i) inodes are reused by consecutive replacements
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                return self.state
+
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+            if stamp != self.stamp:
+                try:
+                    with open(self.path, 'r') as f:
+                        self.state = json.load(f)
+                    self.stamp    = stamp
+                    self.changes += 1
+                except (OSError, ValueError):
+                    pass
+
+            return self.state
+
+
+    def play_state(self):
+        """ 'play' | 'pause' | 'stop'
+        """
+        return self.poll().get('play', 'stop')
+
+
+    def position(self):
+        """ The estimated playback position (seconds)
+        """
+        st  = self.poll()
+        pos = st.get('position_ms', 0) / 1000
+
+        if st.get('play') == 'play':
+            pos += time() - st.get('position_ts', time())
+
+        if st.get('duration_ms'):
+            pos = min( pos, st['duration_ms'] / 1000 )
+
+        return pos
+
+
+
+
+def parse_event(line, state):
+    """ A LogFollower parser for the librespot printouts, e.g.:
+
+        [2024-06-19T11:07:44Z INFO  librespot_playback::player] Loading <Shipbuilding - Remastered in 1998> with Spotify URI <spotify:track:7iG5yQkIIrd39mYWU2vT2b>
+        [2024-06-19T11:07:44Z INFO  librespot_playback::player] <Shipbuilding - Remastered in 1998> (184293 ms) loaded
+        [2024-06-19T11:07:44Z INFO  librespot::player_event_handler] Running ["/home/paudio/pe.audio.sys/share/plugins/librespot/bind_ports.sh"] with environment variables {"TRACK_ID": "7iG5yQkIIrd39mYWU2vT2b", "POSITION_MS": "0", "DURATION_MS": "184293", "PLAYER_EVENT": "playing"}
+
+        The state keeps 'file', 'title', 'duration_ms' and 'event'
+    """
+
+    # 'file' field, a new track is loading
+    if '] Loading <' in line:
+        state['file'] = line.split('Spotify URI <')[-1].split('>')[0]
+        state.pop('title', None)
+        state.pop('duration_ms', None)
+        return 'loading'
+
+    # 'title' field
+    if line.endswith('loaded'):
+        # Rust cargo format:
+        if 'player] <' in line:
+            state['title'] = line.split('player] <')[-1].split('> (')[0]
+        # former loaded message format:
+        else:
+            state['title'] = line.split('player: Track "')[-1] \
+                                 .split('" loaded')[0]
+        return 'loaded'
+
+    # player_event_handler  Only occurs when pausing/play/stop because nobody
+    #                       else pulls librespot to update the "POSITION_MS"
+    #                       field, so we do not use this field
+    if '"PLAYER_EVENT"' in line:
+        envvars = json.loads( '{' + line.split('{')[1] )
+        state['event'] = envvars["PLAYER_EVENT"].lower()
+        if "DURATION_MS" in envvars:
+            state['duration_ms'] = float( envvars["DURATION_MS"] )
+        return 'player_event'
+
+
+STATE = LibrespotState(LIBRESPOT_STATE_PATH)
+
+# Incremental reading of the librespot printouts, only for the title
+# with librespot < 0.5, which does not provide NAME to the --onevent hook
+EVENTS = LogFollower(LIBRESPOT_EVENTS_PATH, parse_event)
 
 
 def librespot_control(cmd, arg=''):
@@ -33,107 +155,79 @@ def librespot_control(cmd, arg=''):
         return 'n/a'
 
     elif 'state' in cmd:
+        return STATE.play_state()
 
-        state = 'stop'
-        try:
-            with open(f'{MAINFOLDER}/.librespot_events', 'r') as f:
-                lines = f.readlines()[-10:]
-
-                # For the playing state (play/paused/stop) we get the last line
-                for line in lines[::-1]:
-
-                    # 'state' field
-                    if '"PLAYER_EVENT"' in line:
-                        envvars = '{' + line.split('{')[1]
-                        state = json.loads(envvars)["PLAYER_EVENT"].lower()
-
-                        if 'play' in state:
-                            state = 'play'
-                        elif 'paus' in state:
-                            state = 'pause'
-                        elif 'stop' in state:
-                            state = 'stop'
-                        else:
-                            state = 'play'
-
-                        break
-        except:
-            pass
 
-        return state
+def librespot_on_change(callback):
+    """ Threaded watching of the librespot state file,
+        then calls callback() when a player event occurs
+    """
+
+    def tail_loop():
+
+        # (i) Anything could have happened before
+        last = -1
+
+        while True:
+
+            try:
+                STATE.poll()
+                if STATE.changes != last:
+                    last = STATE.changes
+                    callback()
+
+            except Exception as e:
+                print(f'{Fmt.RED}(librespot.py) {str(e)}{Fmt.END}')
+
+            sleep(.5)
+
+
+    job = threading.Thread( target=tail_loop, daemon=True )
+    job.start()
 
 
 def librespot_meta(md):
     """ Input:  blank md dict
-        Output: metadata dict derived from librespot printouts
-        I/O:    .librespot_events (r) - librespot redirected printouts
+        Output: metadata dict derived from the librespot state
+        I/O:    .librespot_state (r) - as per the librespot --onevent hook
     """
+    global BITRATE
 
-    # Unfortunately librespot only prints out the title metadata,
-    # nor artist neither album.
-    # More info can be retrieved from the spotify web, but it is needed
-    # to register for getting a privative and unique http request token
-    # for authentication.
-
-    # Gets librespot bitrate from librespot running process:
-    try:
-        tmp = sp.check_output('pgrep -fa bin/librespot'.split()).decode()
-        # /bin/librespot ... --bitrate 320 ...
-        librespot_bitrate = tmp.split('--bitrate')[1].split()[0].strip()
-    except:
-        librespot_bitrate = ''
+    # Gets librespot bitrate from librespot running process, just once
+    if not BITRATE:
+        try:
+            tmp = ' '.join( proc_registry.find('bin/librespot').values() )
+            # /bin/librespot ... --bitrate 320 ...
+            BITRATE = tmp.split('--bitrate')[1].split()[0].strip()
+        except:
+            pass
 
 
     # Fixed metadata
     md['player'] = 'librespot'
-    md['bitrate'] = librespot_bitrate
+    md['bitrate'] = BITRATE
     md["format"]  = '44100:16:2'
 
-    # Trying to complete metadata fields:
     try:
-        # librespot messages are redirected to .librespot_events,
-        # so we will search for the latest useful messages,  backwards
-        # from the end of the events file:
-        # ...
-        # [2024-06-19T11:07:44Z INFO  librespot_playback::player] Loading <Shipbuilding - Remastered in 1998> with Spotify URI <spotify:track:7iG5yQkIIrd39mYWU2vT2b>
-        # [2024-06-19T11:07:44Z INFO  librespot_playback::player] <Shipbuilding - Remastered in 1998> (184293 ms) loaded
-        # [2024-06-19T11:07:44Z INFO  librespot::player_event_handler] Running ["/home/paudio/pe.audio.sys/share/plugins/librespot/bind_ports.sh"] with environment variables {"TRACK_ID": "7iG5yQkIIrd39mYWU2vT2b", "POSITION_MS": "0", "DURATION_MS": "184293", "PLAYER_EVENT": "playing"}
-        # [2024-06-19T11:07:48Z INFO  librespot::player_event_handler] Running ["/home/paudio/pe.audio.sys/share/plugins/librespot/bind_ports.sh"] with environment variables {"POSITION_MS": "3336", "TRACK_ID": "7iG5yQkIIrd39mYWU2vT2b", "PLAYER_EVENT": "paused", "DURATION_MS": "184293"}
-        # ...
-
-
-        # player_event_handler  Only occurs when pausing/play/stop because nobody else pulls librespot
-        #                       to update the "POSITION_MS" field, so we do not update this md field
-
-        with open(f'{MAINFOLDER}/.librespot_events', 'r') as f:
-            lines = f.readlines()[-30:]
-
-            # Iterate over the lines of messages. Will do backwards,
-            # because first line is the one containing " Loading "
-            for line in lines[::-1]:
-
-                # 'file' field
-                if '] Loading <' in line:
-                    # Rust cargo format:
-                    md['file'] = line.split('Spotify URI <')[-1] \
-                                      .split('>\n')[0]
-                    break
-
-                # 'title' field
-                if line.endswith("loaded\n"):
-                    # Rust cargo format:
-                    if 'player] <' in line:
-                        md['title'] = line.split('player] <')[-1] \
-                                          .split('> (')[0]
-                    # former loaded message format:
-                    else:
-                        md['title'] = line.split('player: Track "')[-1] \
-                                          .split('" loaded')[0]
-                # 'time_tot' field
-                if '"DURATION_MS"' in line:
-                    envvars = '{' + line.split('{')[1]
-                    dur_ms = float(json.loads(envvars)["DURATION_MS"])
-                    md['time_tot'] = time_sec2mmss(dur_ms/1000)
+        state = STATE.poll()
+
+        if 'track_id' in state:
+            md['file'] = f'spotify:track:{state["track_id"]}'
+
+        if 'name' in state:
+            md['title']  = state['name']
+            md['artist'] = state.get('artists', '')
+            md['album']  = state.get('album', '')
+
+        # (i) librespot < 0.5 only prints out the title
+        else:
+            ev = EVENTS.poll()
+            if 'title' in ev:
+                md['title'] = ev['title']
+
+        if state.get('duration_ms'):
+            md['time_tot'] = time_sec2mmss( state['duration_ms'] / 1000 )
+            md['time_pos'] = time_sec2mmss( STATE.position() )
 
     except Exception as e:
         print(f'{Fmt.RED}(librespot.py) {str(e)}{Fmt.END}')
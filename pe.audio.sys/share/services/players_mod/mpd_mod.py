@@ -5,11 +5,20 @@
 # 'pe.audio.sys', a PC based personal audio system.
 
 """ A MPD interface module for players.py
+
+    Two persistent connections to MPD are used:
+
+    - a thread safe one for commands,
+    - a dedicated one waiting in 'idle' mode, that keeps up to date
+      a cached snapshot of status, currentsong and playlist.
+
+    So, metadata and playlist queries are answered from memory.
 """
 import  os
 import  sys
 import  mpd
-from    time        import sleep
+import  threading
+from    time        import sleep, time
 import  json
 from    subprocess  import Popen, run
 
@@ -25,15 +34,35 @@ MPD_PORT                = read_mpd_config()["port"]
 CDDA_MPD_PLAYLIST_PATH  = f'{UHOME}/pe.audio.sys/.cdda_mpd_playlist'
 LAST_MPD_PLAYLIST_PATH  = f'{UHOME}/pe.audio.sys/.last_mpd_playlist'
 
+# The commands connection
 c = mpd.MPDClient()
 c.timeout = 3       # network timeout in seconds (floats allowed), default: None
 c.idletimeout = 1   # timeout for fetching the result of the idle command is handled seperately, default: None
-
-
-# NOTE: each command below will do:
+LOCK = threading.RLock()
+
+# The cached snapshot, kept up to date by the idle loop
+IDLE_SUBSYSTEMS = ('player', 'playlist', 'options')
+CACHE           = { 'valid':        False,
+                    'status':       {},
+                    'currentsong':  {},
+                    'playlistid':   [],
+                    'stamp':        0.0     # when status was got
+                  }
+CACHE_LOCK      = threading.Lock()
+# Commands that do not change MPD, others invalidate the cache until
+# the idle loop refreshes it
+QUERY_CMDS      = ('status', 'currentsong', 'playlist', 'playlistid', 'listplaylists')
+CALLBACKS       = []
+IDLE_JOB        = None
+
+
+# NOTE: the commands connection is persistent, commands are run by _cmd()
+#       that will do:
+#           LOCK
 #           _ping_mpd()
-#           ...somo process...
-#           _release_mpd()
+#           ...the command...
+#           _release_mpd() only if the connection was lost, then retry
+
 
 def _ping_mpd():
     """ (i) Do not use ping() because some times crash:
@@ -64,6 +93,10 @@ def _release_mpd():
 
     try:
         c.close()
+    except:
+        pass
+
+    try:
         c.disconnect()
 
     except Exception as e:
@@ -72,11 +105,165 @@ def _release_mpd():
     return
 
 
+def _cmd(command, *args):
+    """ Runs a command through the commands connection.
+        If the connection was lost (e.g. MPD connection_timeout or restart)
+        it reconnects and retries once.
+    """
+
+    with LOCK:
+
+        for attempt in (1, 2):
+
+            if not _ping_mpd():
+                raise mpd.ConnectionError('not connected to MPD')
+
+            if command not in QUERY_CMDS:
+                with CACHE_LOCK:
+                    CACHE['valid'] = False
+
+            try:
+                return getattr(c, command)(*args)
+
+            except (mpd.ConnectionError, OSError):
+                if attempt == 2:
+                    raise
+                _release_mpd()
+
+
+def _update_cache(ic, changed):
+    """ Reads a new snapshot through the idle connection
+    """
+
+    st = ic.status()
+    cs = ic.currentsong()
+
+    if 'playlist' in changed or not CACHE['valid']:
+        plid = ic.playlistid()
+    else:
+        plid = CACHE['playlistid']
+
+    with CACHE_LOCK:
+        CACHE['status']      = st
+        CACHE['currentsong'] = cs
+        CACHE['playlistid']  = plid
+        CACHE['stamp']       = time()
+        CACHE['valid']       = True
+
+
+def _idle_loop():
+
+    ic = mpd.MPDClient()
+    ic.timeout      = 3
+    ic.idletimeout  = None      # idle waits forever
+
+    warned = False
+
+    while True:
+
+        try:
+            ic.connect('localhost', MPD_PORT)
+            warned = False
+
+            # Anything could have changed while disconnected
+            changed = IDLE_SUBSYSTEMS
+
+            while True:
+
+                _update_cache(ic, changed)
+
+                for callback in CALLBACKS[:]:
+                    try:
+                        callback(changed)
+                    except Exception as e:
+                        print(f'{Fmt.RED}(mpd_mod.py) idle callback: {str(e)}{Fmt.END}')
+
+                changed = ic.idle(*IDLE_SUBSYSTEMS)
+
+        except Exception as e:
+
+            with CACHE_LOCK:
+                CACHE['valid'] = False
+
+            if not warned:
+                print(f'{Fmt.BOLD}(mpd_mod.py) idle loop: {str(e)}{Fmt.END}')
+                warned = True
+
+            try:
+                ic.disconnect()
+            except:
+                pass
+
+            sleep(5)
+
+
+def _start_idle():
+
+    global IDLE_JOB
+
+    with CACHE_LOCK:
+        if IDLE_JOB is None:
+            IDLE_JOB = threading.Thread( target=_idle_loop, daemon=True )
+            IDLE_JOB.start()
+
+
+def mpd_on_change(callback):
+    """ callback(changed_subsystems) will be called when MPD changes
+    """
+    CALLBACKS.append(callback)
+    _start_idle()
+
+
+def _get_status():
+    """ The cached status, having the elapsed time updated,
+        or a fresh one if the cache is not available
+    """
+
+    with CACHE_LOCK:
+        valid = CACHE['valid']
+        st    = CACHE['status'].copy()
+        stamp = CACHE['stamp']
+
+    if not valid:
+        return _cmd('status')
+
+    # MPD does not notify the playing progress
+    if st.get('state') == 'play' and 'elapsed' in st:
+
+        elapsed = float(st['elapsed']) + time() - stamp
+        st['elapsed'] = f'{elapsed:.3f}'
+
+        if 'time' in st:
+            tot = st['time'].split(':')[-1]
+            st['time'] = f'{int(elapsed)}:{tot}'
+
+    return st
+
+
+def _get_currentsong():
+
+    with CACHE_LOCK:
+        if CACHE['valid']:
+            return CACHE['currentsong'].copy()
+
+    return _cmd('currentsong')
+
+
+def _get_playlistid():
+
+    with CACHE_LOCK:
+        if CACHE['valid']:
+            return list( CACHE['playlistid'] )
+
+    return _cmd('playlistid')
+
+
 def _get_playlist():
     """ Sometimes getting the playlist crash because a bug in mpd client
     """
     try:
-        return c.playlist()
+        # same as c.playlist()
+        return [ f'file: {x["file"]}' for x in _get_playlistid() ]
 
     except Exception as e:
         print(f'{Fmt.RED}(mpd_mod.py) mpd_cdda_in_playlist ERROR getting playlist: {str(e)}{Fmt.END}')
@@ -90,10 +277,6 @@ def mpd_cdda_in_playlist(all_or_any='any'):
 
     result = False
 
-    if not _ping_mpd():
-        print(f'{Fmt.RED}(mpd_mod.py) mpd_cdda_in_playlist not connected to MPD{Fmt.END}')
-        return result
-
     pl = _get_playlist()
 
     # example:
@@ -107,8 +290,6 @@ def mpd_cdda_in_playlist(all_or_any='any'):
     else:
         result = all( [ 'cdda:/' in x for x in pl ] )
 
-    _release_mpd()
-
     return result
 
 
@@ -121,12 +302,10 @@ def mpd_get_cd_track_nums():
 
     result = []
 
-    if not _ping_mpd():
-        print(f'{Fmt.RED}(mpd_mod.py) mpd_get_cd_track_nums not connected to MPD{Fmt.END}')
-        return result
+    pl = _get_playlist()
 
-    if mpd_cdda_in_playlist('all'):
-        result = _get_playlist()
+    if pl and all( [ 'cdda:/' in x for x in pl ] ):
+        result = pl
 
     # ['file: cdda://dev/cdrom/1',
     #  'file: cdda://dev/cdrom/2',
@@ -135,8 +314,6 @@ def mpd_get_cd_track_nums():
     result = [ x.split('/')[-1] for x in result ]
     # ['1', '2', '3' , ... ]
 
-    _release_mpd()
-
     return result
 
 
@@ -147,15 +324,10 @@ def mpd_playlist():
 
     result = []
 
-    if not _ping_mpd():
-        print(f'{Fmt.RED}(mpd_mod.py) mpd_playlist not connected to MPD{Fmt.END}')
-        return result
-
-
     try:
-        tmp = c.playlistid()
+        tmp = _get_playlistid()
 
-        if mpd_cdda_in_playlist('all'):
+        if tmp and all( [ 'cdda:/' in x['file'] for x in tmp ] ):
             print(f'{Fmt.BLUE}(mpd_mod.py) mpd_playlist is a CD playlist{Fmt.END}')
             result = [ f'{int(x["pos"]) + 1}. {x["name"]}' for x in tmp ]
 
@@ -166,8 +338,6 @@ def mpd_playlist():
     except Exception as e:
         print(f'{Fmt.RED}(mpd_mod.py) mpd_playlist {str(e)}{Fmt.END}')
 
-    _release_mpd()
-
     return result
 
 
@@ -178,15 +348,11 @@ def mpd_playlists(cmd, arg=''):
 
     result = ''
 
-    if not _ping_mpd():
-        print(f'{Fmt.RED}(mpd_mod.py) mpd_playlists: not connected to MPD{Fmt.END}')
-        return result
-
     if cmd == 'get_playlists':
 
         # Some setups could use a mount for mpdconf playlist_directory
         try:
-            result = [ x['playlist'] for x in c.listplaylists() ]
+            result = [ x['playlist'] for x in _cmd('listplaylists') ]
 
         # [52@0] {listplaylists} Failed to open /mnt/qnas/media/playlists/: No such file or directory
         except Exception as e:
@@ -196,7 +362,7 @@ def mpd_playlists(cmd, arg=''):
     elif cmd == 'load_playlist':
 
         try:
-            c.load(arg)
+            _cmd('load', arg)
             result = f'ordered loading `{arg}`'
         except Exception as e:
             result = f'{str(e)}'
@@ -205,15 +371,13 @@ def mpd_playlists(cmd, arg=''):
     elif cmd == 'clear_playlist':
 
         try:
-            c.clear()
+            _cmd('clear')
             sleep(.2)
             result = 'playlist cleared'
         except Exception as e:
             result = f'{str(e)}'
 
 
-    _release_mpd()
-
     return result
 
 
@@ -231,10 +395,6 @@ def mpd_control( cmd, arg='', port=MPD_PORT ):
     #print(f'{Fmt.MAGENTA}mpd_control{Fmt.END}')
 
 
-    if not _ping_mpd():
-        print(f'{Fmt.RED}(mpd_mod.py) mpd_control not connected to MPD{Fmt.END}')
-        return 'stop'
-
     # Do execute the command:
 
     try:
@@ -244,53 +404,53 @@ def mpd_control( cmd, arg='', port=MPD_PORT ):
                 pass
 
             case 'stop':
-                c.stop()
+                _cmd('stop')
 
             case 'pause':
-                c.pause()
+                _cmd('pause')
 
             case 'play':
-                c.play()
+                _cmd('play')
 
             case 'play_track':
-                c.play(int(arg) - 1)
+                _cmd('play', int(arg) - 1)
 
             case 'next':
-                c.next()
+                _cmd('next')
 
             case 'previous':
-                c.previous()
+                _cmd('previous')
 
             case 'rew_15min':
-                c.seekcur('-900')
+                _cmd('seekcur', '-900')
 
             case 'rew_5min':
-                c.seekcur('-300')
+                _cmd('seekcur', '-300')
 
             case 'rew':
-                c.seekcur('-30')
+                _cmd('seekcur', '-30')
 
             case 'ff':
-                c.seekcur('+30')
+                _cmd('seekcur', '+30')
 
             case 'ff_5min':
-                c.seekcur('+300')
+                _cmd('seekcur', '+300')
 
             case 'ff_15min':
-                c.seekcur('+900')
+                _cmd('seekcur', '+900')
 
             case 'random':
 
                 if arg == 'on':
-                    c.random(1)
+                    _cmd('random', 1)
 
                 elif arg == 'off':
-                    c.random(0)
+                    _cmd('random', 0)
 
                 elif arg == 'toggle':
-                    st = c.status()
+                    st = _cmd('status')
                     if 'random' in st:
-                        c.random( {'0':1, '1':0}[ st["random"] ])
+                        _cmd('random', {'0':1, '1':0}[ st["random"] ])
 
 
     except Exception as e:
@@ -306,7 +466,11 @@ def mpd_control( cmd, arg='', port=MPD_PORT ):
         result = 'stop'
 
     try:
-        st = c.status()
+        # A query is answered from the cache
+        if cmd == 'state' or (cmd == 'random' and arg in ('get', '')):
+            st = _get_status()
+        else:
+            st = _cmd('status')
 
         try:
 
@@ -326,8 +490,6 @@ def mpd_control( cmd, arg='', port=MPD_PORT ):
         print(f'{Fmt.RED}(mpd_mod.py) `status` no answer from MPD{Fmt.END}')
 
 
-    _release_mpd()
-
     return result
 
 
@@ -354,18 +516,14 @@ def mpd_meta( md=PLAYER_METATEMPLATE.copy() ):
 
     md['player'] = 'MPD'
 
-    if not _ping_mpd():
-        print(f'{Fmt.RED}(mpd_mod.py) mpd_meta not connected to MPD{Fmt.END}')
-        return  md
-
     try:
-        st = c.status()
+        st = _get_status()
     except Exception as e:
         print(f'{Fmt.RED}(mpd_mod.py) `status` no answer from MPD{Fmt.END}')
         return md
 
     try:
-        cs = c.currentsong()
+        cs = _get_currentsong()
     except Exception as e:
         print(f'{Fmt.RED}(mpd_mod.py) `currentsong` no answer from MPD{Fmt.END}')
         return md
@@ -454,7 +612,5 @@ def mpd_meta( md=PLAYER_METATEMPLATE.copy() ):
         md["title"]     = cdda_meta["tracks"][curr_cd_track]["title"]
 
 
-    _release_mpd()
-
     return md
 
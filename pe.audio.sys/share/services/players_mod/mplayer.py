@@ -16,7 +16,8 @@
 #
 # .{service}_fifo   'w'     Mplayer command input fifo,
 #                           (remember to end commands with \n)
-# .{service}_events 'r'     Mplayer info output is redirected here
+# .{service}_events 'r'     Mplayer info output is redirected here,
+#                           it is followed incrementally (see mplayer_slave.py)
 #
 
 #-----------------------------------------------------------------------
@@ -56,11 +57,46 @@ import  sys
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
-from    config import   MAINFOLDER
-from    miscel import   time_sec2hhmmss, read_last_lines, \
-                        process_is_running, read_cdda_meta_from_disk
+from    config import   CONFIG
+from    miscel import   time_sec2hhmmss, read_cdda_meta_from_disk
 import  cdda
 
+from    players_mod.mplayer_slave import MplayerSlave
+
+
+# The slave mode controllers by service
+SLAVES = {}
+
+# The metadata queries, and their answers, e.g.:
+#       ANS_AUDIO_SAMPLES='48000 Hz, 2 ch.'
+#       ANS_AUDIO_CODEC='ffac3'
+#       ANS_AUDIO_BITRATE='160 kbps'
+#       ANS_FILENAME='Radio Clasica HQ'
+#       ANS_TIME_POSITION=3840.1
+#       ANS_LENGTH=-1.24
+META_CMDS = [ 'get_audio_samples', 'get_audio_codec',
+              'get_audio_bitrate', 'get_file_name',
+              'get_time_pos',      'get_time_length' ]
+META_KEYS = [ 'ANS_AUDIO_SAMPLES', 'ANS_AUDIO_CODEC',
+              'ANS_AUDIO_BITRATE', 'ANS_FILENAME',
+              'ANS_TIME_POSITION', 'ANS_LENGTH' ]
+
+
+def slave(service):
+    """ The slave mode controller of the Mplayer of a service
+    """
+    if service not in SLAVES:
+        SLAVES[service] = MplayerSlave(service)
+    return SLAVES[service]
+
+
+def query_mplayer(cmds, keys, service, timeout=0.3):
+    """ Sends slave query commands, then waits for the answer of the
+        last key (Mplayer answers in order)
+        returns: { key: value } of the answered keys
+    """
+    return slave(service).request( cmds, keys, timeout=timeout )
+
 
 def timestring2sec(t):
     """ convert a given formatted time string "hh:mm:ss.cc" to seconds
@@ -81,24 +117,12 @@ def cdda_is_loaded():
         output:     True | False
         I/O:        .cdda_fifo (w),  .cdda_events (r)
     """
-    # Avoid writing to a FIFO if mplayer was not working for some reason
-    if not process_is_running('cdda_fifo'):
-        return False
-
     # Querying Mplayer to get the FILENAME
     # (if it results void it means no playing)
-    with open(f'{MAINFOLDER}/.cdda_fifo', 'w') as f:
-        f.write('get_file_name\n')
-    sleep(.1)
-
-    with open(f'{MAINFOLDER}/.cdda_events', 'r') as f:
-        tmp = f.read().split('\n')
+    ans = query_mplayer( ['get_file_name'], ['ANS_FILENAME'], 'cdda',
+                         timeout=0.1 )
 
-    for line in tmp[-2:]:
-        if line.startswith('ANS_FILENAME='):
-            return True
-
-    return False
+    return 'ANS_FILENAME' in ans
 
 
 def cdda_load():
@@ -142,19 +166,17 @@ def cdda_get_current_track():
     #     'pausing_keep', otherwise pause will be released.
 
     def get_disc_pos():
-        # Avoid writing to a FIFO if mplayer was not working for some reason
-        if not process_is_running('cdda_fifo'):
+        # Avoid waiting if mplayer was not working for some reason
+        if not slave('cdda').is_running():
             return 0.0
         # 'get_time_pos': elapsed secs refered to the whole loaded.
-        with open(f'{MAINFOLDER}/.cdda_fifo', 'w') as f:
-            f.write( 'pausing_keep get_time_pos\n' )
-        with open(f'{MAINFOLDER}/.cdda_events', 'r') as f:
-            tmp = f.read().split('\n')
-        for line in tmp[-15:][::-1]:
-            if line.startswith('ANS_TIME_POSITION='):
-                return float( line.replace('ANS_TIME_POSITION=', '')
-                              .strip() )
-        return 0.0
+        query_mplayer( ['pausing_keep get_time_pos'], ['ANS_TIME_POSITION'],
+                       'cdda', timeout=0.1 )
+        # (i) the last known if not answered
+        try:
+            return float( slave('cdda').cache()['ANS_TIME_POSITION'] )
+        except:
+            return 0.0
 
     def calc_track_and_pos(discPos):
         trackNum = 1
@@ -215,20 +237,19 @@ def playing_status(service=''):
 
     result = 'play'
 
-    # Avoid writing to a FIFO if mplayer was not working for some reason
-    if not process_is_running(f'{service}_fifo'):
+    # Avoid waiting if mplayer was not working for some reason
+    if not slave(service).is_running():
         return 'n/a'
 
-    with open(f'{MAINFOLDER}/.{service}_fifo', 'w') as f:
-        f.write( 'pausing_keep_force get_property pause\n' )
+    query_mplayer( ['pausing_keep_force get_property pause'], ['ANS_pause'],
+                   service, timeout=0.1 )
 
-    last_lines = read_last_lines( f'{MAINFOLDER}/.{service}_events', nlines=5)
-    # The result will be based on the last 'ANS_pause' read line
-    for line in last_lines:
-        if line == 'ANS_pause=yes':
-            result = 'pause'
-        elif line == 'ANS_pause=no':
-            result = 'play'
+    # The result will be based on the last 'ANS_pause' answer
+    ans = slave(service).cache().get('ANS_pause')
+    if ans == 'yes':
+        result = 'pause'
+    elif ans == 'no':
+        result = 'play'
 
     return result
 
@@ -236,16 +257,14 @@ def playing_status(service=''):
 def send_mplayer_cmd(cmd, service):
     """ Send Mplayer commands through by the corresponding fifo
     """
-    # Avoid writing to a FIFO if mplayer was not working for some reason
-    if not process_is_running(f'{service}_fifo'):
-        return
-
-    with open(f'{MAINFOLDER}/.{service}_fifo', 'w') as f:
-        f.write( f'{cmd}\n' )
-
     if cmd == 'stop':
-        # Mplayer needs a while to report the actual state ANS_pause=yes
-        sleep(2)
+        # Mplayer needs a while to report the actual state ANS_pause=yes,
+        # so waiting for it to answer after stopping
+        query_mplayer( ['stop', 'pausing_keep_force get_property pause'],
+                       ['ANS_pause'], service, timeout=2.0 )
+
+    else:
+        slave(service).send(cmd)
 
 
 def mplayer_playlists(cmd, arg='', service=''):
@@ -444,60 +463,35 @@ def mplayer_get_meta(md, service):
     if service == 'cdda':
         return cdda_get_meta(md)
 
-    # This is the file were Mplayer standard output has been redirected to,
-    # so we can read there any answer when required to Mplayer slave daemon:
-    mplayer_redirection_path = f'{MAINFOLDER}/.{service}_events'
-
-    # Communicates to Mplayer trough by its input fifo
-    # to get the current media filename and bitrate:
-
-    mplayer_control(cmd='get_audio_samples', service=service)   # ANS_AUDIO_SAMPLES='48000 Hz, 2 ch.'
-    mplayer_control(cmd='get_audio_codec',   service=service)   # ANS_AUDIO_CODEC='ffac3'
-    mplayer_control(cmd='get_audio_bitrate', service=service)   # ANS_AUDIO_BITRATE='160 kbps'
-    mplayer_control(cmd='get_file_name',     service=service)   # ANS_FILENAME='Radio Clasica HQ'
-    mplayer_control(cmd='get_time_pos',      service=service)   # ANS_TIME_POSITION=3840.1
-    mplayer_control(cmd='get_time_length',   service=service)   # ANS_LENGTH=-1.24
-
-    # Triyng to read Mplayer output from its redirected file
-    lines = []
-    tries = 3
-    while tries:
-        # Waiting for Mplayer ANS_xxxx to be written to the output file
-        sleep(.10)
-        try:
-            # Reading a tail of 350 bytes from the Mplayer output file
-            fsize = os.path.getsize(mplayer_redirection_path)
-            tail_len = 350
-            with open(mplayer_redirection_path, 'rb') as f:
-                f.seek(fsize - tail_len)
-                lines = f.read(tail_len).decode().split('\n')
-            break
-        except:
-            tries -= 1
-
-    # Reading metadata (will take the last valid field if found in lines)
-    #   Some sample lines:
-    #       ANS_FILENAME='Radio 3 HQ'
-    #       ANS_pause=no
-    #       ANS_TIME_POSITION=4399.8
-    #       ANS_LENGTH=-0.95
-    #       ANS_AUDIO_BITRATE='256 kbps'
-    #       ANS_AUDIO_SAMPLES='48000 Hz, 2 ch.'
-    for line in lines:
-
-        if 'ANS_AUDIO_CODEC=' in line:
-            md['codec'] = line.split('=')[-1].replace("'", "")
-
-        if 'ANS_AUDIO_SAMPLES=' in line:
-            Hz = line.split('=')[-1].replace("'", "").split('Hz')[0]
-            ch = line.split('=')[-1].replace("'", "").split('ch')[0].split()[-1]
-            md['format'] = f'{Hz}:-:{ch}'
-
-        if 'ANS_AUDIO_BITRATE=' in line:
-            md['bitrate'] = line.split('=')[-1].replace("'", "").split()[0]
-
-        if 'ANS_FILENAME=' in line:
-            md['title'] = line.split('=')[-1].replace("'", "")
+    # Metadata are served from the answers cache, while the queries for
+    # the next time are sent to Mplayer without waiting. Only waiting
+    # for answers when nothing is known yet (see META_CMDS/KEYS)
+    s   = slave(service)
+
+    if not s.is_running():
+        return md
+
+    ans = s.cache()
+
+    if 'ANS_FILENAME' in ans:
+        s.send( *META_CMDS )
+    else:
+        ans = s.request( META_CMDS, META_KEYS )
+
+    if 'ANS_AUDIO_CODEC' in ans:
+        md['codec'] = ans['ANS_AUDIO_CODEC'].replace("'", "")
+
+    if 'ANS_AUDIO_SAMPLES' in ans:
+        tmp = ans['ANS_AUDIO_SAMPLES'].replace("'", "")
+        Hz = tmp.split('Hz')[0]
+        ch = tmp.split('ch')[0].split()[-1]
+        md['format'] = f'{Hz}:-:{ch}'
+
+    if 'ANS_AUDIO_BITRATE' in ans:
+        md['bitrate'] = ans['ANS_AUDIO_BITRATE'].replace("'", "").split()[0]
+
+    if 'ANS_FILENAME' in ans:
+        md['title'] = ans['ANS_FILENAME'].replace("'", "")
 
     return md
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+
+""" A Mplayer slave mode controller for players_mod/mplayer.py
+
+    Mplayer is run by the DVB-T.py (and the deprecated istreams.py, CDDA.py)
+    plugins, reading slave commands from .{service}_fifo and printing out
+    to .{service}_events. The plugins also command Mplayer when tuning,
+    so Mplayer's stdin/stdout cannot be owned here, but the fifo and the
+    events file are managed as the ends of a pipe:
+
+    - a persistent non blocking writer to the fifo, so a command is a single
+      write(), and a missing Mplayer is detected at once (ENXIO / EPIPE)
+      instead of running pgrep.
+
+    - a reader thread following the events file (see log_follower.py) while
+      requests are waiting, the ANS_xxxx answers are parsed into a cache.
+
+    - request() correlates the answers to the query commands, so it returns
+      as soon as Mplayer answers, or on timeout.
+"""
+
+import  os
+import  sys
+import  errno
+import  select
+import  threading
+from    time    import sleep
+
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+
+from    config          import MAINFOLDER
+from    log_follower    import LogFollower
+
+
+# The reader thread poll interval when requests are waiting (seconds)
+POLL_INTERVAL   = 0.01
+# Default request timeout (seconds)
+TIMEOUT         = 0.3
+
+
+def parse_answer(line, state):
+    """ A LogFollower parser for the Mplayer slave answers, e.g.:
+            ANS_FILENAME='Radio 3 HQ'
+            ANS_pause=no
+        The state keeps the last value of each ANS_xxxx
+    """
+    if line.startswith('ANS_') and '=' in line:
+        key, value = line.split('=', 1)
+        state[key] = value.strip()
+        return key
+
+
+class MplayerSlave:
+    """ The slave mode interface to the Mplayer of a service
+    """
+
+    def __init__(self, service):
+
+        self.service    = service
+        self.fifo_path  = f'{MAINFOLDER}/.{service}_fifo'
+        self.answers    = LogFollower( f'{MAINFOLDER}/.{service}_events',
+                                       parse_answer )
+        self.fd         = None
+        self.wlock      = threading.Lock()
+
+        # Requests waiting for answers, the reader sleeps if none
+        self.waiting    = 0
+        self.active     = threading.Event()
+        self.cond       = threading.Condition()
+
+        job = threading.Thread( target=self._reader, daemon=True )
+        job.start()
+
+
+    def _reader(self):
+
+        while True:
+
+            self.active.wait()
+
+            try:
+                self.answers.poll()
+            except Exception as e:
+                print(f'(mplayer_slave) {self.service}: {str(e)}')
+
+            with self.cond:
+                self.cond.notify_all()
+
+            sleep(POLL_INTERVAL)
+
+
+    def _close(self):
+        """ (i) call it when holding wlock
+        """
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+
+    def _connect(self):
+        """ Opens the fifo writer if not already, and checks that
+            Mplayer is still reading it.
+            (i) call it when holding wlock
+        """
+        if self.fd is not None:
+            # A fifo writer gets POLLERR once the reader has gone
+            p = select.poll()
+            p.register(self.fd, select.POLLOUT)
+            for _, ev in p.poll(0):
+                if ev & (select.POLLERR | select.POLLHUP):
+                    self._close()
+
+        if self.fd is None:
+            try:
+                self.fd = os.open( self.fifo_path,
+                                   os.O_WRONLY | os.O_NONBLOCK )
+            # ENXIO: no reader, Mplayer is not running
+            except OSError:
+                return False
+
+        return True
+
+
+    def is_running(self):
+        """ Mplayer is reading its fifo
+        """
+        with self.wlock:
+            return self._connect()
+
+
+    def send(self, *cmds):
+        """ Sends slave commands to Mplayer
+            returns: False if Mplayer is not running
+        """
+        data = ''.join( f'{c}\n' for c in cmds ).encode()
+
+        with self.wlock:
+
+            # the second try when Mplayer was restarted
+            for _ in range(2):
+
+                if not self._connect():
+                    return False
+
+                try:
+                    os.write(self.fd, data)
+                    return True
+
+                except OSError as e:
+                    self._close()
+                    # the fifo is full, Mplayer is stuck
+                    if e.errno == errno.EAGAIN:
+                        print(f'(mplayer_slave) {self.service}: fifo is full')
+                        return False
+
+        return False
+
+
+    def request(self, cmds, keys, timeout=TIMEOUT):
+        """ Sends slave query commands, then waits for the answer of the
+            last key (Mplayer answers in order)
+            returns: { key: value } of the answered keys
+        """
+        seqs = { k: self.answers.seq(k) for k in keys }
+        last = keys[-1]
+
+        with self.cond:
+            self.waiting += 1
+            self.active.set()
+
+        try:
+            if self.send(*cmds):
+                with self.cond:
+                    self.cond.wait_for(
+                        lambda: self.answers.seq(last) > seqs[last],
+                        timeout )
+
+        finally:
+            with self.cond:
+                self.waiting -= 1
+                if not self.waiting:
+                    self.active.clear()
+
+        return { k: self.answers.state[k] for k in keys
+                 if self.answers.seq(k) > seqs[k] }
+
+
+    def cache(self):
+        """ The last known answers { ANS_xxxx: value }, including
+            the ones to commands sent without waiting
+        """
+        return self.answers.poll()
@@ -15,6 +15,7 @@ from    pydbus      import SessionBus
 import  logging
 import  os
 import  sys
+import  threading
 UHOME = os.path.expanduser("~")
 sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
 
@@ -56,7 +57,7 @@ def spotibus_connect():
             bus      = SessionBus()
             spotibus = bus.get( 'org.mpris.MediaPlayer2.spotify',
                                 '/org/mpris/MediaPlayer2' )
-            logging.info(f'spotibus OK')
+            logging.info('spotibus OK')
             return True
         except Exception as e:
             logging.info(f'spotibus FAILED: {e}')
@@ -65,6 +66,32 @@ def spotibus_connect():
     return False
 
 
+def spotify_on_change(callback):
+    """ Calls callback() on the MPRIS PropertiesChanged signal,
+        (i) signals are dispatched from a GLib main loop thread.
+    """
+
+    def signal_loop():
+
+        from gi.repository import GLib
+
+        while not spotibus and not spotibus_connect():
+            sleep(5)
+
+        try:
+            spotibus.PropertiesChanged.connect( lambda *args: callback() )
+            logging.info('spotibus PropertiesChanged connected')
+        except Exception as e:
+            logging.info(f'spotibus PropertiesChanged FAILED: {e}')
+            return
+
+        GLib.MainLoop().run()
+
+
+    job = threading.Thread( target=signal_loop, daemon=True )
+    job.start()
+
+
 def set_shuffle(mode):
     """ Try to use the external tool 'playerctl' to manage shuffle because
         MPRIS can only read shuffle mode, not manage it.
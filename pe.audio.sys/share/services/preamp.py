@@ -10,6 +10,8 @@
 import  sys
 from    os.path         import expanduser
 from    time            import sleep
+import  threading
+from    contextlib      import nullcontext
 import  jack
 
 UHOME = expanduser("~")
@@ -19,8 +21,10 @@ from    config          import  CONFIG
 from    miscel          import  get_remote_zita_params, \
                                 remote_zita_restart,    \
                                 get_xo_latencies
+import  brutefir_mod    as bf
 
 from    preamp_mod.core import  Preamp, Convolver
+from    preamp_mod.coalescer import Coalescer
 
 # INITIATE A PREAMP INSTANCE
 preamp = Preamp()
@@ -41,6 +45,51 @@ if CONFIG["use_compressor"]:
 # Anyway the compresor stage is baypassed at startup
 preamp.state["compressor"] = 'off'
 
+# Serializes the processing of commands coming from concurrent server workers
+LOCK = threading.Lock()
+
+# These ones do not need to wait for others in progress
+READONLY_CMDS = (   'state', 'status', 'get_state', 'get_inputs', 'get_eq',
+                    'get_target_sets', 'get_drc_sets', 'get_xo_sets',
+                    'get_bf_restart_stats' )
+
+# Relative commands to be coalesced
+COALESCED_CMDS = {  'level':    'level',
+                    'volume':   'level',
+                    'balance':  'balance',
+                    'bass':     'bass',
+                    'treble':   'treble'    }
+
+
+def apply_relative_changes(changes):
+    """ Applies the net relative changes merged by the coalescer
+        (result string)
+    """
+    result = 'done'
+
+    for cmd, value in changes.items():
+
+        value = round(value, 2)
+        if not value:
+            continue
+
+        tmp = { 'level':    preamp.set_level,
+                'balance':  preamp.set_balance,
+                'bass':     preamp.set_bass,
+                'treble':   preamp.set_treble
+              } [ cmd ] ( value, True )
+
+        if tmp != 'done':
+            result = tmp
+
+    preamp.save_state()
+
+    return result
+
+
+COALESCER = Coalescer( apply_relative_changes, LOCK,
+                       window=CONFIG["relative_cmd_window_ms"] / 1e3 )
+
 
 # Auxiliary to insert CamillaDSP (when needed for compressor)
 def camilladsp_insert(insert=True):
@@ -217,76 +266,97 @@ def do( cmd, argstring ):
         return res
 
 
+    def get_bf_restart_stats(*dummy):
+        """ Brutefir time to audio metrics after powersave wake-ups """
+        return bf.get_restart_stats()
+
+
     def print_help(*dummy):
         return open(f'{UHOME}/pe.audio.sys/doc/peaudiosys.hlp', 'r').read()
 
 
-    latencies = get_xo_latencies( convolver.xo_sets )
-
     # extract 'add' option for relative changes
     arg, add = analize_arg_add(argstring)
 
-    # COMMAND PROCESSING by parsing the command to his related function:
-    try:
-        result = {
-
-            'state':            preamp.get_state,
-            'status':           preamp.get_state,
-            'get_state':        preamp.get_state,
-            'get_inputs':       preamp.get_inputs,
-            'get_eq':           preamp.get_eq,
-            'get_target_sets':  preamp.get_target_sets,
-            'get_drc_sets':     convolver.get_drc_sets,
-            'get_xo_sets':      convolver.get_xo_sets,
-
-            'input':            select_source,
-            'source':           select_source,
-            'solo':             preamp.set_solo,
-            'mono':             set_mono,
-            'midside':          preamp.set_midside,
-            'polarity':         preamp.set_polarity,
-            'mute':             preamp.set_mute,
-            'subsonic':         preamp.set_subsonic,
-            'swap_lr':          preamp.swap_lr,
-            'lr_swap':          preamp.swap_lr,
-
-            'level':            preamp.set_level,
-            'volume':           preamp.set_level,
-            'balance':          preamp.set_balance,
-            'treble':           preamp.set_treble,
-            'bass':             preamp.set_bass,
-            'tone_defeat':      preamp.set_tone_defeat,
-            'loudness':         preamp.set_equal_loudness,
-            'eq_loudness':      preamp.set_equal_loudness,
-            'equal_loudness':   preamp.set_equal_loudness,
-            'lu_offset':        preamp.set_lu_offset,
-            'set_target':       preamp.set_target,
-
-            'set_drc':          set_drc,
-            'drc':              set_drc,
-            'set_xo':           set_xo,
-            'xo':               set_xo,
-            'add_delay':        add_delay,
-
-            'compressor':       manage_compressor,
-
-            'convolver':        preamp.switch_convolver,
-            'powersave':        preamp.powersave,
-
-            'help':             print_help
-
-            } [ cmd.lower() ] ( arg, add )
-
-        # ************************************
-        # ** KEEPING UPDATED THE STATE FILE **
-        # ************************************
-        if result:
-            preamp.save_state()
-
-    except KeyError:
-        result = f'(preamp) unknown command: \'{cmd}\''
-
-    except Exception as e:
-        result = f'(preamp) {cmd} ERROR: {str(e)}'
+    # Bursts of relative changes are merged into a net change (see Coalescer)
+    if add and cmd.lower() in COALESCED_CMDS and COALESCER.window:
+        try:
+            return COALESCER.submit( COALESCED_CMDS[ cmd.lower() ], float(arg) )
+        except ValueError:
+            pass
+
+    # Commands are processed one at a time, except the read-only ones
+    if cmd.lower() in READONLY_CMDS:
+        lock = nullcontext()
+    else:
+        lock = LOCK
+
+    with lock:
+
+        latencies = get_xo_latencies( convolver.xo_sets )
+
+        # COMMAND PROCESSING by parsing the command to his related function:
+        try:
+            result = {
+
+                'state':            preamp.get_state,
+                'status':           preamp.get_state,
+                'get_state':        preamp.get_state,
+                'get_inputs':       preamp.get_inputs,
+                'get_eq':           preamp.get_eq,
+                'get_target_sets':  preamp.get_target_sets,
+                'get_drc_sets':     convolver.get_drc_sets,
+                'get_xo_sets':      convolver.get_xo_sets,
+                'get_bf_restart_stats': get_bf_restart_stats,
+
+                'input':            select_source,
+                'source':           select_source,
+                'solo':             preamp.set_solo,
+                'mono':             set_mono,
+                'midside':          preamp.set_midside,
+                'polarity':         preamp.set_polarity,
+                'mute':             preamp.set_mute,
+                'subsonic':         preamp.set_subsonic,
+                'swap_lr':          preamp.swap_lr,
+                'lr_swap':          preamp.swap_lr,
+
+                'level':            preamp.set_level,
+                'volume':           preamp.set_level,
+                'balance':          preamp.set_balance,
+                'treble':           preamp.set_treble,
+                'bass':             preamp.set_bass,
+                'tone_defeat':      preamp.set_tone_defeat,
+                'loudness':         preamp.set_equal_loudness,
+                'eq_loudness':      preamp.set_equal_loudness,
+                'equal_loudness':   preamp.set_equal_loudness,
+                'lu_offset':        preamp.set_lu_offset,
+                'set_target':       preamp.set_target,
+
+                'set_drc':          set_drc,
+                'drc':              set_drc,
+                'set_xo':           set_xo,
+                'xo':               set_xo,
+                'add_delay':        add_delay,
+
+                'compressor':       manage_compressor,
+
+                'convolver':        preamp.switch_convolver,
+                'powersave':        preamp.powersave,
+
+                'help':             print_help
+
+                } [ cmd.lower() ] ( arg, add )
+
+            # ************************************
+            # ** KEEPING UPDATED THE STATE FILE **
+            # ************************************
+            if result:
+                preamp.save_state()
+
+        except KeyError:
+            result = f'(preamp) unknown command: \'{cmd}\''
+
+        except Exception as e:
+            result = f'(preamp) {cmd} ERROR: {str(e)}'
 
     return result
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+"""
+    Merges bursts of relative commands (e.g. 'level +1 add' from a
+    mouse wheel or IR key) into a single net change.
+
+    Usage:  coalescer.py    (checks that a burst of web taps is
+                             applied at once)
+"""
+
+import  threading
+from    time import sleep, time
+
+
+class Coalescer:
+    """ Relative commands are applied at most once per time window,
+        the ones submitted meanwhile are merged into one net change
+        per command, then applied once. A command arriving when idle
+        is applied without delay.
+
+        apply_func( {cmd: net_value, ...} ) must return the result string,
+        every submitter will receive the same result.
+
+        lock:   the lock that serializes the processing of commands
+        window: seconds
+    """
+
+    def __init__(self, apply_func, lock, window=0.05):
+        self.apply_func = apply_func
+        self.lock       = lock
+        self.window     = window
+        self.cond       = threading.Condition()
+        self.pending    = {}
+        self.batch      = None
+        self.last_apply = 0.0
+
+
+    def submit(self, cmd, value):
+
+        with self.cond:
+
+            self.pending[cmd] = self.pending.get(cmd, 0.0) + value
+
+            batch = self.batch
+
+            if batch is None:
+                batch = self.batch = {'done': False, 'result': ''}
+                leader = True
+            else:
+                leader = False
+
+        # The first command of a burst waits for the rest ones, then applies.
+        # (i) Waiting without the lock, so that other commands are not stalled,
+        #     the ones arriving until the lock is taken are also merged.
+        if leader:
+
+            wait = self.window - (time() - self.last_apply)
+            if wait > 0:
+                sleep(wait)
+
+            with self.lock:
+
+                with self.cond:
+                    changes, self.pending = self.pending, {}
+                    self.batch = None
+
+                try:
+                    result = self.apply_func(changes)
+                except Exception as e:
+                    result = f'(coalescer) ERROR: {str(e)}'
+
+                self.last_apply = time()
+
+            with self.cond:
+                batch['result'] = result
+                batch['done']   = True
+                self.cond.notify_all()
+
+        # The followers wait for the leader's result
+        else:
+
+            with self.cond:
+                while not batch['done']:
+                    self.cond.wait()
+
+        return batch['result']
+
+
+if __name__ == "__main__":
+
+    def check_web_taps(ntaps=5):
+        """ A tap, then a burst of taps in flight at once, as sent by the web
+            page through the www_server.js connections pool.
+            The burst must be applied at once, as a single net change.
+        """
+        applied = []
+
+        def apply(changes):
+            applied.append(changes)
+            sleep(0.01)
+            return 'done'
+
+        co = Coalescer( apply, threading.Lock() )
+
+        co.submit('level', 1.0)
+
+        taps = [ threading.Thread( target=co.submit, args=('level', 1.0) )
+                 for _ in range(ntaps) ]
+        for t in taps:
+            t.start()
+        for t in taps:
+            t.join()
+
+        assert applied == [ {'level': 1.0}, {'level': float(ntaps)} ], applied
+        print( f'(coalescer) a burst of {ntaps} taps was applied at once: OK' )
+
+
+    check_web_taps()
@@ -6,14 +6,17 @@
 
 import sys
 import os
-from   subprocess import Popen, check_output
 import json
 import numpy as np
-from   time import sleep
+from   time import sleep, time
 import threading
 
 import jack_mod     as jack
 import brutefir_mod as bf
+import write_behind
+import event_bus
+import signal_detector
+import proc_registry
 
 UHOME = os.path.expanduser("~")
 THISDIR = os.path.dirname( os.path.realpath(__file__) )
@@ -24,7 +27,10 @@ from config import  STATE_PATH, CONFIG, EQ_FOLDER, EQ_CURVES, TONE_MEMO_PATH, \
                     LSPK_FOLDER, LDMON_PATH, MAINFOLDER
 
 from miscel import  read_state_from_disk, read_json_from_file, get_peq_in_use, \
-                    time_sec2mmss, Fmt, calc_gain, get_xo_latencies
+                    time_sec2mmss, Fmt, calc_gain, get_xo_latencies, \
+                    process_is_running
+
+from eq_bank import TargetBank, EqCache
 
 USE_AMIXER = False
 try:
@@ -34,10 +40,48 @@ try:
 except Exception as e:
     print(f'(core.py) {str(e)}')
 
-ZEROS = np.zeros( EQ_CURVES["freqs"].shape[0] )
-
 LATENCIES = {}
 
+# The loudspeaker folder listing, shared by Convolver instances
+LSPK_FILES          = []
+LSPK_FILES_MTIME    = None
+
+# Powersave wake up to audio metrics, see get_powersave_info()
+PS_WAKE             = { 'count': 0, 'last_ms': None, 'avg_ms': 0.0,
+                        'max_ms': 0.0, 'requested': None }
+
+
+def get_powersave_info():
+    """ The powersave mode and the wake up (signal detected) to audio metrics
+        (dictionary)
+    """
+    return  {   'mode':             CONFIG["powersave_mode"],
+                'convolver':        'on' if bf.is_active() else 'off',
+                'wake_count':       PS_WAKE['count'],
+                'wake_last_ms':     PS_WAKE['last_ms'],
+                'wake_avg_ms':      PS_WAKE['avg_ms'],
+                'wake_max_ms':      PS_WAKE['max_ms']
+            }
+
+
+def _account_wake():
+    """ Accounts the elapsed time from the signal detection to resumed audio
+    """
+    if not PS_WAKE['requested']:
+        return
+
+    ms = round( (time() - PS_WAKE['requested']) * 1e3, 1 )
+    PS_WAKE['requested'] = None
+
+    n = PS_WAKE['count']
+    PS_WAKE['avg_ms']   = round( (PS_WAKE['avg_ms'] * n + ms) / (n + 1), 1 )
+    PS_WAKE['count']    = n + 1
+    PS_WAKE['last_ms']  = ms
+    PS_WAKE['max_ms']   = max(PS_WAKE['max_ms'], ms)
+
+    print(f'{Fmt.BLUE}(powersave) wake up to audio: {ms} ms{Fmt.END}')
+
+
 # Aux to manage the powersave feature (auto start/stop Brutefir process)
 def powersave_loop( convolver_off_driver, convolver_on_driver,
                     end_loop_flag, reset_elapsed_flag ):
@@ -45,6 +89,9 @@ def powersave_loop( convolver_off_driver, convolver_on_driver,
         If detected signal is below NOISE_FLOOR during MAX_WAIT then stops
         Brutefir. If signal level raises, then resumes Brutefir.
 
+        The in-process signal detector is preferred, it also allows to
+        resume Brutefir as soon as the signal appears.
+
         Events managed here:
         convolver_off_driver:   Will set when no detected signal
         convolver_on_driver:    Will set when detected signal
@@ -67,11 +114,7 @@ def powersave_loop( convolver_off_driver, convolver_on_driver,
 
 
     def loudness_monitor_is_running():
-        try:
-            check_output('pgrep -f loudness_monitor.py'.split()).decode()
-            return True
-        except:
-            return False
+        return process_is_running('loudness_monitor.py')
 
 
     # Default values:
@@ -83,10 +126,14 @@ def powersave_loop( convolver_off_driver, convolver_on_driver,
     if "powersave_minutes" in CONFIG:
         MAX_WAIT = CONFIG["powersave_minutes"] * 60
 
-    # Using a level meter, loudness_monitor.py is preferred,
-    # if not available will use level_meter.py
-    loud_mon_available = loudness_monitor_is_running()
-    if loud_mon_available:
+    # Using the signal detector, if not available loudness_monitor.py
+    # is preferred, if not available will use level_meter.py
+    detector = signal_detector.start(threshold=NOISE_FLOOR)
+    loud_mon_available = False
+    if detector:
+        print( f'(powersave) using \'signal_detector.py\'' )
+    elif loudness_monitor_is_running():
+        loud_mon_available = True
         print( f'(powersave) using \'loudness_monitor.py\'' )
     else:
         # Prepare and start a level_meter.Meter instance
@@ -106,23 +153,31 @@ def powersave_loop( convolver_off_driver, convolver_on_driver,
             reset_elapsed_flag.clear()
 
         # Reading level
-        if loud_mon_available:
-            dBFS = read_loudness_monitor()
+        if detector:
+            signal = detector.signal_age() < 1.0
         else:
-            dBFS = meter.L
+            if loud_mon_available:
+                dBFS = read_loudness_monitor()
+            else:
+                dBFS = meter.L
+            signal = dBFS > NOISE_FLOOR
+
+        bf_active = bf.is_active()
 
         # Level detected
-        if dBFS > NOISE_FLOOR:
-            if not bf.is_running():
-                print(f'(powersave) signal detected, requesting to restart Brutefir')
+        if signal:
+            if not bf_active:
+                print(f'(powersave) signal detected, requesting to resume Brutefir')
+                if not PS_WAKE['requested']:
+                    PS_WAKE['requested'] = time()
                 convolver_on_driver.set()
             lowSigElapsed = 0
         else:
             lowSigElapsed +=1
 
         # No level detected
-        if dBFS < NOISE_FLOOR and lowSigElapsed >= MAX_WAIT:
-            if bf.is_running():
+        if not signal and lowSigElapsed >= MAX_WAIT:
+            if bf_active:
                 print(f'(powersave) low level during {time_sec2mmss(MAX_WAIT, mode="__m__s")}, '
                        'requesting to stop Brutefir' )
                 convolver_off_driver.set()
@@ -131,7 +186,13 @@ def powersave_loop( convolver_off_driver, convolver_on_driver,
         if end_loop_flag.isSet():
             break
 
-        sleep(1)
+        # The detector wakes up as soon as the signal appears.
+        # (i) Once the resume was requested, the signal is already there,
+        #     so waiting for it would return at once.
+        if detector and not bf_active and not signal:
+            detector.wait_signal(timeout=1)
+        else:
+            sleep(1)
 
 
 # The Preamp: audio processor, selector, and system state keeper ===============
@@ -312,6 +373,11 @@ class Preamp(object):
 
         # The target curves available under the 'eq' folder
         self.target_sets = self._find_target_sets()
+        # and kept in memory
+        self.target_bank = TargetBank()
+        self.target_bank.load( self.target_sets )
+        # and the composed EQ curves
+        self.eq_cache = EqCache( self.target_bank )
 
         # The available span for tone curves
         self.bass_span   = int( (EQ_CURVES["bass_mag"].shape[0] - 1) / 2 )
@@ -462,7 +528,8 @@ class Preamp(object):
         result = []
 
         files = os.listdir( EQ_FOLDER )
-        tfiles = [ x for x in files if ('target_mag' in x) or ('target_pha' in x) ]
+        tfiles = [ x for x in files if ( ('target_mag' in x) or ('target_pha' in x) )
+                                       and x[-4:] == '.dat' ]
 
         for fname in tfiles:
             set_name = extract(fname)
@@ -472,11 +539,11 @@ class Preamp(object):
         return ['none'] + sorted(result)
 
 
-    def _calc_eq_curve(self, cname, candidate):
-        """ Retrieves the tone or loudness curve
+    def _calc_eq_index(self, cname, candidate):
+        """ Retrieves the tone or loudness curve index
             Tone curves depens on candidate-state bass & treble.
             Loudness compensation curve depens on the configured refSPL.
-            (mag, pha: numpy arrays)
+            (int)
         """
         # (i) Former FIRtro curves array files xxx.dat were stored in Matlab way,
         #     so when reading them with numpy.loadtxt() it was needed to transpose
@@ -513,43 +580,25 @@ class Preamp(object):
             index = max( min(index, index_max), index_min )
 
 
-        return EQ_CURVES[f'{cname}_mag'][index], \
-               EQ_CURVES[f'{cname}_pha'][index]
+        return index
 
 
     def _calc_eq(self, candidate):
         """ Calculate the eq curves to be applied in the Brutefir EQ module,
             as per the given candidate tone, loudness and target curves
-            (mag, pha: numpy arrays)
+            (mag, pha: numpy arrays, read-only)
         """
 
-        # getting loudness and tones curves
-        loud_mag, loud_pha = self._calc_eq_curve( 'loud', candidate )
-        bass_mag, bass_pha = self._calc_eq_curve( 'bass', candidate )
-        treb_mag, treb_pha = self._calc_eq_curve( 'treb', candidate )
-
-        # getting target curve
-        target_name = candidate["target"]
-        if target_name == 'none':
-            targ_mag = ZEROS
-            targ_pha = ZEROS
-        else:
-            if target_name != 'target':     # see doc string on find_target_sets()
-                target_name += '_target'
-            targ_mag = np.loadtxt( f'{EQ_FOLDER}/{target_name}_mag.dat' )
-            targ_pha = np.loadtxt( f'{EQ_FOLDER}/{target_name}_pha.dat' )
-
-        # Compose
-        eq_mag = targ_mag + loud_mag * candidate["equal_loudness"] \
-                 + bass_mag + treb_mag
-
-        if CONFIG["bfeq_linear_phase"]:
-            eq_pha = ZEROS
+        # getting loudness and tones curves indexes
+        if candidate["equal_loudness"]:
+            loud_idx = self._calc_eq_index( 'loud', candidate )
         else:
-            eq_pha = targ_pha + loud_pha * candidate["equal_loudness"] \
-                     + bass_pha + treb_pha
+            loud_idx = None
+        bass_idx = self._calc_eq_index( 'bass', candidate )
+        treb_idx = self._calc_eq_index( 'treb', candidate )
 
-        return eq_mag, eq_pha
+        # Compose with the target curve (cached)
+        return self.eq_cache.get( candidate["target"], loud_idx, bass_idx, treb_idx )
 
 
     def _print_threads(self):
@@ -598,19 +647,42 @@ class Preamp(object):
 
         if mode == 'off':
 
-            if bf.is_running():
+            # Hot standby: Brutefir keeps running, muted and not convolving
+            if CONFIG["powersave_mode"] == 'standby' and bf.is_active():
+                bf.standby()
+                print(f'{Fmt.BLUE}{Fmt.BOLD}(core) BRUTEFIR IN STANDBY{Fmt.END}')
+                result = 'done'
+
+            elif bf.is_running() and not bf.in_standby():
                 self.bf_sources = bf.get_in_connections()
                 # Allows other Brutefir, kills just our.
-                Popen(f'pkill -f  "brutefir brutefir_config"', shell=True)
+                proc_registry.kill('brutefir brutefir_config')
                 # Brutefir 1.0m process is 'brutefir.real'
-                Popen(f'pkill -f  "brutefir.real brutefir_config"', shell=True)
-                sleep(2)
+                proc_registry.kill('brutefir.real brutefir_config')
+                # Waiting for Brutefir ports and process to be gone
+                jack.wait_for( lambda: not bf.is_running() and
+                               not process_is_running('brutefir', 'brutefir_config'),
+                               timeout=2 )
                 print(f'{Fmt.BLUE}{Fmt.BOLD}(core) STOPPING BRUTEFIR (!){Fmt.END}')
                 result = 'done'
 
         elif mode == 'on':
 
-            if not bf.is_running():
+            if bf.in_standby() and bf.is_running():
+
+                # This avoids that powersave loop stops Brutefir
+                self.ps_reset_elapsed.set()
+
+                # Restores coeffs and filter outputs, then gains as usual
+                result = bf.wake_up()
+                self._validate( self.state )
+                print(f'{Fmt.BLUE}{Fmt.BOLD}(core) BRUTEFIR RESUMED{Fmt.END}')
+                _account_wake()
+
+            elif not bf.is_running():
+
+                # Brutefir has gone away, so any standby data is outdated
+                bf.STANDBY_FILTERS.clear()
 
                 # This avoids that powersave loop kills Brutefir
                 self.ps_reset_elapsed.set()
@@ -624,6 +696,7 @@ class Preamp(object):
                     c.set_xo ( self.state["xo_set"]  )
                     c.set_drc( self.state["drc_set"] )
                     del( c )
+                    _account_wake()
                 else:
                     result = f'PANIC: {result}'
 
@@ -684,15 +757,17 @@ class Preamp(object):
         # APPROVED
         if headroom >= 0:
 
+            # (i) Gains and EQ are sent to Brutefir in a single round trip
+
             if not USE_AMIXER:
-                bf.set_gains( candidate )
+                bf.set_gains_and_eq( candidate, eq_mag, eq_pha )
 
             else:
 
                 amixer_result = alsa.set_amixer_gain( candidate["level"] )
 
                 if amixer_result == 'done':
-                    bf.set_gains( candidate, nolevel=True )
+                    bf.set_gains_and_eq( candidate, eq_mag, eq_pha, nolevel=True )
 
                 else:
                     # If for some reason alsa mixer has not adjusted the wanted dB,
@@ -700,9 +775,9 @@ class Preamp(object):
                     # to be applied. Example:
                     #   "clamped, dB pending: 3.0"
                     dBpending = round( float(amixer_result.split()[-1]), 1)
-                    bf.set_gains( candidate, nolevel=True, dBextra=dBpending )
+                    bf.set_gains_and_eq( candidate, eq_mag, eq_pha,
+                                         nolevel=True, dBextra=dBpending )
 
-            bf.set_eq( eq_mag, eq_pha )
             self.state = candidate
             self.state["gain_headroom"] = round(headroom, 1)
             self.save_tone_memo()
@@ -714,16 +789,16 @@ class Preamp(object):
 
 
     def save_state(self):
+        # (i) Written in background, see write_behind.py
         self.state["convolver_runs"] = bf.is_running()
-        with open(STATE_PATH, 'w') as f:
-            f.write( json.dumps( self.state, indent=2 ) )
+        write_behind.write_file( STATE_PATH, json.dumps( self.state, indent=2 ) )
+        event_bus.publish( 'state', self.state )
 
 
     def save_tone_memo(self):
         self.tone_memo["bass"]   = self.state["bass"]
         self.tone_memo["treble"] = self.state["treble"]
-        with open(TONE_MEMO_PATH, 'w') as f:
-            f.write( json.dumps( self.tone_memo, indent=2 ) )
+        write_behind.write_file( TONE_MEMO_PATH, json.dumps( self.tone_memo, indent=2 ) )
 
 
     def get_state(self, *dummy):
@@ -1063,6 +1138,21 @@ class Preamp(object):
 
 
 # The Convolver: drc and xo Brutefir stages management =========================
+def lspk_folder_files():
+    """ The LSPK_FOLDER files list, listed again only if the folder
+        has been modified (files added, removed or renamed).
+    """
+    global LSPK_FILES, LSPK_FILES_MTIME
+
+    mtime = os.path.getmtime(LSPK_FOLDER)
+
+    if mtime != LSPK_FILES_MTIME:
+        LSPK_FILES       = os.listdir(LSPK_FOLDER)
+        LSPK_FILES_MTIME = mtime
+
+    return LSPK_FILES
+
+
 class Convolver(object):
     """ attributes:
 
@@ -1097,7 +1187,7 @@ class Convolver(object):
         #
         #       Using C allows to have dedicated FIR per channel
 
-        files   = os.listdir(LSPK_FOLDER)
+        files   = lspk_folder_files()
         coeffs  = [ x.replace('.pcm', '') for x in files ]
         self.drc_coeffs = [ x for x in coeffs if x[:4] == 'drc.'  ]
         self.xo_coeffs  = [ x for x in coeffs if x[:3] == 'xo.'   ]
@@ -1119,6 +1209,7 @@ class Convolver(object):
 
         # lspk_ways are the XO filter stages definded inside brutefir_config
         # 'f.WW.C' where WW:fr|lo|mi|hi|sw and C:L|R
+        # (i) brutefir_config is parsed once, see bf.get_config()
         self.lspk_ways = bf.get_config()['lspk_ways']
 
         # debug
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Rafael Sánchez
+# This file is part of 'pe.audio.sys'
+# 'pe.audio.sys', a PC based personal audio system.
+"""
+    An in-memory bank of the target curves under the share/eq folder.
+
+    Target curves are loaded once, from a binary .npy cache built next
+    to the .dat files when possible. A set is reloaded if its .dat files
+    have been modified.
+
+    Also an LRU cache of the composed EQ curves (target + loudness + tones)
+
+    Usage:  eq_bank.py  [target_name]
+
+            Runs a micro-benchmark about loading a target curve set
+            and composing the EQ curves.
+"""
+
+import  sys
+import  os
+import  numpy as np
+from    time import time
+from    collections import OrderedDict
+
+UHOME = os.path.expanduser("~")
+sys.path.append(f'{UHOME}/pe.audio.sys/share/miscel')
+
+from config import  EQ_FOLDER, EQ_CURVES, CONFIG
+
+
+ZEROS = np.zeros( EQ_CURVES["freqs"].shape[0] )
+
+
+def target_paths(target_name):
+    """ The mag and pha .dat files paths for a target set name
+        (see Preamp._find_target_sets)
+    """
+    if target_name != 'target':
+        target_name += '_target'
+
+    return  f'{EQ_FOLDER}/{target_name}_mag.dat', \
+            f'{EQ_FOLDER}/{target_name}_pha.dat'
+
+
+def load_curve(dat_path):
+    """ Loads a curve from its .npy cache if it is up to date,
+        otherwise from the .dat file, then refreshing the cache.
+        (numpy array)
+    """
+    npy_path = f'{dat_path[:-4]}.npy'
+
+    try:
+        if os.path.getmtime(npy_path) >= os.path.getmtime(dat_path):
+            return np.load(npy_path)
+    except:
+        pass
+
+    curve = np.loadtxt(dat_path)
+
+    try:
+        np.save(npy_path, curve)
+    except Exception as e:
+        print(f'(eq_bank) cannot save \'{npy_path}\': {str(e)}')
+
+    return curve
+
+
+class TargetBank:
+    """ Target curves kept in memory
+
+        load(names)     loads a list of target set names
+        get(name)       returns the (mag, pha) curves of a target set
+    """
+
+    def __init__(self):
+        # { name: (mtime_mag, mtime_pha, mag, pha) }
+        self.curves = {}
+
+
+    def _load(self, name):
+        mag_path, pha_path = target_paths(name)
+        self.curves[name] = (   os.path.getmtime(mag_path),
+                                os.path.getmtime(pha_path),
+                                load_curve(mag_path),
+                                load_curve(pha_path) )
+
+
+    def load(self, names):
+        for name in names:
+            if name == 'none':
+                continue
+            try:
+                self._load(name)
+            except Exception as e:
+                print(f'(eq_bank) error loading target \'{name}\': {str(e)}')
+
+
+    def get(self, name):
+        """ (mag, pha: numpy arrays)
+        """
+        mag_path, pha_path = target_paths(name)
+
+        # Invalidate if the .dat files have been modified
+        if name in self.curves:
+            mtime_mag, mtime_pha, _, _ = self.curves[name]
+            if  os.path.getmtime(mag_path) != mtime_mag or \
+                os.path.getmtime(pha_path) != mtime_pha:
+                del self.curves[name]
+
+        if not name in self.curves:
+            self._load(name)
+
+        return self.curves[name][2:]
+
+
+class EqCache:
+    """ LRU cache of the composed EQ curves to be applied in the Brutefir EQ module
+
+        get(target_name, loud_idx, bass_idx, treb_idx)
+
+            loud_idx:   the loudness curve index, or None if equal_loudness is off
+            bass_idx:   the bass curve index
+            treb_idx:   the treble curve index
+
+        (i) Returned arrays are read-only, because they are shared.
+    """
+
+    def __init__(self, target_bank, maxsize=256):
+        self.target_bank    = target_bank
+        self.maxsize        = maxsize
+        self.cache          = OrderedDict()
+
+
+    def _compose(self, targ_mag, targ_pha, loud_idx, bass_idx, treb_idx):
+
+        eq_mag = targ_mag + EQ_CURVES["bass_mag"][bass_idx] \
+                          + EQ_CURVES["treb_mag"][treb_idx]
+        if loud_idx is not None:
+            eq_mag += EQ_CURVES["loud_mag"][loud_idx]
+
+        if CONFIG["bfeq_linear_phase"]:
+            eq_pha = ZEROS.copy()
+        else:
+            eq_pha = targ_pha + EQ_CURVES["bass_pha"][bass_idx] \
+                              + EQ_CURVES["treb_pha"][treb_idx]
+            if loud_idx is not None:
+                eq_pha += EQ_CURVES["loud_pha"][loud_idx]
+
+        eq_mag.setflags(write=False)
+        eq_pha.setflags(write=False)
+
+        return eq_mag, eq_pha
+
+
+    def get(self, target_name, loud_idx, bass_idx, treb_idx):
+        """ (mag, pha: numpy arrays)
+        """
+        if target_name == 'none':
+            targ_mag, targ_pha = ZEROS, ZEROS
+            targ_mtimes = ()
+        else:
+            targ_mag, targ_pha = self.target_bank.get(target_name)
+            targ_mtimes = self.target_bank.curves[target_name][:2]
+
+        key = (target_name, targ_mtimes, loud_idx, bass_idx, treb_idx)
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        curves = self._compose(targ_mag, targ_pha, loud_idx, bass_idx, treb_idx)
+
+        self.cache[key] = curves
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+        return curves
+
+
+def benchmark(target_name, loops=100):
+    """ Compares loading a target set from the text .dat files
+        versus getting it from the bank
+    """
+    mag_path, pha_path = target_paths(target_name)
+
+    tini = time()
+    for _ in range(loops):
+        np.loadtxt(mag_path)
+        np.loadtxt(pha_path)
+    t_txt = (time() - tini) / loops
+
+    bank = TargetBank()
+    bank.load( [target_name] )
+
+    tini = time()
+    for _ in range(loops):
+        bank.get(target_name)
+    t_bank = (time() - tini) / loops
+
+    # Composing the EQ curves along a level ramp with equal loudness on
+    loud_max = EQ_CURVES["loud_mag"].shape[0] - 1
+    bass_idx = (EQ_CURVES["bass_mag"].shape[0] - 1) // 2
+    treb_idx = (EQ_CURVES["treb_mag"].shape[0] - 1) // 2
+    ramp = [ i % (loud_max + 1) for i in range(loops) ]
+
+    tini = time()
+    for loud_idx in ramp:
+        targ_mag, targ_pha = bank.get(target_name)
+        targ_mag + EQ_CURVES["loud_mag"][loud_idx] \
+                 + EQ_CURVES["bass_mag"][bass_idx] + EQ_CURVES["treb_mag"][treb_idx]
+        targ_pha + EQ_CURVES["loud_pha"][loud_idx] \
+                 + EQ_CURVES["bass_pha"][bass_idx] + EQ_CURVES["treb_pha"][treb_idx]
+    t_sum = (time() - tini) / loops
+
+    eq_cache = EqCache(bank)
+    for loud_idx in ramp:
+        eq_cache.get(target_name, loud_idx, bass_idx, treb_idx)
+
+    tini = time()
+    for loud_idx in ramp:
+        eq_cache.get(target_name, loud_idx, bass_idx, treb_idx)
+    t_cache = (time() - tini) / loops
+
+    print(f'target set \'{target_name}\', mean time per command:')
+    print(f'    np.loadtxt:  {t_txt * 1e6:10.1f} us')
+    print(f'    TargetBank:  {t_bank * 1e6:10.1f} us')
+    print('EQ composing along a level ramp, mean time per step:')
+    print(f'    summing:     {t_sum * 1e6:10.1f} us')
+    print(f'    EqCache:     {t_cache * 1e6:10.1f} us')
+
+
+if __name__ == '__main__':
+
+    if sys.argv[1:]:
+        if '-h' in sys.argv[1]:
+            print(__doc__)
+            sys.exit()
+        tname = sys.argv[1]
+
+    else:
+        tnames = [ x for x in os.listdir(EQ_FOLDER) if x.endswith('target_mag.dat') ]
+        if not tnames:
+            print(f'(eq_bank) no target curves found under {EQ_FOLDER}')
+            sys.exit()
+        tname = tnames[0][:-15] or 'target'
+
+    benchmark(tname)
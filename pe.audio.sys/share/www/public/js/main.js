@@ -7,6 +7,7 @@
 import * as mc from './miscel.js';
 
 const AUTO_UPDATE_INTERVAL = 1000;      // Auto-update interval millisec
+const EVENTS_URL = '/events';           // Pushed updates (only Node.js server side)
 
 //////// GLOBAL VARIABLES ////////
 var state               = {};
@@ -20,6 +21,9 @@ var aux_info            = { 'amp': 'n/a',
                             'warning': ''
 };
 
+var way_levels          = {};       // Brutefir outputs levels (way_meter plugin)
+var last_way_clips      = [];       // To evaluate if some way has clipped
+
 var web_config          = { 'main_selector':      'inputs',
                             'hide_LU':            false,
                             'LU_monitor_enabled': false,
@@ -59,6 +63,9 @@ var last_loudspeaker    = '';       // Will detect if audio processes has beeen
 var last_delay          = 0;        // A helper for the delay toggle button
 
 
+var push_refresh_pending = false;    // Pushed updates are refreshed at once
+
+
 var hold_selected_track = 0;        // A counter to keep the selected cd track during updates
 var main_cside_msg      = '';       // The message displayed on page header
 var hold_cside_msg      = 0;        // A counter to keep main_cside_msg during updates
@@ -380,11 +387,145 @@ async function init(){
 
     show_hide_LU_frame();
 
-    setInterval( page_update, AUTO_UPDATE_INTERVAL );
+    start_live_updates();
+
+    setInterval( hold_countdown, 1000 );
 }
 
 
-function page_update() {
+function hold_countdown(){
+    /*  The held CD track selection and main_cside message expire in
+        seconds, whatever the page updates rate is.
+    */
+    if (hold_selected_track > 0){
+        hold_selected_track -= 1;
+        if (hold_selected_track == 0) {
+            document.getElementById('track_selector').value = '--';
+        }
+    }
+
+    if (hold_cside_msg > 0){
+        hold_cside_msg -= 1;
+        if (hold_cside_msg == 0 && server_available){
+            manage_main_cside();
+        }
+    }
+}
+
+
+function start_live_updates(){
+    /*  The Node.js server side pushes state, player and aux info updates,
+        so many browsers do not need to query the server every second.
+        Otherwise (e.g. Apache+PHP) the page will poll the server.
+    */
+
+    function start_polling(){
+        console.log('Pushed updates not available, polling the server');
+        setInterval( page_update, AUTO_UPDATE_INTERVAL );
+    }
+
+    if (typeof EventSource == 'undefined'){
+        start_polling();
+        return;
+    }
+
+    let received = false;
+
+    const es = new EventSource(EVENTS_URL);
+
+    es.onmessage = (e) => {
+        received = true;
+        on_pushed_update( JSON.parse(e.data) );
+    };
+
+    // (i) The browser reconnects by itself, unless the stream is closed
+    es.onerror = () => {
+        if ( !received || es.readyState == EventSource.CLOSED ){
+            es.close();
+            start_polling();
+        }
+    };
+}
+
+
+function on_pushed_update(msg){
+
+    // The full data of a topic, or only the changes
+    function merge(obj, msg){
+        if ('full' in msg){
+            return msg.full;
+        }
+        Object.assign(obj, msg.changed);
+        for (const k of msg.removed){
+            delete obj[k];
+        }
+        return obj;
+    }
+
+    if (msg.topic == 'state'){
+        state = merge(state, msg);
+        if (state.loudspeaker){
+            server_available = true;
+            document.title = 'pe.audio.sys ' + state.loudspeaker;
+        }else{
+            server_available = false;
+        }
+
+    }else if (msg.topic == 'player'){
+        player_info = merge(player_info, msg);
+
+    }else if (msg.topic == 'aux'){
+        aux_info = merge(aux_info, msg);
+
+    // (i) frequent updates, so the page is not refreshed
+    }else if (msg.topic == 'way_levels'){
+        way_levels = merge(way_levels, msg);
+        way_levels_refresh();
+        return;
+    }
+
+    // Several topics can arrive at once
+    if (! push_refresh_pending){
+        push_refresh_pending = true;
+        setTimeout( () => {
+            push_refresh_pending = false;
+            page_update(true);
+        }, 50);
+    }
+}
+
+
+function way_levels_refresh(){
+    // Shows the peak dBFS of each Brutefir way, marking the clipped ones
+
+    const ways  = way_levels.ways;
+    const peak  = way_levels.peak;
+    const clips = way_levels.clips;
+
+    if ( !ways || !ways.length ){
+        document.getElementById("way_levels").style.display = 'none';
+        last_way_clips = [];
+        return;
+    }
+
+    let txt = '';
+    for (let i = 0; i < ways.length; i++){
+        txt += ways[i] + ': ' + peak[i].toFixed(1);
+        if ( last_way_clips.length == clips.length && clips[i] > last_way_clips[i] ){
+            txt += ' CLIP';
+        }
+        txt += '   ';
+    }
+    last_way_clips = clips.slice();
+
+    document.getElementById("way_levels_value").innerText = txt.trim();
+    document.getElementById("way_levels").style.display = 'block';
+}
+
+
+function page_update(pushed=false) {
+    /*  pushed: the data was already received from the server side
+    */
 
     function player_get(){
         try{
@@ -539,12 +680,6 @@ function page_update() {
             document.getElementById( "playlist_selector").style.display = "inline";
         }
 
-        // Clears the CD track selector when expired
-        hold_selected_track -= 1;
-        if (hold_selected_track == 0) {
-            document.getElementById('track_selector').value = '--';
-        }
-
         // Displays the [url] button if input == 'url'
         if (state.input == "url") {
             document.getElementById( "bt_url").style.display = "inline";
@@ -602,6 +737,19 @@ function page_update() {
             return
         }
 
+        // The signal detector indicator on the source selector
+        // (i) aux_info.signal is the detector measurements object
+        if ('signal' in aux_info) {
+            const sel = document.getElementById("mainSelector");
+            if (aux_info.signal && aux_info.signal.signal) {
+                sel.style.borderColor = 'limegreen';
+                sel.title = 'Source Selector (signal detected)';
+            }else{
+                sel.style.borderColor = '';
+                sel.title = 'Source Selector (no signal)';
+            }
+        }
+
         if ( aux_info.amp == 'off' || aux_info.amp == 'on' ) {
             document.getElementById("bt_onoff").innerText = aux_info.amp.toUpperCase();
             document.getElementById("bt_onoff").style.display = 'block';
@@ -830,10 +978,14 @@ function page_update() {
 
 
 
-    aux_info_get();
+    if (! pushed){
+        aux_info_get();
+    }
     aux_info_refresh();
 
-    server_available = update_state();
+    if (! pushed){
+        server_available = update_state();
+    }
 
     if (! server_available){
         document.getElementById("levelInfo").innerHTML  = '--';
@@ -850,7 +1002,11 @@ function page_update() {
 
     state_refresh();
 
-    player_get();
+    if (! pushed){
+        player_get();
+    }else if ( isEmpty(player_info) ){
+        main_cside_msg = ':: pe.audio.sys :: players OFFLINE';
+    }
     player_refresh();
 
     LU_refresh();
@@ -890,15 +1046,11 @@ function manage_main_cside(){
         main_cside_msg = aux_info.warning;
     }else if (state.convolver_runs==false){
         main_cside_msg = state.loudspeaker + ' ( sleeping )';
-    }else{
-        if (hold_cside_msg > 0){
-            hold_cside_msg -= 1;
+    }else if (hold_cside_msg == 0){
+        if (state.drc_set == 'none'){
+            main_cside_msg = state.loudspeaker;
         }else{
-            if (state.drc_set == 'none'){
-                main_cside_msg = state.loudspeaker;
-            }else{
-                main_cside_msg = state.loudspeaker + ' (' + state.drc_set + ')';
-            }
+            main_cside_msg = state.loudspeaker + ' (' + state.drc_set + ')';
         }
     }
     document.getElementById("main_cside").innerText = main_cside_msg;
@@ -1125,7 +1277,7 @@ function omd_audio_change(element, param, value) {
     else{
         return;
     }
-    mc.send_cmd( param + ' ' + value + ' ' + 'add' );
+    mc.send_cmd_async( param + ' ' + value + ' ' + 'add' );
 }
 
 
@@ -41,6 +41,19 @@ export function send_cmd( cmd ) {
 }
 
 
+export function send_cmd_async( cmd ) {
+    /*  Does not wait for the answer, e.g. for relative level taps, so that
+        a burst of taps is in flight at once and it can be coalesced at the
+        server side.
+    */
+    const url = URL_PREFIX + '?command=' + encodeURIComponent(cmd);
+
+    const myREQ = new XMLHttpRequest();
+    myREQ.open("GET", url, true);
+    myREQ.send();
+}
+
+
 // Aux function to stop the execution
 export const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
 
@@ -57,6 +57,33 @@ var last_cmd_phrase = '';
 var last_http_sent  = '';
 
 
+// Timeout (ms) waiting for a pe.audio.sys answer
+// (i) Some heavy commands (i.e. player get_all_info) takes a while > 200 ms
+const UPSTREAM_TIMEOUT = 3000;
+
+// Server-Sent Events: the topics are streamed from the pe.audio.sys
+// event bus (see share/miscel/event_bus.py) as they change.
+const EVENT_BUS_PATH = os.homedir() + '/pe.audio.sys/.event_bus';
+const BUS_RETRY      = 2000;
+
+// If the bus is not available, the period (ms) to query pe.audio.sys
+// for updates, and the queried commands per topic.
+const PUSH_INTERVAL = 1000;
+const PUSH_TOPICS   = { 'state':        'preamp state',
+                        'player':       'player get_all_info',
+                        'aux':          'aux info',
+                        'way_levels':   'aux get_way_levels' };
+
+// Browsers listening to /events, and the last data sent per topic
+var sse_clients     = [];
+var snapshots       = {};
+var push_busy       = false;
+var bus_connected   = false;
+
+// Connections for the browsers commands
+const CMD_POOL_SIZE = 4;
+
+
 // Color escape sequences for console.log usage
 // https://stackoverflow.com/questions/9781218/how-to-change-node-jss-console-font-color
 
@@ -87,6 +114,254 @@ const BgCyan = "\x1b[46m";
 const BgWhite = "\x1b[47m";
 
 
+// A persistent connection to the pe.audio.sys TCP server.
+// (i) The 'keepalive' mode of the server: commands are newline terminated,
+//     and each result comes back in order as a single line JSON string.
+function Upstream(name){
+
+    const up = {    name:       name,
+                    sock:       null,
+                    buffer:     '',
+                    queue:      []      // requests waiting for its answer, in order
+                };
+
+    function connect(){
+
+        up.sock = net.createConnection( { port:PAS_PORT, host:PAS_ADDR } );
+        up.sock.setNoDelay(true);
+        up.sock.write('keepalive\n');
+
+        up.sock.on('data', (data) => {
+
+            up.buffer += data.toString();
+
+            let i;
+            while ( (i = up.buffer.indexOf('\n')) != -1 ){
+
+                const line = up.buffer.slice(0, i);
+                up.buffer  = up.buffer.slice(i + 1);
+
+                const req = up.queue.shift();
+                if (! req){
+                    continue;
+                }
+
+                let ans = '';
+                try {
+                    ans = JSON.parse(line);
+                } catch (e) {
+                    ans = '';
+                }
+                req.done(ans);
+            }
+        });
+
+        // If the TCP server is unavailable, pending requests will get a void answer
+        up.sock.on('error', (err) => {
+            console.log( FgRed, '(node) ' + up.name + ' cannot connect to pe.audio.sys at '
+                         + PAS_ADDR + ':' + PAS_PORT, Reset );
+        });
+
+        up.sock.on('close', () => {
+            up.sock   = null;
+            up.buffer = '';
+            const pending = up.queue;
+            up.queue = [];
+            for (const req of pending){
+                req.done('');
+            }
+        });
+    }
+
+    // Sends a command phrase, the callback will receive the answer string
+    up.send = function(cmd_phrase, callback){
+
+        if (! up.sock){
+            connect();
+        }
+
+        let finished = false;
+
+        const req = {   done: (ans) => {
+                            if (finished){
+                                return;
+                            }
+                            finished = true;
+                            clearTimeout(timer);
+                            callback(ans);
+                        }
+                    };
+
+        // (i) A late answer will be discarded, but it keeps its place
+        //     in the queue, so the next answers are not mismatched.
+        const timer = setTimeout( () => {
+            console.log( FgRed, '(node) ' + up.name + ' timeout waiting for: '
+                         + cmd_phrase, Reset );
+            req.done('');
+        }, UPSTREAM_TIMEOUT);
+
+        up.queue.push(req);
+        up.sock.write( cmd_phrase.replace(/[\r\n]+/g, ' ') + '\n' );
+    }
+
+    return up;
+}
+
+
+// Commands from browsers go through a pool of connections, so that a slow
+// command does not delay the ones from other browsers, and concurrent
+// relative commands (e.g. level taps) can be coalesced by pe.audio.sys.
+// The queries for pushed updates, when polling, have their own connection.
+const CMD_UPSTREAMS = [];
+for (let i = 0; i < CMD_POOL_SIZE; i++){
+    CMD_UPSTREAMS.push( Upstream('commands' + i) );
+}
+const PUSH_UPSTREAM = Upstream('updates');
+
+
+// The least busy connection for a browser command
+function cmd_upstream(){
+    return CMD_UPSTREAMS.reduce( (a, b) => b.queue.length < a.queue.length ? b : a );
+}
+
+
+// Sends a message to a browser listening to /events
+function sse_send(httpRes, msg){
+    httpRes.write( 'data: ' + JSON.stringify(msg) + '\n\n' );
+}
+
+
+// Sends a topic data to all browsers, only the changed keys if possible
+function publish(topic, data){
+
+    const old = snapshots[topic];
+    let msg = {};
+
+    if ( old === undefined ){
+        msg = { 'topic': topic, 'full': data };
+
+    }else{
+        const changed = {};
+        const removed = [];
+        for (const k in data){
+            if ( JSON.stringify(data[k]) !== JSON.stringify(old[k]) ){
+                changed[k] = data[k];
+            }
+        }
+        for (const k in old){
+            if ( !(k in data) ){
+                removed.push(k);
+            }
+        }
+        if ( !Object.keys(changed).length && !removed.length ){
+            return;
+        }
+        msg = { 'topic': topic, 'changed': changed, 'removed': removed };
+    }
+
+    snapshots[topic] = data;
+
+    for (const httpRes of sse_clients){
+        sse_send(httpRes, msg);
+    }
+}
+
+
+// Subscribes to the event bus topics, then forwards them to the browsers
+function bus_subscribe(){
+
+    const sock = net.createConnection( EVENT_BUS_PATH );
+    let buffer = '';
+
+    sock.on('connect', () => {
+        bus_connected = true;
+        sock.write( JSON.stringify( {'subscribe': Object.keys(PUSH_TOPICS)} ) + '\n' );
+        console.log( FgBlue, '(node) subscribed to the pe.audio.sys event bus', Reset );
+    });
+
+    sock.on('data', (data) => {
+
+        buffer += data.toString();
+
+        let i;
+        while ( (i = buffer.indexOf('\n')) != -1 ){
+
+            const line = buffer.slice(0, i);
+            buffer     = buffer.slice(i + 1);
+
+            let msg = null;
+            try {
+                msg = JSON.parse(line);
+            } catch (e) {
+                continue;
+            }
+
+            // The bus sends the full data first, then only the changes
+            let data = {};
+            if ('full' in msg){
+                data = msg.full;
+            }else{
+                data = Object.assign( {}, snapshots[msg.topic], msg.changed );
+                for (const k of msg.removed){
+                    delete data[k];
+                }
+            }
+            publish(msg.topic, data);
+        }
+    });
+
+    // (i) 'close' follows, the bus can be restarted with pe.audio.sys
+    sock.on('error', (err) => {
+        if (verbose) console.log( FgRed, '(node) event bus not available: ' + err.code, Reset );
+    });
+
+    sock.on('close', () => {
+        bus_connected = false;
+        setTimeout( bus_subscribe, BUS_RETRY );
+    });
+}
+
+
+// Queries pe.audio.sys for updates, once for all browsers listening to /events,
+// only if the event bus is not available.
+function push_update(){
+
+    if ( bus_connected || !sse_clients.length || push_busy ){
+        return;
+    }
+    push_busy = true;
+
+    let pending = Object.keys(PUSH_TOPICS).length;
+
+    for (const topic in PUSH_TOPICS){
+
+        PUSH_UPSTREAM.send( PUSH_TOPICS[topic], (ans) => {
+
+            let data = null;
+            try {
+                data = JSON.parse(ans);
+            } catch (e) {
+                data = null;
+            }
+
+            if ( data && typeof data === 'object' ){
+                publish(topic, data);
+
+            // The browsers will know that the topic is not available
+            }else if ( topic in snapshots ){
+                delete snapshots[topic];
+                publish(topic, {});
+            }
+
+            pending -= 1;
+            if (pending == 0){
+                push_busy = false;
+            }
+        });
+    }
+}
+
+
 // This is the MAIN function, it is called from the httpServer
 // when some httpRequest is received.
 function onHttpReq( httpReq, httpRes ){
@@ -193,6 +468,31 @@ function onHttpReq( httpReq, httpRes ){
         http_serve_file(fpath);
     }
 
+    // Server-Sent Events: pushed updates of state, player and aux info.
+    //   First the full data of each topic are sent, then only the changes:
+    //      data: {"topic": "state", "full": {...}}
+    //      data: {"topic": "state", "changed": {...}, "removed": [...]}
+    else if (httpReq.url === '/events') {
+
+        httpRes.writeHead(200, {'Content-Type':  'text/event-stream',
+                                'Cache-Control': 'no-cache',
+                                'Connection':    'keep-alive'});
+
+        for (const topic in snapshots){
+            sse_send(httpRes, { 'topic': topic, 'full': snapshots[topic] });
+        }
+
+        sse_clients.push(httpRes);
+        if (verbose) console.log( FgBlue, '(node) /events clients: ' + sse_clients.length, Reset );
+
+        httpReq.on('close', () => {
+            sse_clients = sse_clients.filter( x => x !== httpRes );
+            if (verbose) console.log( FgBlue, '(node) /events clients: ' + sse_clients.length, Reset );
+        });
+
+        push_update();
+    }
+
     // A query for the server side (url = ....?command=....)
     else if (httpReq.url.match(/\?command=/g)){
 
@@ -209,47 +509,9 @@ function onHttpReq( httpReq, httpRes ){
                 last_cmd_phrase = cmd_phrase;
             }
 
-            // Create a socket client to the pe.audio.sys TCP server side
-            const client = net.createConnection( { port:PAS_PORT,
-                                                   host:PAS_ADDR },
-                                                   () => {
-            });
-
-            // If the TCP server is unavailable, then do nothing but ending the http stuff
-            client.on('error', function(err){
-                httpRes.end();
-                client.destroy();
-                console.log( FgRed, '(node) cannot connect to pe.audio.sys at '
-                             + PAS_ADDR + ':' + PAS_PORT, Reset );
-            });
+            // The persistent connections to the pe.audio.sys TCP server side
+            cmd_upstream().send( cmd_phrase, (ans) => {
 
-            // Will use timeout when connecting as a client to the pe.audio.sys server
-            // (i) It is a must to ending the socket if timeout happens
-            //     https://nodejs.org/api/net.html#net_socket_settimeout_timeout_callback
-            //     Some heavy commands (i.e. player get_all_info) takes a while > 200 ms
-            if (cmd_phrase.match(/^player/g)){
-                client.setTimeout(300);
-            }else{
-                client.setTimeout(100);
-            }
-            client.on('timeout', () => {
-              console.log( FgRed, '(node) sending to pe.audio.sys:', cmd_phrase, Reset);
-              console.log( FgRed, '(node) client socket timeout to pe.audio.sys at '
-                           + PAS_ADDR + ':' + PAS_PORT, Reset );
-              client.end();
-            });
-
-            // The socket client is ready to send data through by:
-            client.write( cmd_phrase + '\r\n' );
-            if (verbose){
-                console.log( FgGreen, '(node) ' + PAS_ADDR + ':' +
-                             PAS_PORT + ' TX: ' + cmd_phrase, Reset );
-            }
-
-            // The key (**) ==> the handler for socket received data
-            client.on('data', (data) => {
-
-                const ans = data.toString();
                 if (verbose){
                     if ( ans.length > 40 ){
                         console.log( FgGreen, '(node) ' + PAS_ADDR + ':' +
@@ -262,11 +524,6 @@ function onHttpReq( httpReq, httpRes ){
                     }
                 }
 
-                client.end();
-
-                // (**) Important to write and end the httpResponse
-                //      here INSIDE the client.on('data') HANDLER
-                //      because of the handler (and all JS) is asynchronous
                 httpRes.writeHead(200, {'Content-Type':'text/plain'});
                 if (ans){
                     httpRes.write(ans);
@@ -285,6 +542,11 @@ function onHttpReq( httpReq, httpRes ){
                 }
                 httpRes.end();
             });
+
+            if (verbose){
+                console.log( FgGreen, '(node) ' + PAS_ADDR + ':' +
+                             PAS_PORT + ' TX: ' + cmd_phrase, Reset );
+            }
         }
     }
 
@@ -304,5 +566,9 @@ function onHttpReq( httpReq, httpRes ){
 // a function when a 'request' event occurs.
 http.createServer( onHttpReq ).listen( NODEJS_PORT );
 
+// Pushed updates for browsers listening to /events
+bus_subscribe();
+setInterval( push_update, PUSH_INTERVAL );
+
 console.log('Node.js', process.version);
 console.log('Server running at http://localhost:' + NODEJS_PORT + '/');
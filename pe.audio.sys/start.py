@@ -182,6 +182,14 @@ def manage_server( mode='', service='peaudiosys'):
         print(f'{Fmt.RED}(start) stopping \'server.py {service}\'{Fmt.END}')
         # ***NOTICE*** the -f "srtring " MUST have an ending blank in order
         #              to avoid confusion with 'peaudiosys_ctrl'
+        # (i) SIGTERM first, so the server can flush its pending writes
+        sp.call( f'pkill -TERM -u {USER} -f "server.py {service} " \
+                   >/dev/null 2>&1', shell=True, stdout=sys.stdout,
+                                                 stderr=sys.stderr)
+        tries = 10
+        while tries and process_is_running(f'server.py {service} '):
+            sleep(.1)
+            tries -= 1
         sp.call( f'pkill -KILL -u {USER} -f "server.py {service} " \
                    >/dev/null 2>&1', shell=True, stdout=sys.stdout,
                                                  stderr=sys.stderr)
@@ -362,7 +370,8 @@ def prepare_drc_graphs():
         (void)
     """
     print(f'(start) processing drc sets to public/images/{LOUDSPEAKER} in background')
-    sp.Popen(f'python3 {MAINFOLDER}/share/miscel/drc2png.py -q', shell=True)
+    # (i) low priority, so it does not compete with the audio processes
+    sp.Popen(f'nice -n 10 python3 {MAINFOLDER}/share/miscel/drc2png.py -q', shell=True)
 
 
 def prepare_log_header():
@@ -534,10 +543,6 @@ if __name__ == "__main__":
         # - PREAMP  -->  MONITORS
         core.connect_monitors()
 
-        # If necessary will prepare DRC GRAPHS for use of the web page
-        if CONFIG["web_config"]["show_graphs"]:
-            prepare_drc_graphs()
-
         del core
         print(f'{Fmt.MAGENTA}(start) Closing the temporary \'core\' instance.{Fmt.END}')
 
@@ -552,6 +557,11 @@ if __name__ == "__main__":
         print(f'{Fmt.BOLD}(start) PANIC: \'peaudiosys\' service is down. Bye.{Fmt.END}')
         sys.exit()
 
+    # If necessary will prepare DRC GRAPHS for use of the web page,
+    # once the server is up, so it does not delay the system start.
+    if mode in ('all') and CONFIG["web_config"]["show_graphs"]:
+        prepare_drc_graphs()
+
     # OPTIONAL USER MACRO AT START
     if mode in ('all'):
         if 'run_macro' in CONFIG: